@@ -1 +1 @@
-from .api import run_api
+from .api import run_api, run_api_workers
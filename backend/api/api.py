@@ -1,19 +1,62 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from uvicorn import Config, Server
+from uvicorn import Config, Server, run
 
-from config import HOST, PORT
+from contextlib import asynccontextmanager
 
-from .oauth import discord_oauth_router
+from config import (
+    COMPRESSION_CACHE_BYTES,
+    COMPRESSION_ENABLED,
+    COMPRESSION_MIN_SIZE,
+    HOST,
+    METRICS_ENABLED,
+    PACK_ENABLED,
+    PORT,
+    WORKERS,
+)
+
+from .compression import CompressionMiddleware
+from .loop_lag import LoopLagMonitor, LoopLagStats
+from .metrics import LOOP_LAG, MetricsMiddleware, metrics_response
+from .oauth import discord_oauth_router, UserDepends
+from .profiling import ProfilingMiddleware
 from .routers import (
+    profile_router,
     ticket_router,
     user_router,
 )
+from .routers.profile import allow_profile, profiler
+from .routers.ticket import compactor, ticket_feed, trash
+
+loop_lag_monitor = LoopLagMonitor(
+    on_sample=LOOP_LAG.observe if METRICS_ENABLED else None
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await discord_oauth_router.start()
+    loop_lag_monitor.start()
+    profiler.start()
+    ticket_feed.start()
+    # Reclaim tickets deleted before last shutdown
+    await trash.reclaim_all()
+    if PACK_ENABLED:
+        compactor.start()
+    yield
+    await compactor.stop()
+    await trash.close()
+    await ticket_feed.stop()
+    profiler.stop()
+    await loop_lag_monitor.stop()
+    await discord_oauth_router.close()
+
 
 app = FastAPI(
     title="PD2 Ticket",
     description="System for student display code to TA.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -26,10 +69,24 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        cache_bytes=COMPRESSION_CACHE_BYTES
+    )
+app.add_middleware(
+    ProfilingMiddleware,
+    profiler=profiler,
+    allow=allow_profile
+)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 app.include_router(discord_oauth_router.router)
 app.include_router(ticket_router)
 app.include_router(user_router)
+app.include_router(profile_router)
 
 
 @app.get("/version", tags=["Info"])
@@ -42,6 +99,35 @@ def ping() -> str:
     return "pong"
 
 
+@app.get(
+    "/loop-lag",
+    tags=["Info"],
+    description="Get event loop lag of this worker in seconds, admin only. "
+                "Set reset to start a new recent_max window",
+)
+async def get_loop_lag(user: UserDepends, reset: bool = False) -> LoopLagStats:
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+    return loop_lag_monitor.stats(reset=reset)
+
+
+@app.get(
+    "/metrics",
+    tags=["Info"],
+    description="Get metrics of this worker in Prometheus text format",
+)
+async def get_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Metrics disabled"
+        )
+    return metrics_response()
+
+
 async def run_api():
     config = Config(
         app=app,
@@ -50,3 +136,20 @@ async def run_api():
     )
     server = Server(config=config)
     await server.serve()
+
+
+def run_api_workers():
+    """
+    Run `WORKERS` processes behind uvicorn's pre-fork supervisor, they share
+    one listening socket. Must be called outside of an event loop.
+
+    Workers share no memory. Ticket and user caches check file versions on
+    every hit, ticket, blob and user locks are file locks, and SQLite runs
+    in WAL mode, so any worker may serve any request.
+    """
+    run(
+        "api.api:app",
+        host=HOST,
+        port=PORT,
+        workers=WORKERS
+    )
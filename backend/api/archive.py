@@ -0,0 +1,163 @@
+from aiofiles import open as async_open
+
+from asyncio import create_task, get_event_loop, Queue, Task
+from collections import deque
+from datetime import datetime
+from os import makedirs, remove, replace, urandom
+from os.path import dirname
+from typing import AsyncIterator, Iterable, NamedTuple, Optional
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+
+from storage.io import IOExecutor
+
+CHUNK_SIZE = 64 * 1024
+READ_AHEAD_CHUNKS = 4
+
+
+class ArchiveEntry(NamedTuple):
+    arcname: str
+    path: str
+    timestamp: float
+    # Part of path to read, whole file if size is None
+    offset: int = 0
+    size: Optional[int] = None
+
+
+class ZipStreamBuffer:
+    """
+    Write-only file object for `ZipFile`. It has no `tell` and `seek`, so
+    `ZipFile` writes sizes into data descriptors after each entry instead of
+    seeking back to local headers.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def _read_file(entry: ArchiveEntry, queue: Queue) -> None:
+    try:
+        async with async_open(entry.path, "rb") as file:
+            if entry.size is None:
+                while chunk := await file.read(CHUNK_SIZE):
+                    await queue.put(chunk)
+            else:
+                await file.seek(entry.offset)
+                remain = entry.size
+                while remain > 0 and (chunk := await file.read(min(CHUNK_SIZE, remain))):
+                    remain -= len(chunk)
+                    await queue.put(chunk)
+        await queue.put(None)
+    except Exception as error:
+        await queue.put(error)
+
+
+async def read_ahead(
+    entries: Iterable[ArchiveEntry],
+    concurrency: int = 1,
+) -> AsyncIterator[tuple[ArchiveEntry, Queue]]:
+    """
+    Read files of entries with up to `concurrency` files in flight, yield
+    each entry in order with a queue of its chunks ending by None. Every
+    queue holds at most `READ_AHEAD_CHUNKS` chunks, so memory is bounded by
+    concurrency no matter how large files are.
+    """
+    entry_iter = iter(entries)
+    pending: deque[tuple[ArchiveEntry, Queue, Task]] = deque()
+
+    def start_next() -> None:
+        entry = next(entry_iter, None)
+        if entry is None:
+            return
+        queue = Queue(maxsize=READ_AHEAD_CHUNKS)
+        pending.append((entry, queue, create_task(_read_file(entry, queue))))
+
+    try:
+        for _ in range(max(concurrency, 1)):
+            start_next()
+        while pending:
+            entry, queue, _ = pending[0]
+            yield entry, queue
+            pending.popleft()
+            start_next()
+    finally:
+        for _, _, task in pending:
+            task.cancel()
+
+
+async def stream_zip(
+    entries: Iterable[ArchiveEntry],
+    concurrency: int = 1,
+) -> AsyncIterator[bytes]:
+    """
+    Generate a zip archive of entries piece by piece while reading files.
+    Files are read by `read_ahead`, deflate runs on default executor, zlib
+    releases GIL while compressing.
+    """
+    loop = get_event_loop()
+    buffer = ZipStreamBuffer()
+    with ZipFile(buffer, "w", ZIP_DEFLATED) as zip_file:
+        async for entry, queue in read_ahead(entries, concurrency):
+            date_time = datetime.fromtimestamp(
+                max(entry.timestamp, 315532800)  # Zip can't store before 1980
+            ).timetuple()[:6]
+            info = ZipInfo(entry.arcname, date_time=date_time)
+            info.compress_type = ZIP_DEFLATED
+            with zip_file.open(info, "w") as zip_entry:
+                while (chunk := await queue.get()) is not None:
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    await loop.run_in_executor(None, zip_entry.write, chunk)
+                    data = buffer.take()
+                    if data:
+                        yield data
+            data = buffer.take()
+            if data:
+                yield data
+    # Central directory
+    yield buffer.take()
+
+
+async def stream_zip_to_cache(
+    entries: Iterable[ArchiveEntry],
+    cache_path: str,
+    io_executor: IOExecutor,
+    concurrency: int = 1,
+) -> AsyncIterator[bytes]:
+    """
+    Same as `stream_zip`, and keep a copy of archive at cache_path once it is
+    completely sent. Copy is written to a temp file and renamed, so readers
+    never see a partial archive. If the cache directory is removed while
+    sending, e.g. ticket is deleted, the copy is dropped.
+    """
+    await io_executor.run(makedirs, dirname(cache_path), exist_ok=True)
+    temp_path = f"{cache_path}.{urandom(8).hex()}.tmp"
+    cache_file = await io_executor.run(open, temp_path, "wb")
+    try:
+        try:
+            async for data in stream_zip(entries, concurrency):
+                await io_executor.run(cache_file.write, data)
+                yield data
+        finally:
+            await io_executor.run(cache_file.close)
+        try:
+            await io_executor.run(replace, temp_path, cache_path)
+        except FileNotFoundError:
+            # Cache directory is gone
+            pass
+    finally:
+        try:
+            await io_executor.run(remove, temp_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,173 @@
+from anyio import to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from collections import OrderedDict
+from typing import Optional
+
+from storage.compression import CODECS
+
+COMPRESSIBLE_TYPES = (
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+# Bodies larger than this are compressed in a worker thread
+THREAD_COMPRESS_SIZE = 64 * 1024
+
+
+def negotiate(accept_encoding: str, encodings: Optional[list[str]] = None) -> Optional[str]:
+    """
+    Pick encoding from `encodings` (default all available) with the highest
+    q value in Accept-Encoding, None if client accepts none of them.
+    """
+    encodings = list(CODECS) if encodings is None else encodings
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0
+        weights[name] = weight
+
+    default = weights.get("*", 0)
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, default)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    if content_type is None:
+        return False
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def weak_etag(etag: str) -> str:
+    # Encoded body differs byte by byte from identity, so tag is weak
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing complete text and JSON bodies of at
+    least `minimum_size` bytes with the encoding negotiated from
+    Accept-Encoding. Streamed bodies and bodies already encoded, such as
+    stored variants, pass through.
+
+    Bodies with a strong ETag are the same bytes for as long as the tag
+    holds, so their compressed form is kept in an LRU of `cache_bytes`
+    total size and repeated views of a hot file cost no compression.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        cache_bytes: int = 32 * 1024 * 1024,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache_bytes = cache_bytes
+        self.cache: OrderedDict[tuple[str, str, str], bytes] = OrderedDict()
+        self.cached_bytes = 0
+
+    def _cache_get(self, key: tuple[str, str, str]) -> Optional[bytes]:
+        data = self.cache.get(key)
+        if data is not None:
+            self.cache.move_to_end(key)
+        return data
+
+    def _cache_put(self, key: tuple[str, str, str], data: bytes) -> None:
+        if len(data) > self.cache_bytes or key in self.cache:
+            return
+        self.cache[key] = data
+        self.cached_bytes += len(data)
+        while self.cached_bytes > self.cache_bytes:
+            _, evicted = self.cache.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+
+    async def compress(
+        self,
+        body: bytes,
+        encoding: str,
+        etag: Optional[str],
+        content_type: str,
+    ) -> bytes:
+        key = None
+        if etag is not None and not etag.startswith("W/"):
+            key = (etag, content_type, encoding)
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+        codec = CODECS[encoding]
+        if len(body) >= THREAD_COMPRESS_SIZE:
+            compressed = await to_thread.run_sync(codec.compress, body, codec.dynamic_level)
+        else:
+            compressed = codec.compress(body, codec.dynamic_level)
+
+        if key is not None:
+            self._cache_put(key, compressed)
+        return compressed
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("Accept-Encoding", ""))
+        start_message: Optional[Message] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Hold until first body part tells if body is complete
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            if message.get("more_body", False) \
+                    or start["status"] != 200 \
+                    or "content-encoding" in headers \
+                    or not is_compressible(headers.get("content-type")) \
+                    or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+
+            vary = headers.get("vary", "")
+            if "accept-encoding" not in vary.lower():
+                headers.add_vary_header("Accept-Encoding")
+            if encoding is None:
+                await send(start)
+                await send(message)
+                return
+
+            etag = headers.get("etag")
+            body = await self.compress(body, encoding, etag, headers["content-type"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            if etag is not None:
+                headers["ETag"] = weak_etag(etag)
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
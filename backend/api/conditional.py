@@ -0,0 +1,31 @@
+from fastapi import Request, Response, status
+
+from hashlib import sha256
+from typing import Iterable
+
+
+def make_etag(parts: Iterable[str]) -> str:
+    digest = sha256("\n".join(parts).encode("utf-8")).hexdigest()
+    return f"\"{digest}\""
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is None:
+        return False
+    # If-None-Match uses weak comparison
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def not_modified_response(etag: str, cache_control: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={
+            "ETag": etag,
+            "Cache-Control": cache_control,
+        }
+    )
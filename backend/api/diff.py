@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from difflib import unified_diff
+from re import findall
+from typing import Optional
+
+from schemas.ticket import FileDiff, TicketDiff
+
+# Files larger than this are compared by hash only
+MAX_DIFF_FILE_SIZE = 1024 * 1024
+# Follows a last line without newline, as in `git diff`
+NO_NEWLINE_MARKER = "\\ No newline at end of file\n"
+
+# (content hash or None if unknown, path, offset, size), size is None to read
+# the whole file, packed files are a part of their pack
+FileSource = tuple[Optional[str], str, int, Optional[int]]
+# Filename to its source
+TicketFiles = dict[str, FileSource]
+
+
+def _read(source: FileSource) -> Optional[bytes]:
+    _, path, offset, size = source
+    try:
+        with open(path, "rb") as source_file:
+            if size is None:
+                return source_file.read()
+            source_file.seek(offset)
+            return source_file.read(size)
+    except OSError:
+        return None
+
+
+def _decode(content: Optional[bytes]) -> Optional[list[str]]:
+    if content is None or len(content) > MAX_DIFF_FILE_SIZE:
+        return None
+    try:
+        text = content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    # Lines end by "\n" only, as patch tools split them
+    return findall(r"[^\n]*\n|[^\n]+", text)
+
+
+def _file_diff(
+    filename: str,
+    old: Optional[bytes],
+    new: Optional[bytes],
+    status: str,
+) -> FileDiff:
+    old_lines = [] if status == "added" else _decode(old)
+    new_lines = [] if status == "removed" else _decode(new)
+    if old_lines is None or new_lines is None:
+        return FileDiff(filename=filename, status=status)
+    diff = []
+    for line in unified_diff(
+        old_lines,
+        new_lines,
+        fromfile="/dev/null" if status == "added" else f"a/{filename}",
+        tofile="/dev/null" if status == "removed" else f"b/{filename}",
+    ):
+        # Only a last line can lack newline, keep next line apart from it
+        diff.append(line if line.endswith("\n") else line + "\n" + NO_NEWLINE_MARKER)
+    return FileDiff(filename=filename, status=status, diff="".join(diff))
+
+
+def diff_ticket_files(
+    author_id: str,
+    from_ticket_id: str,
+    to_ticket_id: str,
+    from_files: TicketFiles,
+    to_files: TicketFiles,
+) -> TicketDiff:
+    """
+    Per-file unified diff between two tickets. Files with equal blob hash
+    are skipped without being read. Blocking, run in executor.
+    """
+    result = TicketDiff(
+        author_id=author_id,
+        from_ticket_id=from_ticket_id,
+        to_ticket_id=to_ticket_id,
+    )
+    for filename in sorted(from_files.keys() | to_files.keys()):
+        if filename not in to_files:
+            result.files.append(_file_diff(
+                filename, _read(from_files[filename]), None, "removed"
+            ))
+            continue
+        if filename not in from_files:
+            result.files.append(_file_diff(
+                filename, None, _read(to_files[filename]), "added"
+            ))
+            continue
+
+        old_hash, new_hash = from_files[filename][0], to_files[filename][0]
+        if old_hash is not None and old_hash == new_hash:
+            result.unchanged.append(filename)
+            continue
+        old, new = _read(from_files[filename]), _read(to_files[filename])
+        # Tickets uploaded before blob store have no hash, compare content
+        if old_hash is None or new_hash is None:
+            if old is not None and old == new:
+                result.unchanged.append(filename)
+                continue
+        result.files.append(_file_diff(filename, old, new, "modified"))
+    return result
+
+
+class DiffCache:
+    """
+    Bounded LRU of ticket diffs keyed by (author_id, from, to). Ticket files
+    never change after upload, so entries stay valid, deleted tickets are
+    rejected before the cache is looked up.
+    """
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self.diffs: OrderedDict[tuple[str, str, str], TicketDiff] = OrderedDict()
+
+    def get(self, key: tuple[str, str, str]) -> Optional[TicketDiff]:
+        diff = self.diffs.get(key)
+        if diff is not None:
+            self.diffs.move_to_end(key)
+        return diff
+
+    def put(self, key: tuple[str, str, str], diff: TicketDiff) -> None:
+        if self.max_size <= 0:
+            return
+        self.diffs[key] = diff
+        self.diffs.move_to_end(key)
+        while len(self.diffs) > self.max_size:
+            self.diffs.popitem(last=False)
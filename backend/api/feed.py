@@ -0,0 +1,172 @@
+from orjson import dumps
+
+from asyncio import CancelledError, Event, Task, TimeoutError, create_task, sleep, wait_for
+from datetime import datetime
+from typing import AsyncIterator, Optional, Union
+
+from discord_oauth import JWTData
+from schemas.ticket import Ticket, TicketEvent
+from storage.events import EventLog
+
+READ_BATCH_SIZE = 100
+# Milliseconds SSE clients wait before reconnecting
+SSE_RETRY = 3000
+
+
+class FeedReset:
+    """
+    Yielded instead of events when client resumes from an event no longer
+    kept, client has to reload its list.
+    """
+
+
+def visible_event(
+    event: TicketEvent,
+    user: JWTData,
+    author_id: Optional[str],
+) -> Optional[TicketEvent]:
+    """
+    Event as user may see it, by the rules of reading a ticket: author,
+    admins and everyone if ticket is public. A ticket which turns private
+    is sent as deleted to those who could only see it while public.
+    """
+    if author_id is not None and event.author_id != author_id:
+        return None
+    if event.author_id == user.id or user.is_admin or event.public:
+        return event
+    if event.was_public:
+        return event.model_copy(update={"type": "deleted", "ticket": None})
+    return None
+
+
+class TicketFeed:
+    """
+    Push ticket events to subscribers.
+
+    Events are appended to an `EventLog` and subscribers read the log from
+    their last event ID, so resuming and several workers need nothing more.
+    Local publishes wake subscribers at once, events of other workers are
+    found by checking the log every `poll_interval` while anyone listens.
+    """
+
+    def __init__(
+        self,
+        event_log: EventLog,
+        poll_interval: float = 1,
+        keepalive_interval: float = 15,
+    ) -> None:
+        self.event_log = event_log
+        self.poll_interval = poll_interval
+        self.keepalive_interval = keepalive_interval
+        self.changed = Event()
+        self.last_event_id = 0
+        self.subscribers = 0
+        self.task: Optional[Task] = None
+
+    def _notify(self, event_id: int) -> None:
+        self.last_event_id = max(self.last_event_id, event_id)
+        # Replace before set, waiters hold the old event
+        changed, self.changed = self.changed, Event()
+        changed.set()
+
+    async def _poll(self) -> None:
+        while True:
+            await sleep(self.poll_interval)
+            if self.subscribers == 0:
+                continue
+            _, last_event_id = await self.event_log.bounds()
+            if last_event_id > self.last_event_id:
+                self._notify(last_event_id)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except CancelledError:
+            pass
+        self.task = None
+
+    async def publish(
+        self,
+        event_type: str,
+        ticket: Ticket,
+        was_public: bool = False,
+    ) -> None:
+        event_id = await self.event_log.append(TicketEvent(
+            type=event_type,
+            author_id=ticket.author_id,
+            ticket_id=ticket.ticket_id,
+            ticket=None if event_type == "deleted" else ticket,
+            public=ticket.public,
+            was_public=was_public,
+        ))
+        self._notify(event_id)
+
+    async def subscribe(
+        self,
+        user: JWTData,
+        last_event_id: Optional[int] = None,
+        author_id: Optional[str] = None,
+    ) -> AsyncIterator[Union[TicketEvent, FeedReset, None]]:
+        """
+        Yield events user may see after last_event_id, or from now on if it
+        is None, filtered to author_id if given. None is yielded every
+        `keepalive_interval` without events. Ends when user's token expires.
+        """
+        first_event_id, newest_event_id = await self.event_log.bounds()
+        if last_event_id is None or last_event_id > newest_event_id:
+            cursor = newest_event_id
+        elif first_event_id is not None and last_event_id < first_event_id - 1:
+            yield FeedReset()
+            cursor = newest_event_id
+        else:
+            cursor = last_event_id
+
+        self.subscribers += 1
+        try:
+            while datetime.now(user.exp.tzinfo) < user.exp:
+                # Take event before reading, a publish during read wakes us
+                changed = self.changed
+                events = await self.event_log.read_after(cursor, READ_BATCH_SIZE)
+                for event in events:
+                    cursor = event.event_id
+                    event = visible_event(event, user, author_id)
+                    if event is not None:
+                        yield event
+                if len(events) == READ_BATCH_SIZE:
+                    continue
+                try:
+                    await wait_for(changed.wait(), self.keepalive_interval)
+                except TimeoutError:
+                    yield None
+        finally:
+            self.subscribers -= 1
+
+
+def event_message(item: Union[TicketEvent, FeedReset]) -> dict:
+    if isinstance(item, FeedReset):
+        return {"type": "reset"}
+    return item.model_dump()
+
+
+async def sse_stream(
+    items: AsyncIterator[Union[TicketEvent, FeedReset, None]],
+) -> AsyncIterator[bytes]:
+    """
+    Format subscription as text/event-stream, keepalives become comments.
+    """
+    yield f"retry: {SSE_RETRY}\n\n".encode()
+    async for item in items:
+        if item is None:
+            yield b": keepalive\n\n"
+        elif isinstance(item, FeedReset):
+            yield b"event: reset\ndata: {}\n\n"
+        else:
+            yield f"id: {item.event_id}\nevent: {item.type}\ndata: ".encode() \
+                + dumps(event_message(item)) + b"\n\n"
@@ -0,0 +1,122 @@
+from anyio import open_file, to_thread
+from fastapi import status
+from fastapi.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from os import stat
+from typing import Optional
+
+
+def parse_range(range_header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into inclusive (start, end). Return None if
+    header should be ignored, which includes multiple ranges, raise
+    ValueError if range is not satisfiable.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    start_text, _, end_text = ranges.strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range, last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError
+            return (max(size - length, 0), size - 1)
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise ValueError
+    if start > end:
+        return None
+    return (start, min(end, size - 1))
+
+
+class RangeFileResponse(FileResponse):
+    """
+    `FileResponse` which answers a single byte range with 206 Partial Content.
+    Given a size, only `size` bytes from `offset` of file are sent, as if
+    they were the whole file, e.g. a file inside a pack.
+    """
+
+    def __init__(
+        self,
+        *args,
+        request_range: Optional[str] = None,
+        offset: int = 0,
+        size: Optional[int] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.request_range = request_range
+        self.offset = offset
+        self.size = size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.size is None:
+            stat_result = await to_thread.run_sync(stat, self.path)
+            size = stat_result.st_size
+            self.set_stat_headers(stat_result)
+        else:
+            # Part of a larger file, ETag is set by caller
+            size = self.size
+            self.headers["content-length"] = str(size)
+        self.headers["accept-ranges"] = "bytes"
+
+        try:
+            byte_range = None if self.request_range is None else parse_range(
+                self.request_range, size
+            )
+        except ValueError:
+            self.status_code = status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if byte_range is None and self.size is None:
+            self.stat_result = stat_result
+            await super().__call__(scope, receive, send)
+            return
+
+        if byte_range is None:
+            start, end = 0, size - 1
+        else:
+            start, end = byte_range
+            self.status_code = status.HTTP_206_PARTIAL_CONTENT
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+            self.headers["content-length"] = str(end - start + 1)
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        remain = end - start + 1
+        more_body = True
+        async with await open_file(self.path, "rb") as file:
+            await file.seek(self.offset + start)
+            while remain > 0:
+                chunk = await file.read(min(self.chunk_size, remain))
+                if not chunk:
+                    break
+                remain -= len(chunk)
+                more_body = remain > 0
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": more_body,
+                })
+        if more_body:
+            await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,81 @@
+from pydantic import BaseModel
+
+from asyncio import CancelledError, Task, create_task, get_event_loop, sleep
+from typing import Callable, Optional
+
+
+class LoopLagStats(BaseModel):
+    interval: float
+    samples: int
+    mean: float
+    max: float
+    recent_max: float
+    stalls: int
+
+
+class LoopLagMonitor:
+    """
+    Measure how late the event loop wakes a task sleeping `interval` seconds.
+    Lag is time the loop spent running other callbacks, a blocking call in a
+    handler shows up as one large sample. `stalls` counts samples over
+    `stall_threshold`, `recent_max` is the max since last `stats(reset=True)`.
+    Every sample is also passed to `on_sample` if given.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.05,
+        stall_threshold: float = 0.1,
+        on_sample: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.on_sample = on_sample
+        self.task: Optional[Task] = None
+        self.samples = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent_max = 0.0
+        self.stalls = 0
+
+    async def _run(self) -> None:
+        loop = get_event_loop()
+        while True:
+            start = loop.time()
+            await sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0)
+            self.samples += 1
+            self.total += lag
+            self.max = max(self.max, lag)
+            self.recent_max = max(self.recent_max, lag)
+            if lag >= self.stall_threshold:
+                self.stalls += 1
+            if self.on_sample is not None:
+                self.on_sample(lag)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except CancelledError:
+            pass
+        self.task = None
+
+    def stats(self, reset: bool = False) -> LoopLagStats:
+        stats = LoopLagStats(
+            interval=self.interval,
+            samples=self.samples,
+            mean=self.total / self.samples if self.samples else 0,
+            max=self.max,
+            recent_max=self.recent_max,
+            stalls=self.stalls,
+        )
+        if reset:
+            self.recent_max = 0.0
+        return stats
@@ -0,0 +1,280 @@
+from fastapi import Response
+
+from bisect import bisect_left
+from time import perf_counter
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LabelValues = tuple[str, ...]
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(f"{name}=\"{_escape(value)}\"" for name, value in zip(names, values))
+    return f"{{{pairs}}}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, description, labels)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Gauge(Metric):
+    """
+    Gauge set by code, or read from `func` at scrape time if given.
+    """
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Iterable[str] = (),
+        func: Optional[Callable[[], float]] = None,
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.values: dict[LabelValues, float] = {}
+        self.func = func
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values: str) -> None:
+        self.values[label_values] = value
+
+    def samples(self) -> Iterable[str]:
+        if self.func is not None:
+            yield f"{self.name} {self.func()}"
+            return
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram(Metric):
+    """
+    Histogram with fixed buckets. Observing is one bisect and two adds,
+    buckets are only made cumulative when rendered.
+    """
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count], sum
+        self.values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        data = self.values.get(label_values)
+        if data is None:
+            data = ([0] * (len(self.buckets) + 1), [0.0])
+            self.values[label_values] = data
+        counts, total = data
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> Iterable[str]:
+        names = (*self.labels, "le")
+        for label_values, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*map(str, self.buckets), "+Inf"), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, (*label_values, bound))} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {total[0]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION: Histogram = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to last response byte.",
+    labels=("method", "route", "status"),
+))
+REQUESTS_IN_FLIGHT: Gauge = registry.register(Gauge(
+    "http_requests_in_flight",
+    "Requests being processed.",
+))
+REQUEST_BYTES: Counter = registry.register(Counter(
+    "http_request_bytes_total",
+    "Request body bytes received.",
+    labels=("route",),
+))
+RESPONSE_BYTES: Counter = registry.register(Counter(
+    "http_response_bytes_total",
+    "Response body bytes sent, files sent by nginx are not included.",
+    labels=("route",),
+))
+UPLOAD_DURATION: Histogram = registry.register(Histogram(
+    "ticket_upload_duration_seconds",
+    "Time to receive and store an uploaded ticket.",
+))
+ARCHIVE_DURATION: Histogram = registry.register(Histogram(
+    "ticket_archive_duration_seconds",
+    "Time to generate and send a zip archive.",
+    labels=("kind",),
+))
+DISCORD_DURATION: Histogram = registry.register(Histogram(
+    "discord_request_duration_seconds",
+    "Latency of requests to Discord API.",
+    labels=("endpoint", "status"),
+))
+DISCORD_ERRORS: Counter = registry.register(Counter(
+    "discord_errors_total",
+    "Failed requests to Discord API, by reason.",
+    labels=("endpoint", "reason"),
+))
+LOOP_LAG: Histogram = registry.register(Histogram(
+    "event_loop_lag_seconds",
+    "Delay of event loop wake-ups.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+))
+
+
+def observe_discord(endpoint: str, outcome: str, seconds: Optional[float]) -> None:
+    """
+    Observer for `DiscordOAuthRouter`. Outcome is the status code, or
+    "connection" if request failed without response, or "queue_full" if it
+    was rejected by rate limiter before sending, seconds is None then.
+    """
+    if seconds is not None:
+        DISCORD_DURATION.observe(seconds, endpoint, outcome)
+    if not outcome.startswith("2"):
+        DISCORD_ERRORS.inc(endpoint, outcome)
+
+
+async def timed_stream(
+    iterator: AsyncIterator[bytes],
+    histogram: Histogram,
+    *label_values: str,
+) -> AsyncIterator[bytes]:
+    """
+    Pass through a stream and observe the time until it ends.
+    """
+    start = perf_counter()
+    try:
+        async for data in iterator:
+            yield data
+    finally:
+        histogram.observe(perf_counter() - start, *label_values)
+
+
+def metrics_response() -> Response:
+    return Response(
+        content=registry.render(),
+        headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+    )
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, in-flight requests and body
+    bytes per route. Route is the path template of the matched route, so
+    label count stays bounded, unmatched paths share one label.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status_code = 500
+        request_bytes = 0
+        response_bytes = 0
+
+        async def receive_wrapper() -> Message:
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            REQUEST_DURATION.observe(
+                perf_counter() - start,
+                scope["method"],
+                route_path,
+                str(status_code),
+            )
+            if request_bytes:
+                REQUEST_BYTES.inc(route_path, amount=request_bytes)
+            if response_bytes:
+                RESPONSE_BYTES.inc(route_path, amount=response_bytes)
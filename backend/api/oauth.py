@@ -4,19 +4,42 @@ from typing import Annotated
 
 from config import (
     ADMINS,
+    DISCORD_API,
+    DISCORD_CONNECTION_LIMIT,
+    DISCORD_MAX_QUEUE_WAIT,
+    DISCORD_RATE_LIMIT,
+    DISCORD_RATE_LIMIT_BURST,
+    DISCORD_TIMEOUT,
     REDIRECT_URI,
     CLIENT_ID,
     CLIENT_SECRET,
     KEY,
+    TOKEN_CACHE_SIZE,
+    TOKEN_CACHE_TTL,
+    USER_CACHE_SIZE,
+    WORKERS,
 )
 from discord_oauth import DiscordOAuthRouter, JWTData
 
+from .metrics import observe_discord
+
 discord_oauth_router = DiscordOAuthRouter(
     redirect_uri=REDIRECT_URI,
     client_id=CLIENT_ID,
     client_secret=CLIENT_SECRET,
     key=KEY,
-    admins=ADMINS
+    admins=ADMINS,
+    token_cache_size=TOKEN_CACHE_SIZE,
+    token_cache_ttl=TOKEN_CACHE_TTL,
+    user_cache_size=USER_CACHE_SIZE,
+    api_base=DISCORD_API,
+    connection_limit=DISCORD_CONNECTION_LIMIT,
+    timeout=DISCORD_TIMEOUT,
+    # Discord limits the whole application, share budget between workers
+    rate_limit=DISCORD_RATE_LIMIT / WORKERS,
+    rate_limit_burst=max(DISCORD_RATE_LIMIT_BURST // WORKERS, 1),
+    max_queue_wait=DISCORD_MAX_QUEUE_WAIT,
+    observer=observe_discord,
 )
 
 user_depends = Depends(discord_oauth_router.valid_token)
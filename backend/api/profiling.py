@@ -0,0 +1,347 @@
+from asyncio import AbstractEventLoop, Task, all_tasks, current_task, get_running_loop
+from collections import Counter
+from contextvars import ContextVar
+from os import listdir, makedirs, remove, urandom
+from os.path import basename, getmtime, isdir, isfile, join
+from sys import _current_frames
+from threading import Event, Lock, Thread, enumerate as enumerate_threads, get_ident
+from time import time
+from types import FrameType
+from typing import Any, Awaitable, Callable, Optional
+from weakref import WeakKeyDictionary
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from storage.atomic import write_file
+from storage.io import IOExecutor
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY = "_profile"
+MAX_STACK_DEPTH = 128
+
+
+class ProfileSession:
+    def __init__(self, profile_id: str) -> None:
+        self.profile_id = profile_id
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+
+
+# Session of the request being handled, read when a task is created so
+# child tasks are sampled with their request
+current_session: ContextVar[Optional[ProfileSession]] = ContextVar(
+    "current_session", default=None
+)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{basename(code.co_filename)}:{code.co_name}"
+
+
+def _frame_stack(frame: Optional[FrameType]) -> list[str]:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def _await_stack(task: Task) -> list[str]:
+    # Follow awaits from the task's coroutine down to where it is suspended
+    names = []
+    awaitable: Any = task.get_coro()
+    while awaitable is not None and len(names) < MAX_STACK_DEPTH:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None) \
+            or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        names.append(_frame_name(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None) \
+            or getattr(awaitable, "gi_yieldfrom", None)
+    return names
+
+
+class Profiler:
+    """
+    Sampling profiler running in its own thread, it never touches the
+    event loop, so sampling costs the loop nothing but the GIL switches.
+
+    Request sessions: while any is active, the loop thread is sampled every
+    `request_interval`. A sample is added to the session of the running
+    task, tasks of a session which are suspended add their await chain
+    under a `(waiting)` root, so time spent in I/O shows up too.
+
+    Global mode: if `global_interval` > 0, every thread is sampled at that
+    rate and stacks are aggregated under the thread name until reset.
+
+    Stacks are kept in folded format, `root;caller;callee count` per line,
+    which flamegraph.pl and speedscope read directly. Saved profiles are
+    written, listed and read on `io_executor`, off the event loop.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        request_interval: float = 0.005,
+        global_interval: float = 0,
+        max_profiles: int = 100,
+        io_executor: Optional[IOExecutor] = None,
+    ) -> None:
+        self.directory = directory
+        self.io = io_executor or IOExecutor(max_workers=1)
+        self.request_interval = request_interval
+        self.global_interval = global_interval
+        self.max_profiles = max_profiles
+
+        self.sessions: set[ProfileSession] = set()
+        self.global_stacks: Counter[str] = Counter()
+        self.global_samples = 0
+        self.global_since = time()
+        self.lock = Lock()
+
+        # Tasks working for a session, written on loop thread only
+        self.task_sessions: WeakKeyDictionary[Task, ProfileSession] = WeakKeyDictionary()
+        self.loop: Optional[AbstractEventLoop] = None
+        self.loop_thread_id = 0
+        self.previous_factory: Optional[Callable] = None
+        self.thread: Optional[Thread] = None
+        self.stopped = Event()
+        self.wake = Event()
+
+    def start(self) -> None:
+        """
+        Call from event loop thread.
+        """
+        self.loop = get_running_loop()
+        self.loop_thread_id = get_ident()
+        self._install_task_factory()
+        if not isdir(self.directory):
+            makedirs(self.directory, exist_ok=True)
+        self.stopped.clear()
+        self.thread = Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def _install_task_factory(self) -> None:
+        previous_factory = self.loop.get_task_factory()
+
+        def task_factory(loop: AbstractEventLoop, coro: Any, **kwargs: Any) -> Task:
+            if previous_factory is None:
+                task = Task(coro, loop=loop, **kwargs)
+            else:
+                task = previous_factory(loop, coro, **kwargs)
+            session = current_session.get()
+            if session is not None:
+                self.task_sessions[task] = session
+            return task
+
+        self.previous_factory = previous_factory
+        self.loop.set_task_factory(task_factory)
+
+    def _task_session(self, task: Task) -> Optional[ProfileSession]:
+        try:
+            return self.task_sessions.get(task)
+        except RuntimeError:
+            # Changed by loop thread while reading
+            return None
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.wake.set()
+        if self.loop is not None:
+            self.loop.set_task_factory(self.previous_factory)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self) -> None:
+        next_global = time()
+        while not self.stopped.is_set():
+            with self.lock:
+                sessions = list(self.sessions)
+            now = time()
+            if sessions:
+                self._sample_sessions(sessions)
+            if self.global_interval > 0 and now >= next_global:
+                self._sample_global()
+                next_global = now + self.global_interval
+
+            if sessions:
+                timeout = self.request_interval
+            elif self.global_interval > 0:
+                timeout = max(next_global - time(), 0)
+            else:
+                # Nothing to do until a session starts
+                timeout = None
+            self.wake.wait(timeout)
+            self.wake.clear()
+
+    def _sample_sessions(self, sessions: list[ProfileSession]) -> None:
+        frame = _current_frames().get(self.loop_thread_id)
+        try:
+            # Reads the loop's running task, safe from another thread
+            running = current_task(self.loop)
+        except Exception:
+            running = None
+        running_session = None if running is None else self._task_session(running)
+        if running_session in sessions and frame is not None:
+            running_session.stacks[";".join(_frame_stack(frame))] += 1
+
+        try:
+            tasks = list(all_tasks(self.loop))
+        except RuntimeError:
+            # Task set changed while copying, skip waiting stacks this time
+            tasks = []
+        for task in tasks:
+            if task is running or task.done():
+                continue
+            session = self._task_session(task)
+            if session in sessions:
+                stack = _await_stack(task)
+                if stack:
+                    session.stacks[";".join(["(waiting)", *stack])] += 1
+        for session in sessions:
+            session.samples += 1
+
+    def _sample_global(self) -> None:
+        thread_names = {thread.ident: thread.name for thread in enumerate_threads()}
+        frames = _current_frames()
+        with self.lock:
+            for thread_id, frame in frames.items():
+                if thread_id == get_ident():
+                    continue
+                name = thread_names.get(thread_id, str(thread_id))
+                self.global_stacks[";".join([name, *_frame_stack(frame)])] += 1
+            self.global_samples += 1
+
+    def begin(self, profile_id: str) -> ProfileSession:
+        session = ProfileSession(profile_id)
+        with self.lock:
+            self.sessions.add(session)
+        self.wake.set()
+        return session
+
+    def end(self, session: ProfileSession) -> None:
+        with self.lock:
+            self.sessions.discard(session)
+
+    @staticmethod
+    def folded(stacks: Counter) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def global_profile(self, reset: bool = False) -> str:
+        with self.lock:
+            content = self.folded(self.global_stacks)
+            if reset:
+                self.global_stacks.clear()
+                self.global_samples = 0
+                self.global_since = time()
+        return content
+
+    def profile_path(self, profile_id: str) -> str:
+        return join(self.directory, f"{profile_id}.folded")
+
+    def _list_profiles(self) -> list[str]:
+        names = []
+        for name in listdir(self.directory):
+            if not name.endswith(".folded"):
+                continue
+            try:
+                names.append((getmtime(join(self.directory, name)), name))
+            except FileNotFoundError:
+                # Pruned meanwhile
+                continue
+        names.sort(reverse=True)
+        return [name.removesuffix(".folded") for _, name in names]
+
+    def _prune(self) -> None:
+        # Keep newest profiles only
+        for profile_id in self._list_profiles()[self.max_profiles:]:
+            try:
+                remove(self.profile_path(profile_id))
+            except FileNotFoundError:
+                pass
+
+    def _read(self, profile_id: str) -> Optional[str]:
+        path = self.profile_path(profile_id)
+        if not isfile(path):
+            return None
+        with open(path, "r", encoding="utf-8") as profile_file:
+            return profile_file.read()
+
+    async def list_profiles(self) -> list[str]:
+        """
+        IDs of saved profiles, newest first.
+        """
+        return await self.io.run(self._list_profiles)
+
+    async def read(self, profile_id: str) -> Optional[str]:
+        """
+        Folded stacks of a saved profile, None if it is not found.
+        """
+        if profile_id not in await self.list_profiles():
+            return None
+        try:
+            return await self.io.run(self._read, profile_id)
+        except FileNotFoundError:
+            return None
+
+    async def save(self, session: ProfileSession) -> None:
+        await write_file(
+            self.profile_path(session.profile_id),
+            self.folded(session.stacks).encode("utf-8"),
+            io_executor=self.io
+        )
+        await self.io.run(self._prune)
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request if it has `X-Profile` header or `_profile` query set
+    and `allow` accepts its headers. The response gets `X-Profile-Id`, the
+    profile is saved when the response is complete.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        profiler: Profiler,
+        allow: Callable[[Headers], Awaitable[bool]],
+    ) -> None:
+        self.app = app
+        self.profiler = profiler
+        self.allow = allow
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.profiler.thread is None:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        requested = PROFILE_HEADER in headers or \
+            PROFILE_QUERY in QueryParams(scope.get("query_string", b""))
+        if not requested or not await self.allow(headers):
+            await self.app(scope, receive, send)
+            return
+
+        route = scope["path"].strip("/").replace("/", "_")[:64] or "root"
+        profile_id = f"{int(time() * 1000)}-{scope['method']}-{route}-{urandom(4).hex()}"
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-id", profile_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        session = self.profiler.begin(profile_id)
+        self.profiler.task_sessions[current_task()] = session
+        token = current_session.set(session)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_session.reset(token)
+            self.profiler.end(session)
+            await self.profiler.save(session)
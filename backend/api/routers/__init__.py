@@ -1,2 +1,3 @@
+from .profile import router as profile_router
 from .ticket import router as ticket_router
 from .user import router as user_router
@@ -0,0 +1,91 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.datastructures import Headers
+
+from config import ADMINS, PROFILE_GLOBAL_INTERVAL, PROFILE_REQUEST_INTERVAL
+
+from ..oauth import discord_oauth_router, UserDepends
+from ..profiling import Profiler
+
+PROFILE_DIRECTORY = "data/profiles"
+
+router = APIRouter(
+    prefix="/profile",
+    tags=["Profile"],
+)
+
+profiler = Profiler(
+    directory=PROFILE_DIRECTORY,
+    request_interval=PROFILE_REQUEST_INTERVAL,
+    global_interval=PROFILE_GLOBAL_INTERVAL,
+)
+
+
+async def allow_profile(headers: Headers) -> bool:
+    """
+    Only admins listed in config may profile a request.
+    """
+    scheme, _, credentials = headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+    try:
+        jwt_data = await discord_oauth_router.valid_token(
+            HTTPAuthorizationCredentials(scheme=scheme, credentials=credentials)
+        )
+    except HTTPException:
+        return False
+    return jwt_data.id in ADMINS
+
+
+def check_admin(user: UserDepends) -> None:
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+
+
+@router.get(
+    path="",
+    status_code=status.HTTP_200_OK,
+    description="List IDs of saved request profiles of this worker, newest first, admin only",
+)
+async def get_profile_list(user: UserDepends) -> list[str]:
+    check_admin(user)
+    return await profiler.list_profiles()
+
+
+@router.get(
+    path="/global",
+    status_code=status.HTTP_200_OK,
+    response_class=PlainTextResponse,
+    description="Get stacks sampled by global profiling of this worker in folded format, "
+                "admin only. Set reset to start over",
+)
+async def get_global_profile(user: UserDepends, reset: bool = False) -> str:
+    check_admin(user)
+    if profiler.global_interval <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Global profiling disabled"
+        )
+    return profiler.global_profile(reset=reset)
+
+
+@router.get(
+    path="/{profile_id}",
+    status_code=status.HTTP_200_OK,
+    response_class=PlainTextResponse,
+    description="Get a saved request profile in folded format, admin only. "
+                "Profile a request by sending it with X-Profile header or _profile query",
+)
+async def get_profile(user: UserDepends, profile_id: str) -> str:
+    check_admin(user)
+    content = await profiler.read(profile_id)
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return content
@@ -1,22 +1,68 @@
-from aiofiles import open as async_open
-from fastapi import APIRouter, Form, HTTPException, Response, status, UploadFile
-from fastapi.responses import StreamingResponse
-from orjson import dumps, loads, OPT_INDENT_2
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status, WebSocket
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.websockets import WebSocketDisconnect
 
-from asyncio import create_task, gather, get_event_loop
+from asyncio import create_task, gather, wait_for
 from datetime import datetime
 from hashlib import sha1
-from io import BytesIO
-from os import listdir, makedirs, remove, urandom
-from os.path import isdir, isfile, join, split
-from pathlib import Path
-from shutil import make_archive, rmtree
-from typing import Union, Literal
-
-from config import KEY
-from schemas.ticket import Ticket, TicketUpdate
-
-from ..oauth import UserDepends
+from os import makedirs, stat, urandom
+from os.path import basename, isdir, isfile, join
+from shutil import rmtree
+from time import perf_counter
+from typing import Literal, Optional, Union
+
+from config import (
+    ACCEL_REDIRECT_PREFIX,
+    COMPRESSION_ENABLED,
+    COMPRESSION_MIN_SIZE,
+    DIFF_CACHE_SIZE,
+    EVENT_POLL_INTERVAL,
+    EVENT_RETENTION,
+    EVENT_SQLITE_PATH,
+    IO_WORKERS,
+    KEY,
+    PACK_AFTER_DAYS,
+    PACK_INTERVAL,
+    SEARCH_SQLITE_PATH,
+    SIMILARITY_SQLITE_PATH,
+    TICKET_CACHE_SIZE,
+    TICKET_SQLITE_PATH,
+    TICKET_STORAGE,
+)
+from discord_oauth import JWTData
+from schemas.ticket import Ticket, TicketDiff, TicketPage, TicketUpdate
+from storage import (
+    BlobStore,
+    Compactor,
+    EventLog,
+    FileSystemTicketStorage,
+    IOExecutor,
+    PackEntry,
+    PackStore,
+    read_entry,
+    SearchIndex,
+    SearchResult,
+    SimilarityIndex,
+    SimilarityResult,
+    SQLiteTicketStorage,
+    TicketIndexStats,
+    TicketStorage,
+    Trash,
+    ticket_documents,
+    VariantWriter,
+)
+from storage.atomic import read_file_sync
+
+from ..archive import ArchiveEntry, stream_zip, stream_zip_to_cache
+from ..compression import negotiate, weak_etag
+from ..conditional import is_not_modified, make_etag, not_modified_response
+from ..diff import DiffCache, diff_ticket_files, FileSource
+from ..feed import event_message, sse_stream, TicketFeed
+from ..file_response import RangeFileResponse
+from ..metrics import ARCHIVE_DURATION, UPLOAD_DURATION, timed_stream
+from ..oauth import discord_oauth_router, UserDepends
+from ..upload import StreamingUpload, UploadedFile
 
 router = APIRouter(
     prefix="/ticket",
@@ -26,6 +72,71 @@ router = APIRouter(
 TICKET_DIRECTORY = "data/tickets"
 if not isdir(TICKET_DIRECTORY):
     makedirs(TICKET_DIRECTORY)
+BLOB_DIRECTORY = "data/blobs"
+TICKET_LOCK_DIRECTORY = "data/locks/tickets"
+TRASH_DIRECTORY = "data/trash"
+ARCHIVE_DIRECTORY = "data/archives"
+PACK_DIRECTORY = "data/packs"
+PACK_LOCK_DIRECTORY = "data/locks/packs"
+MAX_TICKET_SIZE = 16 * 1024 * 1024  # 16MB
+CACHE_CONTROL = "max-age=600"
+TEXT_CONTENT_TYPE = "text/plain; charset=utf-8"
+BINARY_CONTENT_TYPE = "application/octet-stream"
+# Max number of files read at the same time while generating a zip
+ARCHIVE_READ_CONCURRENCY = 8
+TRUE_VALUES = ("1", "on", "t", "true", "y", "yes")
+MAX_SEARCH_HITS = 1000
+MAX_SIMILAR_RESULTS = 100
+# Seconds a feed socket has to send its token
+FEED_AUTH_TIMEOUT = 10
+
+# All filesystem calls of ticket routes run here, off the event loop
+io_executor = IOExecutor(max_workers=IO_WORKERS)
+ticket_storage: TicketStorage = SQLiteTicketStorage(
+    path=TICKET_SQLITE_PATH,
+    lock_directory=TICKET_LOCK_DIRECTORY
+) if TICKET_STORAGE == "sqlite" else FileSystemTicketStorage(
+    directory=TICKET_DIRECTORY,
+    cache_size=TICKET_CACHE_SIZE,
+    lock_directory=TICKET_LOCK_DIRECTORY,
+    io_executor=io_executor,
+    packed_storage=SQLiteTicketStorage(path=join(PACK_DIRECTORY, "tickets.sqlite"))
+)
+blob_store = BlobStore(directory=BLOB_DIRECTORY)
+# Text is compressed once on upload, views send stored variants as is
+variant_writer = VariantWriter(
+    blob_store=blob_store,
+    io_executor=io_executor,
+    enabled=COMPRESSION_ENABLED,
+    min_size=COMPRESSION_MIN_SIZE
+)
+pack_store = PackStore(
+    directory=PACK_DIRECTORY,
+    lock_directory=PACK_LOCK_DIRECTORY,
+    io_executor=io_executor
+)
+compactor = Compactor(
+    ticket_storage=ticket_storage,
+    pack_store=pack_store,
+    blob_store=blob_store,
+    ticket_directory=TICKET_DIRECTORY,
+    io_executor=io_executor,
+    age=PACK_AFTER_DAYS * 86400,
+    interval=PACK_INTERVAL,
+    on_blob_restored=variant_writer.write
+)
+trash = Trash(
+    directory=TRASH_DIRECTORY,
+    blob_store=blob_store,
+    io_executor=io_executor
+)
+search_index = SearchIndex(path=SEARCH_SQLITE_PATH)
+similarity_index = SimilarityIndex(path=SIMILARITY_SQLITE_PATH)
+diff_cache = DiffCache(max_size=DIFF_CACHE_SIZE)
+ticket_feed = TicketFeed(
+    event_log=EventLog(path=EVENT_SQLITE_PATH, retention=EVENT_RETENTION),
+    poll_interval=EVENT_POLL_INTERVAL
+)
 
 
 def generate_ticket_id(user_id: str) -> str:
@@ -35,11 +146,107 @@ def generate_ticket_id(user_id: str) -> str:
     return f"{datetime.now().isoformat()}H{random_hash}".replace(":", "_")
 
 
-def read_user_ticket_list(user_id: str) -> list[str]:
-    target_directory = join(TICKET_DIRECTORY, user_id)
-    if not isdir(target_directory):
-        return []
-    return listdir(target_directory)
+async def read_user_ticket_list(user_id: str) -> list[str]:
+    return await ticket_storage.list_ids(user_id)
+
+
+async def read_ticket(user_id: str, ticket_id: str) -> Optional[Ticket]:
+    return await ticket_storage.get(user_id, ticket_id)
+
+
+def ticket_file_path(ticket: Ticket, filename: str) -> str:
+    blob_id = ticket.blobs.get(filename)
+    if blob_id is not None:
+        return blob_store.path(blob_id)
+    # Tickets uploaded before blob store keep files in their own directory
+    return join(
+        TICKET_DIRECTORY, ticket.author_id, ticket.ticket_id, "data", filename
+    )
+
+
+def ticket_archive_directory(user_id: str, ticket_id: str) -> str:
+    return join(ARCHIVE_DIRECTORY, user_id, ticket_id)
+
+
+def ticket_archive_path(ticket: Ticket, etag: str) -> str:
+    # Keyed by ETag, a cached zip never outlives the files it was made of
+    return join(
+        ticket_archive_directory(ticket.author_id, ticket.ticket_id),
+        etag.strip("\"") + ".zip"
+    )
+
+
+async def ticket_pack_entries(ticket: Ticket) -> dict[str, PackEntry]:
+    if ticket.pack is None:
+        return {}
+    return await pack_store.entries(ticket.author_id, ticket.ticket_id)
+
+
+def ticket_file_source(
+    ticket: Ticket,
+    filename: str,
+    pack_entries: dict[str, PackEntry],
+) -> FileSource:
+    pack_entry = pack_entries.get(filename)
+    if pack_entry is not None:
+        return (pack_entry.digest, pack_entry.path, pack_entry.offset, pack_entry.size)
+    return (ticket.blobs.get(filename), ticket_file_path(ticket, filename), 0, None)
+
+
+def ticket_archive_entries(
+    ticket: Ticket,
+    pack_entries: dict[str, PackEntry],
+    prefix: str = "",
+) -> list[ArchiveEntry]:
+    entries = []
+    for filename in ticket.files:
+        _, path, offset, size = ticket_file_source(ticket, filename, pack_entries)
+        entries.append(ArchiveEntry(
+            arcname=f"{prefix}{filename}",
+            path=path,
+            timestamp=ticket.create_utc_timestamp,
+            offset=offset,
+            size=size,
+        ))
+    return entries
+
+
+async def ticket_file_etag(
+    ticket: Ticket,
+    filename: str,
+    pack_entry: Optional[PackEntry] = None,
+) -> str:
+    # Digest of packed file is its blob ID, ETag stays the same once packed
+    if pack_entry is not None:
+        return f"\"{pack_entry.digest}\""
+    blob_id = ticket.blobs.get(filename)
+    if blob_id is not None:
+        return f"\"{blob_id}\""
+    file_stat = await io_executor.run(stat, ticket_file_path(ticket, filename))
+    return make_etag([filename, str(file_stat.st_mtime_ns), str(file_stat.st_size)])
+
+
+async def find_blob_variant(blob_id: str, accept_encoding: str) -> Optional[tuple[str, str]]:
+    """
+    Return (encoding, path) of stored variant client accepts best, if any.
+    """
+    encodings = await io_executor.run(blob_store.variants, blob_id)
+    encoding = negotiate(accept_encoding, encodings)
+    if encoding is None:
+        return None
+    return encoding, blob_store.variant_path(blob_id, encoding)
+
+
+async def ticket_etag(ticket: Ticket, pack_entries: dict[str, PackEntry]) -> str:
+    filenames = sorted(ticket.files)
+    file_etags = await gather(*(
+        ticket_file_etag(ticket, filename, pack_entries.get(filename))
+        for filename in filenames
+    ))
+    return make_etag(
+        f"{filename}:{file_etag}"
+        for filename, file_etag in zip(filenames, file_etags)
+    )
 
 
 @router.get(
@@ -47,90 +254,291 @@ def read_user_ticket_list(user_id: str) -> list[str]:
     status_code=status.HTTP_200_OK,
     description="Get your own ticket list",
 )
-def get_self_list(user: UserDepends) -> list[str]:
-    return read_user_ticket_list(user_id=user.id)
+async def get_self_list(user: UserDepends) -> list[str]:
+    return await read_user_ticket_list(user_id=user.id)
+
+
+@router.get(
+    path="/index-stats",
+    status_code=status.HTTP_200_OK,
+    description="Get hit and miss counters of ticket index, admin only, "
+                "null if ticket storage has no index",
+)
+def get_index_stats(user: UserDepends) -> Optional[TicketIndexStats]:
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+    return ticket_storage.stats()
+
+
+@router.get(
+    path="/export",
+    status_code=status.HTTP_200_OK,
+    description="Download tickets of authors created in [start, end) as one zip, "
+                "laid out as <author>/<ticket_id>/<filename>, admin only. "
+                "Omit authors to export every author",
+)
+async def export_tickets(
+    user: UserDepends,
+    authors: Optional[list[str]] = Query(None),
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+):
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+
+    tickets = await ticket_storage.query(
+        author_ids=authors,
+        start=start,
+        end=end,
+    )
+    entries: list[ArchiveEntry] = []
+    for ticket in tickets:
+        entries.extend(ticket_archive_entries(
+            ticket,
+            await ticket_pack_entries(ticket),
+            prefix=f"{ticket.author_id}/{ticket.ticket_id}/"
+        ))
+    return StreamingResponse(
+        timed_stream(
+            stream_zip(entries, ARCHIVE_READ_CONCURRENCY),
+            ARCHIVE_DURATION,
+            "export"
+        ),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": "attachment; filename=\"export.zip\"",
+        }
+    )
+
+
+@router.get(
+    path="/search",
+    status_code=status.HTTP_200_OK,
+    description="Find text in submitted text files, q is matched as is, or "
+                "as a regex if regex is set, admin only. A match may span "
+                "lines, the line it starts at is returned. q must contain "
+                "a literal of at least 3 characters. Omit authors to search "
+                "every author",
+)
+async def search_tickets(
+    user: UserDepends,
+    q: str,
+    regex: bool = False,
+    ignore_case: bool = False,
+    authors: Optional[list[str]] = Query(None),
+    limit: int = Query(100, ge=1, le=MAX_SEARCH_HITS),
+) -> SearchResult:
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+    try:
+        return await search_index.search(
+            query=q,
+            regex=regex,
+            ignore_case=ignore_case,
+            author_ids=authors,
+            limit=limit,
+        )
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error)
+        )
+
+
+def feed_author_id(user: JWTData, user_id: Union[int, Literal["@me"], None]) -> Optional[str]:
+    # Same rule as listing tickets, only admins follow other authors
+    if user_id is None:
+        return None
+    user_id = user.id if user_id == "@me" else str(user_id)
+    if user_id != user.id and not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+    return user_id
+
+
+@router.get(
+    path="/events",
+    status_code=status.HTTP_200_OK,
+    description="Server-sent events of tickets created, modified and deleted, "
+                "filtered like reading a ticket. Set user_id to follow one "
+                "author, use @me ref yourself. Resume by Last-Event-ID header "
+                "or last_event_id, a reset event means events were missed "
+                "and the list should be reloaded",
+)
+async def ticket_events(
+    user: UserDepends,
+    request: Request,
+    user_id: Union[int, Literal["@me"], None] = None,
+    last_event_id: Optional[int] = None,
+):
+    author_id = feed_author_id(user, user_id)
+    header_event_id = request.headers.get("Last-Event-ID", "")
+    if last_event_id is None and header_event_id.isdigit():
+        last_event_id = int(header_event_id)
+    return StreamingResponse(
+        sse_stream(ticket_feed.subscribe(user, last_event_id, author_id)),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
+@router.websocket("/events/ws")
+async def ticket_events_socket(websocket: WebSocket):
+    """
+    Same events as `/ticket/events` over WebSocket, for browsers which can't
+    set Authorization on a stream. First message must be JSON
+    `{"token": jwt, "user_id"?: id, "last_event_id"?: id}`.
+    """
+    await websocket.accept()
+    try:
+        hello = await wait_for(websocket.receive_json(), FEED_AUTH_TIMEOUT)
+        user = await discord_oauth_router.valid_token(
+            HTTPAuthorizationCredentials(scheme="Bearer", credentials=str(hello["token"]))
+        )
+        author_id = feed_author_id(user, hello.get("user_id"))
+        last_event_id = hello.get("last_event_id")
+        if last_event_id is not None:
+            last_event_id = int(last_event_id)
+    except WebSocketDisconnect:
+        return
+    except Exception:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    async def send_events() -> None:
+        async for item in ticket_feed.subscribe(user, last_event_id, author_id):
+            if item is not None:
+                await websocket.send_json(event_message(item))
+        # Token expired, client reconnects with a new one
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+
+    sender = create_task(send_events())
+    try:
+        # Client sends nothing more, receive only to notice disconnect
+        while not sender.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        sender.cancel()
+        await gather(sender, return_exceptions=True)
 
 
 @router.post(
     path="",
     status_code=status.HTTP_201_CREATED,
     description="Create a new ticket",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["files"],
+                        "properties": {
+                            "files": {
+                                "type": "array",
+                                "items": {"type": "string", "format": "binary"}
+                            },
+                            "public": {"type": "boolean", "default": False},
+                        },
+                    }
+                }
+            },
+        }
+    },
 )
-async def upload_files(
-    user: UserDepends,
-    files: list[UploadFile],
-    public: bool = Form(False),
-) -> str:
-    # Check if file path is legal
-    def check_filename(file: UploadFile) -> bool:
-        filename = file.filename
-        if filename is None:
-            return False
+async def upload_files(user: UserDepends, request: Request) -> str:
+    start = perf_counter()
+
+    # Generate ticket id
+    ticket_id = generate_ticket_id(user.id)
+
+    # Check if file path is legal, files go to blob store and the directory
+    # never exists, so a lexical check is enough and touches no disk. Paths
+    # outside the ticket are rejected by StreamingUpload
+    def check_filename(filename: str) -> bool:
         for c in ":*?\"<>|~":
             if c in filename:
                 return False
         return True
-    accept_files = list(filter(check_filename, files))
 
-    # Check filesize
-    filesize = sum(map(lambda file: file.size, accept_files))
-    if filesize > 16 * 1024 * 1024:  # 16MB
-        raise HTTPException(
-            status_code=status.HTTP_431_REQUEST_HEADER_FIELDS_TOO_LARGE,
-            detail="File oversize, max size is 16MB"
-        )
-
-    # Generate ticket id
-    ticket_id = generate_ticket_id(user.id)
-    ticket_directory = Path(join(TICKET_DIRECTORY, str(user.id), ticket_id))
-    save_directory = Path(join(ticket_directory, "data"))
-
-    # Ticket data
-    ticket_data = Ticket(
-        ticket_id=ticket_id,
-        author_id=user.id,
-        public=public,
+    # Stream files into temp files, abort once they are oversize
+    upload = StreamingUpload(
+        request=request,
+        temp_path_factory=blob_store.temp_path,
+        max_size=MAX_TICKET_SIZE,
+        accept_filename=check_filename,
+        io_executor=io_executor,
     )
+    await upload.receive()
 
-    async def write_to_file(file: UploadFile):
-        if file.filename is None:
-            return
-        filename = file.filename.replace("\\", "/")
-        target_path = Path(join(save_directory, filename))
-        try:
-            async with async_open(target_path, "wb") as open_file:
-                await open_file.write(await file.read())
-            ticket_data.files.append(filename)
-        except:
-            pass
-
-    tasks = []
-    for file in accept_files:
-        # Check if path is legal
-        target_path = Path(join(save_directory, file.filename))
-        if not target_path.resolve().is_relative_to(save_directory.resolve()):
-            continue
-
-        # If legal, make directory
-        target_directory, _ = split(target_path)
-        if not isdir(target_directory):
-            makedirs(target_directory)
-        tasks.append(create_task(write_to_file(file)))
-    if len(tasks) == 0:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Can't create empty ticket"
+    try:
+        if len(upload.files) == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Can't create empty ticket"
+            )
+
+        # Ticket data
+        ticket_data = Ticket(
+            ticket_id=ticket_id,
+            author_id=user.id,
+            public=upload.fields.get("public", "").lower() in TRUE_VALUES,
         )
-    await gather(*tasks)
-
-    # Save ticket info to file
-    ticket_data.files = list(set(ticket_data.files))
-    async with async_open(join(ticket_directory, "data.json"), "wb") as data_file:
-        await data_file.write(dumps(
-            ticket_data.model_dump(),
-            option=OPT_INDENT_2
-        ))
 
+        # Move temp files into blob store
+        async def save_file(file: UploadedFile):
+            try:
+                await blob_store.add(file.blob_id, file.size, file.temp_path)
+                ticket_data.blobs[file.filename] = file.blob_id
+                ticket_data.content_types[file.filename] = \
+                    TEXT_CONTENT_TYPE if file.is_text else BINARY_CONTENT_TYPE
+            except:
+                return
+            await variant_writer.write(
+                file.blob_id,
+                ticket_data.content_types[file.filename],
+                file.size
+            )
+        await gather(*map(save_file, upload.files))
+    finally:
+        # Remove temp files which are not moved into blob store
+        await upload.cleanup()
+
+    # Save ticket info
+    ticket_data.files = list(ticket_data.blobs.keys())
+    await ticket_storage.save(ticket_data)
+    documents = ticket_documents(ticket_data, BLOB_DIRECTORY, TICKET_DIRECTORY)
+    try:
+        await search_index.add(user.id, ticket_id, documents)
+    except:
+        # Ticket is saved, python -m storage.reindex fills missing entries
+        pass
+    try:
+        await similarity_index.add(user.id, ticket_id, documents)
+    except:
+        # Filled by python -m storage.rebuild_signatures
+        pass
+    await ticket_feed.publish("created", ticket_data)
+
+    UPLOAD_DURATION.observe(perf_counter() - start)
     return ticket_id
 
 
@@ -141,37 +549,34 @@ async def upload_files(
     description="Modify your ticket by ticket ID"
 )
 async def modify_ticket(user: UserDepends, ticket_id: str, data: TicketUpdate):
-    data_file_path = join(TICKET_DIRECTORY, user.id, ticket_id, "data.json")
-    if not isfile(data_file_path):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Ticket not found"
-        )
-    try:
-        # Read config file
-        async with async_open(data_file_path, "rb") as data_file:
-            ticket_data = Ticket(**loads(
-                await data_file.read()
-            ))
-
-        # Update config
-        update_data = data.model_dump(exclude_defaults=True)
-        for key, value in update_data.items():
-            setattr(ticket_data, key, value)
-
-        # Save change
-        async with async_open(data_file_path, "wb") as data_file:
-            await data_file.write(dumps(
-                ticket_data.model_dump(),
-                option=OPT_INDENT_2
-            ))
-
-        return ticket_data
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Fail to edit"
-        )
+    # Hold ticket lock from read to save, concurrent edits apply in turn
+    async with ticket_storage.lock(user.id, ticket_id):
+        ticket_data = await read_ticket(user.id, ticket_id)
+        if ticket_data is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Ticket not found"
+            )
+        try:
+            # Copy before update, cached ticket is shared between requests
+            ticket_data = ticket_data.model_copy(deep=True)
+            was_public = ticket_data.public
+
+            # Update config
+            update_data = data.model_dump(exclude_defaults=True)
+            for key, value in update_data.items():
+                setattr(ticket_data, key, value)
+
+            # Save change
+            await ticket_storage.save(ticket_data)
+            await ticket_feed.publish("modified", ticket_data, was_public)
+
+            return ticket_data
+        except:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Fail to edit"
+            )
 
 
 @router.delete(
@@ -181,33 +586,130 @@ async def modify_ticket(user: UserDepends, ticket_id: str, data: TicketUpdate):
 )
 async def delete_ticket(user: UserDepends, ticket_id: str):
     target_directory = join(TICKET_DIRECTORY, user.id, ticket_id)
-    if not isdir(target_directory):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Ticket not found"
-        )
-    try:
-        rmtree(target_directory)
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Fail to delete"
-        )
+    # Concurrent deletes must not bury blobs twice
+    async with ticket_storage.lock(user.id, ticket_id):
+        ticket_data = await read_ticket(user.id, ticket_id)
+        if ticket_data is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Ticket not found"
+            )
+        try:
+            await ticket_storage.delete(user.id, ticket_id)
+            if ticket_data.pack is not None:
+                await pack_store.remove(user.id, ticket_id)
+            await search_index.remove(user.id, ticket_id)
+            await similarity_index.remove(user.id, ticket_id)
+            await ticket_feed.publish("deleted", ticket_data, ticket_data.public)
+            # Move files aside now, release blobs and remove files later
+            await trash.bury(
+                user.id,
+                ticket_id,
+                target_directory,
+                # Packed tickets hold no blob references
+                ticket_data.blobs.values() if ticket_data.pack is None else []
+            )
+            await io_executor.run(
+                rmtree,
+                ticket_archive_directory(user.id, ticket_id),
+                ignore_errors=True
+            )
+        except:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Fail to delete"
+            )
 
 
 @router.get(
     path="/{user_id}",
     status_code=status.HTTP_200_OK,
-    description="Get user ticket list by user ID, use @me ref yourself"
+    description="Get user ticket list by user ID, use @me ref yourself. "
+                "Set expand to get a page of full ticket data, "
+                "pass next_cursor of previous page as cursor to get next page"
 )
-def get_user_list(user: UserDepends, user_id: Union[int, Literal["@me"]]) -> list[str]:
+async def get_user_list(
+    user: UserDepends,
+    user_id: Union[int, Literal["@me"]],
+    expand: bool = False,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    order: Literal["asc", "desc"] = "desc",
+) -> Union[TicketPage, list[str]]:
     user_id = user.id if user_id == "@me" else str(user_id)
     if user_id != user.id and not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Permission denied"
         )
-    return read_user_ticket_list(user_id=user_id)
+    if not expand:
+        return await read_user_ticket_list(user_id=user_id)
+    return await ticket_storage.page(
+        user_id=user_id,
+        limit=limit,
+        cursor=cursor,
+        order=order,
+    )
+
+
+@router.get(
+    path="/{user_id}/diff",
+    status_code=status.HTTP_200_OK,
+    description="Get per-file unified diffs from ticket `from` to ticket `to` "
+                "of user by user ID, use @me ref yourself. Files with the "
+                "same content are listed as unchanged",
+)
+async def get_ticket_diff(
+    user: UserDepends,
+    user_id: Union[int, Literal["@me"]],
+    from_ticket_id: str = Query(alias="from"),
+    to_ticket_id: str = Query(alias="to"),
+) -> TicketDiff:
+    user_id = user.id if user_id == "@me" else str(user_id)
+
+    # Read both ticket configs
+    from_ticket, to_ticket = await gather(
+        read_ticket(user_id, from_ticket_id),
+        read_ticket(user_id, to_ticket_id),
+    )
+    if from_ticket is None or to_ticket is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Config data not found"
+        )
+
+    # Both tickets must be readable by accessor
+    if user_id != user.id and not user.is_admin \
+            and not (from_ticket.public and to_ticket.public):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+
+    # Ticket files never change, a pair's diff is valid until delete
+    key = (user_id, from_ticket_id, to_ticket_id)
+    ticket_diff = diff_cache.get(key)
+    if ticket_diff is None:
+        from_entries, to_entries = await gather(
+            ticket_pack_entries(from_ticket),
+            ticket_pack_entries(to_ticket),
+        )
+        ticket_diff = await io_executor.run(
+            diff_ticket_files,
+            user_id,
+            from_ticket_id,
+            to_ticket_id,
+            {
+                filename: ticket_file_source(from_ticket, filename, from_entries)
+                for filename in from_ticket.files
+            },
+            {
+                filename: ticket_file_source(to_ticket, filename, to_entries)
+                for filename in to_ticket.files
+            },
+        )
+        diff_cache.put(key, ticket_diff)
+    return ticket_diff
 
 
 @router.get(
@@ -222,20 +724,15 @@ async def get_user_ticket(
     ticket_id: str,
 ) -> Ticket:
     user_id = user.id if user_id == "@me" else str(user_id)
-    target_directory = join(TICKET_DIRECTORY, user_id, ticket_id)
-    data_file_config = join(target_directory, "data.json")
-    if not isfile(data_file_config):
+
+    # Read ticket config
+    ticket_data = await read_ticket(user_id, ticket_id)
+    if ticket_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Config data not found"
         )
 
-    # Read ticket config
-    async with async_open(data_file_config, "rb") as data_file:
-        ticket_data = Ticket(**loads(
-            await data_file.read()
-        ))
-
     # Check if ticket is accessor's or accessor is admin or ticket is public
     if user_id != user.id and not user.is_admin and not ticket_data.public:
         raise HTTPException(
@@ -248,30 +745,28 @@ async def get_user_ticket(
 @router.get(
     path="/{user_id}/{ticket_id}/file",
     status_code=status.HTTP_200_OK,
-    description="Get user ticket by user ID and ticket ID, use @me ref yourself",
+    description="Get user ticket by user ID and ticket ID, use @me ref yourself. "
+                "Set raw to get file content as is, with Range support",
 )
 async def get_user_ticket(
     user: UserDepends,
     user_id: Union[int, Literal["@me"]],
     ticket_id: str,
     filename: str,
-    response: Response
+    request: Request,
+    response: Response,
+    raw: bool = False,
 ) -> str:
     user_id = user.id if user_id == "@me" else str(user_id)
-    target_directory = join(TICKET_DIRECTORY, user_id, ticket_id)
-    data_file_config = join(target_directory, "data.json")
-    if not isfile(data_file_config):
+
+    # Read ticket config
+    ticket_data = await read_ticket(user_id, ticket_id)
+    if ticket_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Config data not found"
         )
 
-    # Read ticket config
-    async with async_open(data_file_config, "rb") as data_file:
-        ticket_data = Ticket(**loads(
-            await data_file.read()
-        ))
-
     # Check if ticket is accessor's or accessor is admin or ticket is public
     if user_id != user.id and not user.is_admin and not ticket_data.public:
         raise HTTPException(
@@ -285,18 +780,105 @@ async def get_user_ticket(
             detail="File not found"
         )
 
-    # Try to read file
-    file_path = join(target_directory, "data", filename)
+    # Files of packed tickets are read from their pack
+    pack_entry = (await ticket_pack_entries(ticket_data)).get(filename)
+    if ticket_data.pack is not None and pack_entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    file_path = ticket_file_path(ticket_data, filename)
     try:
-        async with async_open(file_path, "r", encoding="utf-8") as file:
-            context = await file.read()
+        etag = await ticket_file_etag(ticket_data, filename, pack_entry)
+    except OSError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, CACHE_CONTROL)
+
+    content_type = ticket_data.content_types.get(filename)
+    if raw:
+        headers = {
+            "Content-Type": content_type or BINARY_CONTENT_TYPE,
+            "ETag": etag,
+            "Cache-Control": CACHE_CONTROL,
+            "X-Content-Type-Options": "nosniff",
+        }
+
+        # Range is ignored if If-Range doesn't match current file
+        request_range = request.headers.get("Range")
+        if_range = request.headers.get("If-Range")
+        if if_range is not None and if_range != etag:
+            request_range = None
+
+        if pack_entry is not None:
+            return RangeFileResponse(
+                pack_entry.path,
+                headers=headers,
+                filename=basename(filename),
+                content_disposition_type="inline",
+                request_range=request_range,
+                offset=pack_entry.offset,
+                size=pack_entry.size,
+            )
+
+        # Let nginx send blob by sendfile, it picks .gz variant by gzip_static
+        blob_id = ticket_data.blobs.get(filename)
+        if ACCEL_REDIRECT_PREFIX and blob_id is not None:
+            headers["X-Accel-Redirect"] = \
+                f"{ACCEL_REDIRECT_PREFIX}/{BlobStore.relative_path(blob_id)}"
+            return Response(headers=headers)
+
+        # Send stored variant if client accepts one, ranges are served from
+        # identity only
+        if COMPRESSION_ENABLED and blob_id is not None and content_type == TEXT_CONTENT_TYPE:
+            headers["Vary"] = "Accept-Encoding"
+            variant = None if request_range is not None else await find_blob_variant(
+                blob_id,
+                request.headers.get("Accept-Encoding", "")
+            )
+            if variant is not None:
+                encoding, variant_path = variant
+                return FileResponse(
+                    variant_path,
+                    headers={
+                        **headers,
+                        "Content-Encoding": encoding,
+                        "ETag": weak_etag(etag),
+                    },
+                    filename=basename(filename),
+                    content_disposition_type="inline",
+                )
+
+        return RangeFileResponse(
+            file_path,
+            headers=headers,
+            filename=basename(filename),
+            content_disposition_type="inline",
+            request_range=request_range,
+        )
+
+    # Content type is detected on upload, older tickets are tried to decode
+    if content_type == BINARY_CONTENT_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File is not text file"
+        )
+    try:
+        if pack_entry is not None:
+            context = (await io_executor.run(read_entry, pack_entry)).decode("utf-8")
+        else:
+            context = (await io_executor.run(read_file_sync, file_path)).decode("utf-8")
     except:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="File is not text file"
         )
-    
-    response.headers["Cache-Control"] = "max-age=600"
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
     return context
 
 
@@ -309,24 +891,18 @@ async def get_user_ticket(
     user: UserDepends,
     user_id: Union[int, Literal["@me"]],
     ticket_id: str,
-    response: Response,
-    # filename: Optional[str] = None
+    request: Request,
 ):
     user_id = user.id if user_id == "@me" else str(user_id)
-    target_directory = join(TICKET_DIRECTORY, user_id, ticket_id)
-    data_file_config = join(target_directory, "data.json")
-    if not isfile(data_file_config):
+
+    # Read ticket config
+    ticket_data = await read_ticket(user_id, ticket_id)
+    if ticket_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Config data not found"
         )
 
-    # Read ticket config
-    async with async_open(data_file_config, "rb") as data_file:
-        ticket_data = Ticket(**loads(
-            await data_file.read()
-        ))
-
     # Check if ticket is accessor's or accessor is admin or ticket is public
     if user_id != user.id and not user.is_admin and not ticket_data.public:
         raise HTTPException(
@@ -334,22 +910,78 @@ async def get_user_ticket(
             detail="Permission denied"
         )
 
-    # try:
-    if not isdir("temp"):
-        makedirs("temp")
+    # Ticket files never change, so ETag and archive are valid until delete.
+    # Packing keeps ETag, and archive with it
+    pack_entries = await ticket_pack_entries(ticket_data)
+    etag = await ticket_etag(ticket_data, pack_entries)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, CACHE_CONTROL)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+    }
+    archive_path = ticket_archive_path(ticket_data, etag)
+    if await io_executor.run(isfile, archive_path):
+        return FileResponse(
+            archive_path,
+            media_type="application/zip",
+            filename=f"{ticket_id}.zip",
+            headers=headers,
+        )
+
+    # First download generates zip while sending, size is unknown so it goes
+    # chunked, and the zip is kept for later downloads
+    entries = ticket_archive_entries(ticket_data, pack_entries)
+    return StreamingResponse(
+        timed_stream(
+            stream_zip_to_cache(
+                entries,
+                archive_path,
+                io_executor,
+                ARCHIVE_READ_CONCURRENCY
+            ),
+            ARCHIVE_DURATION,
+            "ticket"
+        ),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename=\"{ticket_id}.zip\"",
+            **headers,
+        }
+    )
+
+
+@router.get(
+    path="/{user_id}/{ticket_id}/similar",
+    status_code=status.HTTP_200_OK,
+    description="Get tickets and files of other authors most similar to this "
+                "ticket by MinHash estimate of shared code, use @me ref "
+                "yourself, admin only. Set include_same_author to also "
+                "compare with author's own tickets",
+)
+async def get_similar_tickets(
+    user: UserDepends,
+    user_id: Union[int, Literal["@me"]],
+    ticket_id: str,
+    limit: int = Query(10, ge=1, le=MAX_SIMILAR_RESULTS),
+    include_same_author: bool = False,
+) -> SimilarityResult:
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
 
-    def generate_zip() -> str:
-        zip_filename = make_archive(
-            base_name=f"temp/{user.id}-{ticket_id[:6]}",
-            format="zip",
-            root_dir=join(target_directory, "data")
+    user_id = user.id if user_id == "@me" else str(user_id)
+    ticket_data = await read_ticket(user_id, ticket_id)
+    if ticket_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Config data not found"
         )
-        return zip_filename
-    loop = get_event_loop()
-    zip_path = await loop.run_in_executor(None, generate_zip)
-    async with async_open(zip_path, "rb") as zip_file:
-        zip_io = BytesIO(await zip_file.read())
-    remove(zip_path)
-
-    response.headers["Cache-Control"] = "max-age=600"
-    return StreamingResponse(zip_io)
+    return await similarity_index.similar(
+        author_id=ticket_data.author_id,
+        ticket_id=ticket_id,
+        limit=limit,
+        include_same_author=include_same_author,
+    )
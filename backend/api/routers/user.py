@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Response, status
+from fastapi import APIRouter, HTTPException, Query, Response, status
 
-from discord_oauth import DiscordOAuthRouter, DisplayDiscordUser
+from discord_oauth import DisplayDiscordUser
 
-from ..oauth import user_depends
+from ..oauth import discord_oauth_router, user_depends
+
+MAX_BATCH_USERS = 200
 
 router = APIRouter(
     prefix="/user",
@@ -10,6 +12,25 @@ router = APIRouter(
     dependencies=[user_depends]
 )
 
+
+@router.get(
+    path="",
+    response_model=list[DisplayDiscordUser],
+    status_code=status.HTTP_200_OK,
+    description="Get info of multiple users by user IDs, unknown users are skipped"
+)
+async def get_users(response: Response, ids: list[int] = Query([])):
+    if len(ids) > MAX_BATCH_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_USERS} users per request"
+        )
+    users = await discord_oauth_router.read_local_users(list(map(str, ids)))
+
+    response.headers["Cache-Control"] = "max-age=600"
+    return users
+
+
 @router.get(
     path="/{user_id}",
     response_model=DisplayDiscordUser,
@@ -17,7 +38,7 @@ router = APIRouter(
     description="Get user info by user ID"
 )
 async def get_user(user_id: int, response: Response):
-    user = await DiscordOAuthRouter.read_local_user(user_id)
+    user = await discord_oauth_router.read_local_user(str(user_id))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
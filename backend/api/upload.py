@@ -0,0 +1,269 @@
+from fastapi import HTTPException, Request, status
+from multipart.multipart import MultipartParser, parse_options_header
+
+from codecs import getincrementaldecoder
+from hashlib import sha256
+from os import remove
+from posixpath import isabs, normpath
+from typing import BinaryIO, Callable, Literal, NamedTuple, Optional
+
+from storage.io import IOExecutor
+
+# Max size of a non-file form field
+MAX_FIELD_SIZE = 1024
+# Max number of non-file form fields, only a few are expected
+MAX_FIELDS = 16
+
+
+def normalize_filename(filename: str) -> Optional[str]:
+    """
+    Filename with `.` and `..` resolved, None if it is empty, names a
+    directory or points outside the ticket.
+    """
+    if filename == "" or filename.endswith("/") or isabs(filename):
+        return None
+    filename = normpath(filename)
+    if filename == "." or filename == ".." or filename.startswith("../"):
+        return None
+    return filename
+
+
+class UploadedFile(NamedTuple):
+    filename: str
+    blob_id: str
+    size: int
+    temp_path: str
+    is_text: bool
+
+
+class StreamingUpload:
+    """
+    Parse a multipart/form-data request body while it is being received.
+
+    Every accepted file part is written chunk by chunk into its own temp file
+    and hashed on the way, so a file is never held in memory as a whole.
+    Whether a file is UTF-8 text is checked on the way as well. The
+    total size of file parts is checked after each chunk and the upload is
+    aborted as soon as it exceeds `max_size`, as is an upload with more than
+    `MAX_FIELDS` non-file fields. Filenames are stored normalized, see
+    `normalize_filename`, after `accept_filename` passes.
+
+    Temp files are written and removed on `io_executor`. Temp files of
+    `files` belong to the caller after `receive` returns, on failure they
+    are removed by `receive` itself.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        temp_path_factory: Callable[[], str],
+        max_size: int,
+        file_field: str = "files",
+        accept_filename: Callable[[str], bool] = lambda _: True,
+        io_executor: Optional[IOExecutor] = None,
+    ) -> None:
+        self.request = request
+        self.temp_path_factory = temp_path_factory
+        self.max_size = max_size
+        self.file_field = file_field
+        self.accept_filename = accept_filename
+        self.io = io_executor or IOExecutor()
+
+        self.fields: dict[str, str] = {}
+        self.files: list[UploadedFile] = []
+        self.total_size = 0
+        self.field_count = 0
+
+        # Parser state, filled by callbacks
+        self._events: list[tuple[str, bytes]] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: dict[bytes, bytes] = {}
+
+        # Current part state
+        self._kind: Literal["field", "file", "skip"] = "skip"
+        self._filename: Optional[str] = None
+        self._field_name: Optional[str] = None
+        self._field_value = b""
+        self._file: Optional[BinaryIO] = None
+        self._temp_path: Optional[str] = None
+        self._hash = sha256()
+        self._size = 0
+        self._decoder = getincrementaldecoder("utf-8")()
+        self._is_text = True
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        self._events.append((
+            "headers", self._headers.get(b"content-disposition", b"")
+        ))
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self._events.append(("data", data[start:end]))
+
+    def _on_part_end(self) -> None:
+        self._events.append(("end", b""))
+
+    def _start_part(self, content_disposition: bytes) -> None:
+        _, options = parse_options_header(content_disposition)
+        self._field_name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._field_value = b""
+        self._filename = None
+        self._temp_path = None
+
+        filename = options.get(b"filename")
+        if filename is None:
+            self.field_count += 1
+            if self.field_count > MAX_FIELDS:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Too many form fields"
+                )
+            self._kind = "field"
+            return
+        self._kind = "skip"
+        if self._field_name != self.file_field:
+            return
+        filename = filename.decode("utf-8", "replace").replace("\\", "/")
+        if not self.accept_filename(filename):
+            return
+        filename = normalize_filename(filename)
+        if filename is None:
+            return
+        # Keep the first file of each filename
+        if any(file.filename == filename for file in self.files):
+            return
+        self._kind = "file"
+        self._filename = filename
+        self._temp_path = self.temp_path_factory()
+        self._hash = sha256()
+        self._size = 0
+        self._decoder.reset()
+        self._is_text = True
+
+    def _check_text(self, data: bytes, final: bool = False) -> None:
+        if not self._is_text:
+            return
+        try:
+            self._decoder.decode(data, final=final)
+        except UnicodeDecodeError:
+            self._is_text = False
+
+    async def _write_part(self, data: bytes) -> None:
+        if self._kind == "field":
+            self._field_value += data
+            if len(self._field_value) > MAX_FIELD_SIZE:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Form field too large"
+                )
+            return
+
+        # Skipped files are counted too, so the body can't grow unbounded
+        self.total_size += len(data)
+        if self.total_size > self.max_size:
+            raise HTTPException(
+                status_code=status.HTTP_431_REQUEST_HEADER_FIELDS_TOO_LARGE,
+                detail=f"File oversize, max size is {self.max_size // 1024 // 1024}MB"
+            )
+        if self._kind == "skip":
+            return
+        if self._file is None:
+            self._file = await self.io.run(open, self._temp_path, "wb")
+        self._hash.update(data)
+        self._size += len(data)
+        self._check_text(data)
+        await self.io.run(self._file.write, data)
+
+    async def _end_part(self) -> None:
+        if self._kind == "field":
+            self.fields[self._field_name] = self._field_value.decode(
+                "utf-8", "replace"
+            )
+            return
+        if self._kind == "skip":
+            return
+
+        # Empty file never opened its temp file
+        if self._file is None:
+            self._file = await self.io.run(open, self._temp_path, "wb")
+        await self.io.run(self._file.close)
+        self._file = None
+        self._check_text(b"", final=True)
+        self.files.append(UploadedFile(
+            filename=self._filename,
+            blob_id=self._hash.hexdigest(),
+            size=self._size,
+            temp_path=self._temp_path,
+            is_text=self._is_text,
+        ))
+        self._kind = "skip"
+        self._filename = None
+        self._temp_path = None
+
+    async def _handle_events(self) -> None:
+        events, self._events = self._events, []
+        for event, data in events:
+            if event == "headers":
+                self._start_part(data)
+            elif event == "data":
+                await self._write_part(data)
+            else:
+                await self._end_part()
+
+    async def receive(self) -> None:
+        content_type, options = parse_options_header(
+            self.request.headers.get("Content-Type", "")
+        )
+        boundary = options.get(b"boundary")
+        if content_type != b"multipart/form-data" or boundary is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Body should be multipart/form-data"
+            )
+
+        parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        try:
+            async for chunk in self.request.stream():
+                parser.write(chunk)
+                await self._handle_events()
+            parser.finalize()
+            await self._handle_events()
+        except:
+            await self.cleanup()
+            raise
+
+    async def cleanup(self) -> None:
+        if self._file is not None:
+            await self.io.run(self._file.close)
+            self._file = None
+        temp_paths = [file.temp_path for file in self.files]
+        if self._temp_path is not None:
+            temp_paths.append(self._temp_path)
+        for temp_path in temp_paths:
+            try:
+                await self.io.run(remove, temp_path)
+            except FileNotFoundError:
+                pass
+        self.files = []
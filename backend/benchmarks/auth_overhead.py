@@ -0,0 +1,55 @@
+"""
+Auth overhead of `DiscordOAuthRouter.valid_token` per request, with and
+without verified token cache.
+
+Run from backend directory: `python -m benchmarks.auth_overhead`
+"""
+from fastapi.security import HTTPAuthorizationCredentials
+from orjson import dumps, OPT_INDENT_2
+
+from asyncio import run
+from os import chdir, urandom
+from tempfile import mkdtemp
+from time import perf_counter
+
+from .server import make_token
+
+ROUNDS = 20000
+
+
+async def measure(token_cache_size: int) -> dict:
+    # Import here, discord_oauth creates its data directory under cwd
+    from discord_oauth import DiscordOAuthRouter
+
+    key = urandom(16).hex()
+    oauth_router = DiscordOAuthRouter(
+        redirect_uri="",
+        client_id="",
+        client_secret="",
+        key=key,
+        token_cache_size=token_cache_size,
+    )
+    jwt = make_token(key, "2")
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=jwt)
+
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        await oauth_router.valid_token(credentials)
+    elapsed = perf_counter() - start
+
+    return {
+        "token_cache_size": token_cache_size,
+        "rounds": ROUNDS,
+        "us_per_request": round(elapsed / ROUNDS * 1e6, 2),
+        "cache": oauth_router.token_cache.stats().model_dump(),
+    }
+
+
+async def main():
+    chdir(mkdtemp(prefix="pd2-ticket-bench-"))
+    results = [await measure(0), await measure(1024)]
+    print(dumps(results, option=OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    run(main=main())
@@ -0,0 +1,116 @@
+"""
+Local stand-in of Discord OAuth endpoints used by `DiscordOAuthRouter`, so
+login and refresh can be exercised without reaching discord.com. Point
+`discord_api` in config.json at `FakeDiscord.url`.
+"""
+from aiohttp import web
+
+from asyncio import sleep
+from os import urandom
+from typing import Optional
+
+from .server import free_port
+
+
+class FakeDiscord:
+    """
+    Every code or refresh token is accepted, the user ID is taken from it, so
+    `code="42"` logs in as user 42. `latency` delays each response to imitate
+    a remote server, `rate_limited` answers that many next requests with 429.
+    """
+
+    def __init__(self, latency: float = 0) -> None:
+        self.port = free_port()
+        self.latency = latency
+        self.tokens: dict[str, str] = {}
+        self.token_requests = 0
+        self.user_requests = 0
+        self.connections: set[int] = set()
+        self.rate_limited = 0
+        self.retry_after = 0.5
+        self.runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _track(self, request: web.Request) -> None:
+        transport = request.transport
+        if transport is not None:
+            self.connections.add(id(transport))
+
+    def _rate_limit(self) -> Optional[web.Response]:
+        if self.rate_limited <= 0:
+            return None
+        self.rate_limited -= 1
+        return web.json_response(
+            {"message": "You are being rate limited.", "retry_after": self.retry_after},
+            status=429,
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+    async def token(self, request: web.Request) -> web.Response:
+        self._track(request)
+        response = self._rate_limit()
+        if response is not None:
+            return response
+        self.token_requests += 1
+        await sleep(self.latency)
+        form = await request.post()
+        grant_type = form.get("grant_type")
+        if grant_type == "authorization_code":
+            user_id = str(form.get("code", ""))
+        elif grant_type == "refresh_token":
+            user_id = str(form.get("refresh_token", "")).partition(":")[0]
+        else:
+            return web.json_response({"error": "unsupported_grant_type"}, status=400)
+        if not user_id.isdigit():
+            return web.json_response({"error": "invalid_grant"}, status=400)
+
+        access_token = urandom(16).hex()
+        self.tokens[access_token] = user_id
+        return web.json_response({
+            "access_token": access_token,
+            "token_type": "Bearer",
+            "expires_in": 604800,
+            "refresh_token": f"{user_id}:{urandom(8).hex()}",
+            "scope": "identify",
+        })
+
+    async def user(self, request: web.Request) -> web.Response:
+        self._track(request)
+        response = self._rate_limit()
+        if response is not None:
+            return response
+        self.user_requests += 1
+        await sleep(self.latency)
+        _, _, access_token = request.headers.get("Authorization", "").partition(" ")
+        user_id = self.tokens.get(access_token)
+        if user_id is None:
+            return web.json_response({"message": "401: Unauthorized"}, status=401)
+        return web.json_response({
+            "id": user_id,
+            "username": f"user-{user_id}",
+            "global_name": None,
+            "avatar": None,
+        })
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/oauth2/token", self.token)
+        app.router.add_get("/users/@me", self.user)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def __aenter__(self) -> "FakeDiscord":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.stop()
@@ -0,0 +1,281 @@
+"""
+Load test of the ticket API against a local fake Discord.
+
+Boots the API in a subprocess with `discord_api` pointed at `FakeDiscord`,
+logs users in through `/oauth`, seeds USERS x TICKETS tickets of C-like
+source files, then runs each scenario with CONCURRENCY clients and reports
+throughput and latency percentiles as JSON.
+
+Run from backend directory:
+    python -m benchmarks.load --output result.json
+    python -m benchmarks.load --baseline result.json
+
+With `--baseline`, scenarios whose p95 grows or throughput drops by more
+than `--tolerance` are listed and the exit code is 1.
+"""
+from aiohttp import ClientSession, FormData
+from orjson import dumps, loads, OPT_INDENT_2
+
+from argparse import ArgumentParser, Namespace
+from asyncio import gather, run
+from random import Random
+from subprocess import DEVNULL, run as run_process
+from sys import exit, version
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Optional
+
+from .fake_discord import FakeDiscord
+from .server import BACKEND_DIRECTORY, BenchmarkServer
+
+SCENARIOS = ["upload", "list", "metadata", "file", "download"]
+# Size of uploaded files follows a log-normal around 4KB, as homework does
+FILE_SIZE_MU = 8.3
+FILE_SIZE_SIGMA = 1.0
+MAX_FILE_SIZE = 256 * 1024
+SOURCE_LINE = b"    for (int i = 0; i < n; ++i) { sum += a[i] * b[i]; }\n"
+
+
+def percentile(sorted_values: list[float], ratio: float) -> float:
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0
+    index = min(int(ratio * len(sorted_values) + 0.5), len(sorted_values)) - 1
+    return sorted_values[max(index, 0)]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0,
+    }
+
+
+def make_files(random: Random, count: int) -> list[tuple[str, bytes]]:
+    files = []
+    for index in range(count):
+        size = min(int(random.lognormvariate(FILE_SIZE_MU, FILE_SIZE_SIGMA)), MAX_FILE_SIZE)
+        content = (SOURCE_LINE * (size // len(SOURCE_LINE) + 1))[:max(size, 1)]
+        files.append((f"main{index}.cpp", content))
+    return files
+
+
+def make_form(files: list[tuple[str, bytes]]) -> FormData:
+    form = FormData()
+    for filename, content in files:
+        form.add_field("files", content, filename=filename, content_type="text/plain")
+    return form
+
+
+class LoadTest:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        self.random = Random(args.seed)
+        self.headers: dict[str, dict[str, str]] = {}
+        self.tickets: list[tuple[str, str, str]] = []
+        self.client: Optional[ClientSession] = None
+        self.url = ""
+
+    async def login(self, user_id: str) -> None:
+        async with self.client.post(f"{self.url}/oauth", json={"code": user_id}) as response:
+            assert response.status == 200, await response.text()
+            jwt = (await response.json())["access_token"]
+        self.headers[user_id] = {"Authorization": f"Bearer {jwt}"}
+
+    async def upload(self, user_id: str) -> str:
+        files = make_files(self.random, self.args.files)
+        async with self.client.post(
+            f"{self.url}/ticket",
+            data=make_form(files),
+            headers=self.headers[user_id]
+        ) as response:
+            assert response.status == 201, await response.text()
+            ticket_id = await response.json()
+        self.tickets.append((user_id, ticket_id, files[0][0]))
+        return ticket_id
+
+    async def seed(self) -> None:
+        user_ids = [str(1000 + index) for index in range(self.args.users)]
+        await gather(*map(self.login, user_ids))
+        for _ in range(self.args.tickets):
+            await gather(*map(self.upload, user_ids))
+
+    def pick_ticket(self) -> tuple[str, str, str]:
+        return self.random.choice(self.tickets)
+
+    def request_factory(self, scenario: str) -> Callable[[], Awaitable[bool]]:
+        async def get(path: str, user_id: str, **kwargs: Any) -> bool:
+            async with self.client.get(
+                f"{self.url}{path}",
+                headers=self.headers[user_id],
+                **kwargs
+            ) as response:
+                await response.read()
+                return response.status == 200
+
+        async def upload() -> bool:
+            user_id = self.random.choice(list(self.headers))
+            await self.upload(user_id)
+            return True
+
+        async def list_tickets() -> bool:
+            user_id, _, _ = self.pick_ticket()
+            return await get("/ticket/@me", user_id, params={"expand": "true"})
+
+        async def metadata() -> bool:
+            user_id, ticket_id, _ = self.pick_ticket()
+            return await get(f"/ticket/@me/{ticket_id}", user_id)
+
+        async def file() -> bool:
+            user_id, ticket_id, filename = self.pick_ticket()
+            return await get(
+                f"/ticket/@me/{ticket_id}/file",
+                user_id,
+                params={"filename": filename}
+            )
+
+        async def download() -> bool:
+            user_id, ticket_id, _ = self.pick_ticket()
+            return await get(f"/ticket/@me/{ticket_id}/download", user_id)
+
+        return {
+            "upload": upload,
+            "list": list_tickets,
+            "metadata": metadata,
+            "file": file,
+            "download": download,
+        }[scenario]
+
+    async def measure(self, scenario: str) -> dict[str, Any]:
+        request = self.request_factory(scenario)
+        latencies: list[float] = []
+        errors = 0
+
+        async def worker() -> None:
+            nonlocal errors
+            for _ in range(self.args.requests):
+                start = perf_counter()
+                try:
+                    ok = await request()
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies.append(perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = perf_counter()
+        await gather(*(worker() for _ in range(self.args.concurrency)))
+        return summarize(latencies, errors, perf_counter() - start)
+
+    async def run(self) -> dict[str, Any]:
+        async with FakeDiscord() as fake_discord:
+            config = {
+                "discord_api": fake_discord.url,
+                "workers": self.args.workers,
+                "ticket_storage": self.args.storage,
+            }
+            async with BenchmarkServer(config) as server:
+                self.url = server.url
+                async with ClientSession() as client:
+                    self.client = client
+                    seed_start = perf_counter()
+                    await self.seed()
+                    seed_time = perf_counter() - seed_start
+
+                    results = {}
+                    for scenario in self.args.scenarios:
+                        results[scenario] = await self.measure(scenario)
+
+        return {
+            "meta": {
+                "commit": git_commit(),
+                "python": version.split()[0],
+                "users": self.args.users,
+                "tickets_per_user": self.args.tickets,
+                "files_per_ticket": self.args.files,
+                "concurrency": self.args.concurrency,
+                "requests_per_client": self.args.requests,
+                "workers": self.args.workers,
+                "storage": self.args.storage,
+                "seed": self.args.seed,
+                "seed_seconds": round(seed_time, 3),
+            },
+            "results": results,
+        }
+
+
+def git_commit() -> Optional[str]:
+    result = run_process(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=BACKEND_DIRECTORY,
+        capture_output=True,
+        stdin=DEVNULL,
+    )
+    return result.stdout.decode().strip() or None
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for scenario, current in result["results"].items():
+        previous = baseline.get("results", {}).get(scenario)
+        if previous is None:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{scenario}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms"
+            )
+        if current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{scenario}: throughput {previous['throughput']} -> {current['throughput']} req/s"
+            )
+        if current["errors"] > previous["errors"]:
+            regressions.append(
+                f"{scenario}: errors {previous['errors']} -> {current['errors']}"
+            )
+    return regressions
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description="Load test of the ticket API")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tickets", type=int, default=5, help="tickets per user")
+    parser.add_argument("--files", type=int, default=8, help="files per ticket")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="requests per client")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--storage", choices=["file", "sqlite"], default="file")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write result JSON to this file")
+    parser.add_argument("--baseline", help="result JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    result = await LoadTest(args).run()
+    content = dumps(result, option=OPT_INDENT_2)
+    print(content.decode())
+    if args.output:
+        with open(args.output, "wb") as output_file:
+            output_file.write(content)
+
+    if args.baseline:
+        with open(args.baseline, "rb") as baseline_file:
+            baseline = loads(baseline_file.read())
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            exit(1)
+
+
+if __name__ == "__main__":
+    run(main=main())
@@ -0,0 +1,74 @@
+"""
+Worst event loop stall of the API under a mixed load: clients upload
+tickets of many files, list, read, download and delete them concurrently.
+Stats come from the server's own `/loop-lag` monitor.
+
+Run from backend directory: `python -m benchmarks.loop_lag`
+"""
+from aiohttp import ClientSession, FormData
+from orjson import dumps, OPT_INDENT_2
+
+from asyncio import gather, run
+from os import urandom
+
+from .server import BenchmarkServer
+
+CLIENTS = 16
+ROUNDS = 10
+FILES_PER_TICKET = 200
+FILE_SIZE = 16 * 1024
+
+
+async def client_loop(server: BenchmarkServer, client_id: int) -> None:
+    user_id = str(100 + client_id)
+    async with ClientSession(headers=server.token(user_id)) as client:
+        for _ in range(ROUNDS):
+            form = FormData()
+            for index in range(FILES_PER_TICKET):
+                form.add_field(
+                    "files",
+                    urandom(FILE_SIZE // 2).hex().encode(),
+                    filename=f"{index}.c",
+                    content_type="text/plain"
+                )
+            async with client.post(f"{server.url}/ticket", data=form) as response:
+                assert response.status == 201, await response.text()
+                ticket_id = await response.json()
+
+            async with client.get(f"{server.url}/ticket/@me") as response:
+                assert response.status == 200
+            async with client.get(
+                f"{server.url}/ticket/@me/{ticket_id}/file",
+                params={"filename": "0.c"}
+            ) as response:
+                assert response.status == 200
+            async with client.get(f"{server.url}/ticket/@me/{ticket_id}/download") as response:
+                assert response.status == 200
+                await response.read()
+            async with client.delete(
+                f"{server.url}/ticket",
+                params={"ticket_id": ticket_id}
+            ) as response:
+                assert response.status == 204
+
+
+async def main():
+    async with BenchmarkServer() as server:
+        async with ClientSession(headers=server.token("1", is_admin=True)) as admin:
+            async with admin.get(f"{server.url}/loop-lag", params={"reset": "true"}):
+                pass
+            await gather(*(
+                client_loop(server, client_id) for client_id in range(CLIENTS)
+            ))
+            async with admin.get(f"{server.url}/loop-lag") as response:
+                stats = await response.json()
+    print(dumps({
+        "clients": CLIENTS,
+        "rounds": ROUNDS,
+        "files_per_ticket": FILES_PER_TICKET,
+        "loop_lag": stats,
+    }, option=OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    run(main=main())
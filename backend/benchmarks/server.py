@@ -0,0 +1,111 @@
+from aiohttp import ClientSession
+from jwt import encode
+from orjson import dumps
+
+from asyncio import sleep
+from datetime import datetime, timedelta, timezone
+from os import urandom
+from os.path import abspath, dirname, join
+from shutil import rmtree
+from socket import socket
+from subprocess import DEVNULL, Popen
+from sys import executable
+from tempfile import mkdtemp
+from typing import Any, Optional
+
+BACKEND_DIRECTORY = dirname(dirname(abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_token(key: str, user_id: str, is_admin: bool = False) -> str:
+    utc_now = datetime.now(tz=timezone.utc)
+    return encode(
+        payload={
+            "id": user_id,
+            "username": f"user-{user_id}",
+            "global_name": None,
+            "avatar": None,
+            "is_admin": is_admin,
+            "display_name": f"user-{user_id}",
+            "display_avatar": "https://cdn.discordapp.com/embed/avatars/0.png",
+            "exp": int((utc_now + timedelta(days=7)).timestamp()),
+            "iat": int(utc_now.timestamp()),
+        },
+        key=key,
+        algorithm="HS256"
+    )
+
+
+class BenchmarkServer:
+    """
+    Run the API in a subprocess, inside a fresh temp working directory.
+    """
+
+    def __init__(self, config: dict[str, Any] = {}) -> None:
+        self.directory = mkdtemp(prefix="pd2-ticket-bench-")
+        self.port = free_port()
+        self.key = urandom(16).hex()
+        self.config = {
+            "host": "127.0.0.1",
+            "port": self.port,
+            "key": self.key,
+            "admins": ["1"],
+            **config,
+        }
+        self.process: Optional[Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def token(self, user_id: str, is_admin: bool = False) -> dict[str, str]:
+        return {"Authorization": f"Bearer {make_token(self.key, user_id, is_admin)}"}
+
+    def peak_rss(self) -> int:
+        """
+        Peak resident set size of server process in bytes, Linux only.
+        """
+        with open(f"/proc/{self.process.pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    async def start(self) -> None:
+        with open(join(self.directory, "config.json"), "wb") as config_file:
+            config_file.write(dumps(self.config))
+        self.process = Popen(
+            [executable, join(BACKEND_DIRECTORY, "main.py")],
+            cwd=self.directory,
+            stdout=DEVNULL,
+            stderr=DEVNULL,
+        )
+        async with ClientSession() as client:
+            for _ in range(100):
+                try:
+                    async with client.get(f"{self.url}/ping") as response:
+                        if response.status == 200:
+                            return
+                except OSError:
+                    pass
+                await sleep(0.1)
+        raise RuntimeError("Benchmark server did not start")
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        rmtree(self.directory, ignore_errors=True)
+
+    async def __aenter__(self) -> "BenchmarkServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        self.stop()
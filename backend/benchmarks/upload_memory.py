@@ -0,0 +1,45 @@
+"""
+Peak RSS of the API process while receiving one upload of growing size.
+
+Run from backend directory: `python -m benchmarks.upload_memory`
+"""
+from aiohttp import ClientSession, FormData
+from orjson import dumps, OPT_INDENT_2
+
+from asyncio import run
+from os import urandom
+
+from .server import BenchmarkServer
+
+SIZES_MB = [1, 2, 4, 8, 15]
+
+
+async def measure(size_mb: int) -> dict:
+    async with BenchmarkServer() as server:
+        baseline = server.peak_rss()
+        form = FormData()
+        form.add_field(
+            "files",
+            urandom(size_mb * 1024 * 1024),
+            filename="payload.bin",
+            content_type="application/octet-stream"
+        )
+        async with ClientSession(headers=server.token("2")) as client:
+            async with client.post(f"{server.url}/ticket", data=form) as response:
+                assert response.status == 201, await response.text()
+        peak = server.peak_rss()
+    return {
+        "upload_mb": size_mb,
+        "baseline_rss_mb": round(baseline / 1024 / 1024, 2),
+        "peak_rss_mb": round(peak / 1024 / 1024, 2),
+        "growth_mb": round((peak - baseline) / 1024 / 1024, 2),
+    }
+
+
+async def main():
+    results = [await measure(size_mb) for size_mb in SIZES_MB]
+    print(dumps(results, option=OPT_INDENT_2).decode())
+
+
+if __name__ == "__main__":
+    run(main=main())
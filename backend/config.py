@@ -2,16 +2,47 @@ from orjson import dumps, loads, OPT_INDENT_2
 from pydantic import BaseModel
 
 from os import urandom
+from typing import Literal
 
 
 class Config(BaseModel):
     host: str = "0.0.0.0"
     port: int = 8080
+    workers: int = 1
+    io_workers: int = 8
+    metrics_enabled: bool = True
+    profile_request_interval: float = 0.005
+    profile_global_interval: float = 0
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    compression_cache_bytes: int = 32 * 1024 * 1024
     key: str = urandom(16).hex()
     redirect_uri: str = ""
     client_id: str = ""
     client_secret: str = ""
     admins: list[str] = []
+    ticket_cache_size: int = 4096
+    ticket_storage: Literal["file", "sqlite"] = "file"
+    ticket_sqlite_path: str = "data/tickets.sqlite"
+    search_sqlite_path: str = "data/search.sqlite"
+    similarity_sqlite_path: str = "data/similarity.sqlite"
+    event_sqlite_path: str = "data/events.sqlite"
+    event_retention: int = 10000
+    event_poll_interval: float = 1
+    accel_redirect_prefix: str = ""
+    token_cache_size: int = 1024
+    token_cache_ttl: float = 300
+    user_cache_size: int = 4096
+    diff_cache_size: int = 256
+    pack_enabled: bool = False
+    pack_after_days: float = 180
+    pack_interval: float = 3600
+    discord_api: str = "https://discord.com/api/v10"
+    discord_connection_limit: int = 32
+    discord_timeout: float = 10
+    discord_rate_limit: float = 5
+    discord_rate_limit_burst: int = 10
+    discord_max_queue_wait: float = 10
 
 
 try:
@@ -30,8 +61,38 @@ except:
 
 HOST = config.host
 PORT = config.port
+WORKERS = max(config.workers, 1)
+IO_WORKERS = max(config.io_workers, 1)
+METRICS_ENABLED = config.metrics_enabled
+PROFILE_REQUEST_INTERVAL = config.profile_request_interval
+PROFILE_GLOBAL_INTERVAL = config.profile_global_interval
+COMPRESSION_ENABLED = config.compression_enabled
+COMPRESSION_MIN_SIZE = config.compression_min_size
+COMPRESSION_CACHE_BYTES = config.compression_cache_bytes
 KEY = config.key
 REDIRECT_URI = config.redirect_uri
 CLIENT_ID = config.client_id
 CLIENT_SECRET = config.client_secret
 ADMINS = config.admins
+TICKET_CACHE_SIZE = config.ticket_cache_size
+TICKET_STORAGE = config.ticket_storage
+TICKET_SQLITE_PATH = config.ticket_sqlite_path
+SEARCH_SQLITE_PATH = config.search_sqlite_path
+SIMILARITY_SQLITE_PATH = config.similarity_sqlite_path
+EVENT_SQLITE_PATH = config.event_sqlite_path
+EVENT_RETENTION = config.event_retention
+EVENT_POLL_INTERVAL = config.event_poll_interval
+ACCEL_REDIRECT_PREFIX = config.accel_redirect_prefix
+TOKEN_CACHE_SIZE = config.token_cache_size
+TOKEN_CACHE_TTL = config.token_cache_ttl
+USER_CACHE_SIZE = config.user_cache_size
+DIFF_CACHE_SIZE = config.diff_cache_size
+PACK_ENABLED = config.pack_enabled
+PACK_AFTER_DAYS = config.pack_after_days
+PACK_INTERVAL = config.pack_interval
+DISCORD_API = config.discord_api
+DISCORD_CONNECTION_LIMIT = config.discord_connection_limit
+DISCORD_TIMEOUT = config.discord_timeout
+DISCORD_RATE_LIMIT = config.discord_rate_limit
+DISCORD_RATE_LIMIT_BURST = config.discord_rate_limit_burst
+DISCORD_MAX_QUEUE_WAIT = config.discord_max_queue_wait
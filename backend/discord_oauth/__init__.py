@@ -6,4 +6,6 @@ from .schemas import (
     StorageData,
     JWTData,
     JWT,
+    TokenCacheStats,
+    UserCacheStats,
 )
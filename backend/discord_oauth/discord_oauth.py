@@ -1,15 +1,19 @@
 from aiofiles import open as async_open
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from fastapi import APIRouter, Body, Security, status
 from fastapi.exceptions import HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jwt import decode, encode
-from orjson import loads, dumps, OPT_INDENT_2
+from orjson import loads
 
+from asyncio import Task, create_task, gather, shield
 from datetime import datetime, timedelta, timezone
 from os import makedirs, urandom
-from os.path import isdir, isfile, join
-from typing import Literal, Optional, TypeVar
+from os.path import getmtime, isdir, join
+from time import perf_counter
+from typing import Any, Callable, Literal, Optional, TypeVar
+
+from storage.atomic import KeyLocks, write_json
 
 from .schemas import (
     AccessTokenResponse,
@@ -18,7 +22,12 @@ from .schemas import (
     StorageData,
     JWTData,
     JWT,
+    TokenCacheStats,
+    UserCacheStats,
 )
+from .rate_limit import RateLimiter
+from .token_cache import TokenCache
+from .user_cache import UserCache
 
 security = HTTPBearer(
     scheme_name="JWT",
@@ -27,9 +36,13 @@ security = HTTPBearer(
 
 
 T = TypeVar("T")
+# (endpoint, status code or "connection" or "queue_full", seconds or None)
+Observer = Callable[[str, str, Optional[float]], None]
 
 DISCORD_API = "https://discord.com/api/v10"
 DISCORD_USER_DIRECTORY = "data/discord-users"
+DISCORD_USER_LOCK_DIRECTORY = "data/locks/discord-users"
+MAX_RATE_LIMIT_RETRIES = 3
 if not isdir(DISCORD_USER_DIRECTORY):
     makedirs(DISCORD_USER_DIRECTORY)
 
@@ -44,6 +57,17 @@ class DiscordOAuthRouter:
     client_secret: str = ""
     key: str = urandom(16).hex()
     admins: list[str] = []
+    token_cache: TokenCache
+    user_cache: UserCache
+    api_base: str = DISCORD_API
+    connection_limit: int = 32
+    timeout: float = 10
+    session: Optional[ClientSession] = None
+    rate_limiter: RateLimiter
+    max_queue_wait: float = 10
+    refreshing: dict[str, Task]
+    user_locks: KeyLocks
+    observer: Optional[Observer] = None
 
     def __init__(
         self,
@@ -52,7 +76,17 @@ class DiscordOAuthRouter:
         client_secret: str,
         key: str = urandom(16).hex(),
         prefix: str = "/oauth",
-        admins: list[str] = []
+        admins: list[str] = [],
+        token_cache_size: int = 1024,
+        token_cache_ttl: float = 300,
+        user_cache_size: int = 4096,
+        api_base: str = DISCORD_API,
+        connection_limit: int = 32,
+        timeout: float = 10,
+        rate_limit: float = 5,
+        rate_limit_burst: int = 10,
+        max_queue_wait: float = 10,
+        observer: Optional[Observer] = None,
     ) -> None:
         self.router.prefix = prefix
 
@@ -62,6 +96,26 @@ class DiscordOAuthRouter:
 
         self.key = key
         self.admins = admins
+        self.token_cache = TokenCache(
+            max_size=token_cache_size,
+            ttl=token_cache_ttl
+        )
+        self.user_cache = UserCache(max_size=user_cache_size)
+
+        self.api_base = api_base.rstrip("/")
+        self.connection_limit = connection_limit
+        self.timeout = timeout
+        self.session = None
+
+        self.rate_limiter = RateLimiter(
+            rate=rate_limit,
+            burst=rate_limit_burst
+        )
+        self.max_queue_wait = max_queue_wait
+        self.refreshing = {}
+        # Serialize refreshes of one user across worker processes
+        self.user_locks = KeyLocks(directory=DISCORD_USER_LOCK_DIRECTORY)
+        self.observer = observer
 
         self.router.add_api_route(
             path="",
@@ -79,6 +133,96 @@ class DiscordOAuthRouter:
             description="Refresh token",
             methods=["PUT"]
         )
+        self.router.add_api_route(
+            path="/token-cache",
+            endpoint=self.token_cache_stats,
+            response_model=TokenCacheStats,
+            status_code=status.HTTP_200_OK,
+            description="Get verified token cache counters, admin only",
+            methods=["GET"]
+        )
+        self.router.add_api_route(
+            path="/user-cache",
+            endpoint=self.user_cache_stats,
+            response_model=UserCacheStats,
+            status_code=status.HTTP_200_OK,
+            description="Get user profile cache counters, admin only",
+            methods=["GET"]
+        )
+
+    async def start(self) -> None:
+        """
+        Open the pooled HTTP session to Discord, call on app startup.
+        """
+        if self.session is not None and not self.session.closed:
+            return
+        self.session = ClientSession(
+            connector=TCPConnector(
+                limit=self.connection_limit,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            ),
+            timeout=ClientTimeout(
+                total=self.timeout,
+                connect=self.timeout / 2,
+            ),
+        )
+
+    async def close(self) -> None:
+        """
+        Close the pooled HTTP session, call on app shutdown.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_session(self) -> ClientSession:
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+
+    async def _send(self, method: str, url: str, **kwargs: Any) -> tuple[int, bytes]:
+        """
+        Send request to Discord through rate limiter, wait and retry when
+        Discord answers 429. Raise 503 if queue is too long to wait.
+        """
+        client = await self.get_session()
+        endpoint = url.removeprefix(self.api_base)
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            # No await between check and acquire, so the estimate counts
+            # every request queued before this one
+            if self.rate_limiter.wait_time() > self.max_queue_wait:
+                break
+            await self.rate_limiter.acquire()
+            start = perf_counter()
+            try:
+                async with client.request(method, url, **kwargs) as response:
+                    content = await response.content.read()
+            except Exception:
+                self._observe(endpoint, "connection", perf_counter() - start)
+                raise
+            self._observe(endpoint, str(response.status), perf_counter() - start)
+            if response.status != 429:
+                return response.status, content
+
+            try:
+                body = loads(content)
+            except:
+                body = None
+            self.rate_limiter.block(RateLimiter.parse_retry_after(
+                response.headers,
+                body if isinstance(body, dict) else None
+            ))
+        self._observe(endpoint, "queue_full", None)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Discord is rate limited, try again later",
+            headers={"Retry-After": str(int(self.rate_limiter.wait_time()) + 1)}
+        )
+
+    def _observe(self, endpoint: str, outcome: str, seconds: Optional[float]) -> None:
+        if self.observer is not None:
+            self.observer(endpoint, outcome, seconds)
 
     async def _request_to_discord(
         self,
@@ -86,30 +230,29 @@ class DiscordOAuthRouter:
         grant_type: Literal["authorization_code", "refresh_token"]
     ) -> JWT:
         # Exchange token
-        async with ClientSession(headers={"Content-Type": "application/x-www-form-urlencoded"}) as client:
-            data = {
-                "grant_type": "authorization_code",
-                "code": token,
-                "redirect_uri": self.redirect_uri
-            } if grant_type == "authorization_code" else {
-                "grant_type": "refresh_token",
-                "refresh_token": token
-            }
-            data["client_id"] = self.client_id
-            data["client_secret"] = self.client_secret
-            response = await client.post(
-                f"{DISCORD_API}/oauth2/token",
-                data=data,
-            )
-            # Valid failed
-            if response.status != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Authorize failed"
-                )
-            token_data = AccessTokenResponse(
-                **loads(await response.content.read())
+        data = {
+            "grant_type": "authorization_code",
+            "code": token,
+            "redirect_uri": self.redirect_uri
+        } if grant_type == "authorization_code" else {
+            "grant_type": "refresh_token",
+            "refresh_token": token
+        }
+        data["client_id"] = self.client_id
+        data["client_secret"] = self.client_secret
+        status_code, content = await self._send(
+            "POST",
+            f"{self.api_base}/oauth2/token",
+            data=data,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        # Valid failed
+        if status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Authorize failed"
             )
+        token_data = AccessTokenResponse(**loads(content))
 
         if "identify" not in token_data.scope:
             raise HTTPException(
@@ -117,34 +260,50 @@ class DiscordOAuthRouter:
                 detail="Authorize failed"
             )
         # Fetch user data
-        async with ClientSession(headers={"Authorization": f"{token_data.token_type} {token_data.access_token}"}) as client:
-            response = await client.get(
-                f"{DISCORD_API}/users/@me"
-            )
-            user_data = DiscordUser(
-                **loads(await response.content.read())
+        status_code, content = await self._send(
+            "GET",
+            f"{self.api_base}/users/@me",
+            headers={"Authorization": f"{token_data.token_type} {token_data.access_token}"},
+        )
+        if status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Authorize failed"
             )
+        user_data = DiscordUser(**loads(content))
 
         # Save file to local
         storage_data = StorageData(
             token_data=token_data,
             user_data=user_data,
         )
-        async with async_open(join(DISCORD_USER_DIRECTORY, f"{user_data.id}.json"), "wb") as user_file:
-            await user_file.write(dumps(
-                storage_data.model_dump(), option=OPT_INDENT_2
-            ))
+        user_file_path = join(DISCORD_USER_DIRECTORY, f"{user_data.id}.json")
+        await write_json(user_file_path, storage_data.model_dump())
+
+        # Write through profile cache
+        display_user = self._display_user(user_data)
+        self.user_cache.put(
+            user_data.id,
+            UserCache.version(user_file_path),
+            display_user
+        )
 
+        return self._issue_jwt(
+            display_user,
+            datetime.now(tz=timezone.utc),
+            token_data.expires_in
+        )
+
+    def _issue_jwt(
+        self,
+        display_user: DisplayDiscordUser,
+        issued_at: datetime,
+        expires_in: int
+    ) -> JWT:
         # Generate JWT Data
-        utc_now = datetime.now(tz=timezone.utc)
-        display_name = user_data.global_name or user_data.username
-        display_avatar = f"https://cdn.discordapp.com/avatars/{user_data.id}/{user_data.avatar}.png" if user_data.avatar else "https://cdn.discordapp.com/embed/avatars/0.png"
-        jwt_data = JWTData(**user_data.model_dump(), **{
-            "is_admin": user_data.id in self.admins,
-            "display_name": display_name,
-            "display_avatar": display_avatar,
-            "exp": utc_now + timedelta(seconds=token_data.expires_in),
-            "iat": utc_now,
+        jwt_data = JWTData(**display_user.model_dump(), **{
+            "exp": issued_at + timedelta(seconds=expires_in),
+            "iat": issued_at,
         })
 
         # Generate JWT
@@ -157,44 +316,86 @@ class DiscordOAuthRouter:
 
         return JWT(access_token=jwt)
 
-    @staticmethod
-    async def read_local_user(user_id: str, admins: list[str] = []) -> Optional[DisplayDiscordUser]:
-        user_file_path = join(DISCORD_USER_DIRECTORY, f"{user_id}.json")
-        if not isfile(user_file_path):
-            return None
-        async with async_open(user_file_path, "rb") as user_file:
-            storage_data = StorageData(**loads(
-                await user_file.read()
-            ))
-        user_data = storage_data.user_data
-
+    def _display_user(self, user_data: DiscordUser) -> DisplayDiscordUser:
         display_name = user_data.global_name or user_data.username
         display_avatar = f"https://cdn.discordapp.com/avatars/{user_data.id}/{user_data.avatar}.png" if user_data.avatar else "https://cdn.discordapp.com/embed/avatars/0.png"
 
         return DisplayDiscordUser(
-            is_admin=user_data.id in admins,
+            is_admin=user_data.id in self.admins,
             display_name=display_name,
             display_avatar=display_avatar,
             **user_data.model_dump(),
         )
 
+    async def read_local_user(self, user_id: str) -> Optional[DisplayDiscordUser]:
+        user_id = str(user_id)
+        user_file_path = join(DISCORD_USER_DIRECTORY, f"{user_id}.json")
+        version = UserCache.version(user_file_path)
+        if version is None:
+            return None
+        user = self.user_cache.get(user_id, version)
+        if user is not None:
+            return user
+
+        async with async_open(user_file_path, "rb") as user_file:
+            storage_data = StorageData(**loads(
+                await user_file.read()
+            ))
+        user = self._display_user(storage_data.user_data)
+        self.user_cache.put(user_id, version, user)
+        return user
+
+    async def read_local_users(self, user_ids: list[str]) -> list[DisplayDiscordUser]:
+        """
+        Read users in order, unknown users are skipped.
+        """
+        users = await gather(*(
+            self.read_local_user(user_id) for user_id in dict.fromkeys(user_ids)
+        ))
+        return list(filter(lambda user: user is not None, users))
+
     async def valid_token(self, token: HTTPAuthorizationCredentials = Security(security)) -> JWTData:
         jwt = token.credentials
+        # Token verified before, skip decode and validation
+        cache_data = self.token_cache.get(jwt)
+        if cache_data is not None:
+            return cache_data
+
         try:
-            decode_data = JWTData(**decode(
+            payload = decode(
                 jwt=jwt,
                 key=self.key,
                 algorithms=["HS256"],
                 options={
                     "require": ["exp", "iat"]
                 }
-            ))
-            return decode_data
+            )
+            decode_data = JWTData(**payload)
         except:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Invalid authentication credentials"
             )
+        self.token_cache.put(jwt, payload["exp"], decode_data)
+        return decode_data
+
+    async def token_cache_stats(self, token: HTTPAuthorizationCredentials = Security(security)) -> TokenCacheStats:
+        jwt_data = await self.valid_token(token)
+        if not jwt_data.is_admin:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Permission denied"
+            )
+        return self.token_cache.stats()
+
+    async def user_cache_stats(self, token: HTTPAuthorizationCredentials = Security(security)) -> UserCacheStats:
+        jwt_data = await self.valid_token(token)
+        if not jwt_data.is_admin:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Permission denied"
+            )
+        return self.user_cache.stats()
 
     async def oauth(
         self,
@@ -224,11 +425,41 @@ class DiscordOAuthRouter:
         if jwt_data.exp - datetime.now(timezone.utc) > timedelta(days=1):
             return JWT(access_token=jwt)
 
+        # Concurrent refreshes of one user share one exchange, Discord
+        # rotates refresh token so only the first exchange would succeed
+        task = self.refreshing.get(jwt_data.id)
+        if task is None:
+            task = create_task(self._refresh_user(jwt_data.id))
+            self.refreshing[jwt_data.id] = task
+            task.add_done_callback(
+                lambda _: self.refreshing.pop(jwt_data.id, None)
+            )
+        # Shield so one disconnected client does not cancel the others
+        return await shield(task)
+
+    @staticmethod
+    async def _read_storage_data(user_id: str) -> StorageData:
+        async with async_open(join(DISCORD_USER_DIRECTORY, f"{user_id}.json"), "rb") as user_file:
+            return StorageData(**loads(await user_file.read()))
+
+    async def _refresh_user(self, user_id: str) -> JWT:
         # Read User Data
-        async with async_open(join(DISCORD_USER_DIRECTORY, f"{jwt_data.id}.json"), "rb") as user_file:
-            storage_data = StorageData(**loads(await user_file.read()))
+        storage_data = await self._read_storage_data(user_id)
+        refresh_token = storage_data.token_data.refresh_token
 
-        return await self._request_to_discord(
-            token=storage_data.token_data.refresh_token,
-            grant_type="refresh_token"
-        )
+        async with self.user_locks.lock(user_id):
+            # Another worker refreshed while waiting, reuse its new token
+            # instead of sending the rotated refresh token again
+            user_file_path = join(DISCORD_USER_DIRECTORY, f"{user_id}.json")
+            storage_data = await self._read_storage_data(user_id)
+            if storage_data.token_data.refresh_token != refresh_token:
+                return self._issue_jwt(
+                    self._display_user(storage_data.user_data),
+                    datetime.fromtimestamp(getmtime(user_file_path), tz=timezone.utc),
+                    storage_data.token_data.expires_in
+                )
+
+            return await self._request_to_discord(
+                token=refresh_token,
+                grant_type="refresh_token"
+            )
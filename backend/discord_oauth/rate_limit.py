@@ -0,0 +1,79 @@
+from asyncio import Lock, get_event_loop, sleep
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all requests to Discord. `rate` tokens are added
+    per second up to `burst`. When Discord answers 429, `block` pauses the
+    whole bucket until Retry-After has passed, so queued requests wait
+    instead of failing one by one.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = 0.0
+        self.blocked_until = 0.0
+        # Requests in acquire, holding or waiting for lock
+        self.waiting = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def _now() -> float:
+        return get_event_loop().time()
+
+    def _refill(self, now: float) -> None:
+        if self.updated:
+            self.tokens = min(
+                self.burst,
+                self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """
+        Seconds a request queued now would roughly wait, behind every
+        request already queued.
+        """
+        now = self._now()
+        self._refill(now)
+        # Tokens run out after a block, queue drains at rate afterwards
+        wait = max(self.blocked_until - now, 0)
+        return wait + max(self.waiting + 1 - self.tokens, 0) / self.rate
+
+    async def acquire(self) -> None:
+        self.waiting += 1
+        try:
+            # Lock keeps waiters in FIFO order
+            async with self.lock:
+                while True:
+                    now = self._now()
+                    if self.blocked_until > now:
+                        await sleep(self.blocked_until - now)
+                        continue
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    await sleep((1 - self.tokens) / self.rate)
+        finally:
+            self.waiting -= 1
+
+    def block(self, retry_after: float) -> None:
+        self.blocked_until = max(self.blocked_until, self._now() + retry_after)
+        self.tokens = 0
+
+    @staticmethod
+    def parse_retry_after(headers, body: Optional[dict] = None) -> float:
+        """
+        Seconds to wait from a 429 response, Discord sends it in header and
+        `retry_after` of body.
+        """
+        for value in (headers.get("Retry-After"), (body or {}).get("retry_after")):
+            try:
+                return max(float(value), 0)
+            except (TypeError, ValueError):
+                continue
+        return 1.0
@@ -46,3 +46,18 @@ class JWTData(DisplayDiscordUser):
 class JWT(BaseModel):
     token_type: str = "Bearer"
     access_token: str
+
+
+class TokenCacheStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    expired: int
+
+
+class UserCacheStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from hashlib import sha256
+from time import time
+from typing import Optional
+
+from .schemas import JWTData, TokenCacheStats
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified JWTs, keyed by sha256 of the token. An entry
+    lives for at most `ttl` seconds and never beyond the `exp` of its token.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.tokens: OrderedDict[bytes, tuple[float, JWTData]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[JWTData]:
+        key = self._key(token)
+        cache = self.tokens.get(key)
+        if cache is None:
+            self.misses += 1
+            return None
+
+        expire_at, jwt_data = cache
+        if expire_at <= time():
+            del self.tokens[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        self.tokens.move_to_end(key)
+        self.hits += 1
+        return jwt_data
+
+    def put(self, token: str, exp: float, jwt_data: JWTData) -> None:
+        if self.max_size <= 0:
+            return
+        key = self._key(token)
+        self.tokens[key] = (min(exp, time() + self.ttl), jwt_data)
+        self.tokens.move_to_end(key)
+        while len(self.tokens) > self.max_size:
+            self.tokens.popitem(last=False)
+
+    def stats(self) -> TokenCacheStats:
+        return TokenCacheStats(
+            size=len(self.tokens),
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+            expired=self.expired,
+        )
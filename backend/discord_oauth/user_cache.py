@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from os import stat
+from typing import Optional
+
+from .schemas import DisplayDiscordUser, UserCacheStats
+
+Version = tuple[int, int]
+
+
+class UserCache:
+    """
+    Bounded LRU of display user profiles, keyed by user ID. Each entry keeps
+    the (mtime_ns, size) of the user file it was built from, so a profile
+    rewritten by another process is noticed with one `stat`.
+    """
+
+    def __init__(self, max_size: int = 4096) -> None:
+        self.max_size = max_size
+        self.users: OrderedDict[str, tuple[Version, DisplayDiscordUser]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def version(path: str) -> Optional[Version]:
+        try:
+            stat_result = stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat_result.st_mtime_ns, stat_result.st_size)
+
+    def get(self, user_id: str, version: Optional[Version]) -> Optional[DisplayDiscordUser]:
+        cache = self.users.get(user_id)
+        if cache is None or version is None or cache[0] != version:
+            if cache is not None:
+                del self.users[user_id]
+            self.misses += 1
+            return None
+
+        self.users.move_to_end(user_id)
+        self.hits += 1
+        return cache[1]
+
+    def put(self, user_id: str, version: Optional[Version], user: DisplayDiscordUser) -> None:
+        if self.max_size <= 0 or version is None:
+            return
+        self.users[user_id] = (version, user)
+        self.users.move_to_end(user_id)
+        while len(self.users) > self.max_size:
+            self.users.popitem(last=False)
+
+    def stats(self) -> UserCacheStats:
+        return UserCacheStats(
+            size=len(self.users),
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+        )
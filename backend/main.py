@@ -1,10 +1,14 @@
 from asyncio import run
 
-from api import run_api
+from api import run_api, run_api_workers
+from config import WORKERS
 
 async def main():
     await run_api()
 
 
 if __name__ == "__main__":
-    run(main=main())
+    if WORKERS > 1:
+        run_api_workers()
+    else:
+        run(main=main())
@@ -1,18 +1,60 @@
 from pydantic import BaseModel, Field
 
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import Literal, Optional
 
 
 class Ticket(BaseModel):
     ticket_id: str
     author_id: str
     create_utc_timestamp: float = Field(
-        default_factory=datetime.utcnow().timestamp
+        default_factory=lambda: datetime.now(timezone.utc).timestamp()
     )
     files: list[str] = []
+    # Filename to blob ID, empty for tickets uploaded before blob store
+    blobs: dict[str, str] = {}
+    # Filename to content type detected on upload, empty for older tickets
+    content_types: dict[str, str] = {}
     public: bool = False
+    # Term of pack holding files of an old ticket, None while they are on disk
+    pack: Optional[str] = None
 
 
 class TicketUpdate(BaseModel):
     public: Optional[bool] = None
+
+
+class TicketPage(BaseModel):
+    tickets: list[Ticket] = []
+    next_cursor: Optional[str] = None
+
+
+class TicketEvent(BaseModel):
+    event_id: int = 0
+    type: Literal["created", "modified", "deleted"]
+    author_id: str
+    ticket_id: str
+    # Ticket after change, None for deleted
+    ticket: Optional[Ticket] = None
+    public: bool
+    # Public before change, who could see ticket before is told it is gone
+    was_public: bool = Field(default=False, exclude=True)
+    create_utc_timestamp: float = Field(
+        default_factory=lambda: datetime.now(timezone.utc).timestamp()
+    )
+
+
+class FileDiff(BaseModel):
+    filename: str
+    status: Literal["added", "removed", "modified"]
+    # Unified diff, None if a side is not UTF-8 text or is too large
+    diff: Optional[str] = None
+
+
+class TicketDiff(BaseModel):
+    author_id: str
+    from_ticket_id: str
+    to_ticket_id: str
+    files: list[FileDiff] = []
+    # Files with the same content in both tickets
+    unchanged: list[str] = []
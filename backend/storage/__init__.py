@@ -0,0 +1,13 @@
+from .base import TicketStorage
+from .blob import BlobStore
+from .compaction import Compactor
+from .compression import VariantWriter
+from .events import EventLog
+from .filesystem import FileSystemTicketStorage
+from .index import TicketIndex, TicketIndexStats
+from .io import IOExecutor
+from .pack import PackEntry, PackStore, read_entry, term_of
+from .search import SearchHit, SearchIndex, SearchResult, ticket_documents
+from .similarity import SimilarFile, SimilarityIndex, SimilarityResult, SimilarTicket
+from .sqlite import SQLiteTicketStorage
+from .trash import Trash
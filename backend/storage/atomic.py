@@ -0,0 +1,159 @@
+from orjson import dumps, OPT_INDENT_2
+
+from asyncio import Lock, get_event_loop, sleep
+from collections.abc import Hashable
+from contextlib import asynccontextmanager
+from hashlib import sha256
+from os import O_CREAT, O_RDONLY, O_RDWR, close, fsync, makedirs, open as os_open, remove, replace, urandom
+from os.path import dirname, join
+from typing import Any, AsyncIterator, Optional
+
+from .io import IOExecutor
+
+try:
+    from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_UN
+except ImportError:
+    # Windows, file locks are skipped, run single worker only
+    flock = None
+
+MAX_LOCK_POLL_INTERVAL = 0.05
+
+
+class KeyLocks:
+    """
+    One `asyncio.Lock` per key, created on demand and dropped when nobody
+    holds or waits for it, so the table does not grow with every key seen.
+
+    With a directory, the lock also holds across processes: keys are hashed
+    onto `stripes` lock files and the file is `flock`ed while held. Keys
+    sharing a stripe wait for each other, which is rare and harmless as long
+    as a holder never takes a second lock of the same `KeyLocks`.
+    """
+
+    def __init__(self, directory: Optional[str] = None, stripes: int = 256) -> None:
+        self.locks: dict[Hashable, tuple[Lock, int]] = {}
+        self.directory = directory if flock is not None else None
+        self.stripes = stripes
+        if self.directory is not None:
+            makedirs(self.directory, exist_ok=True)
+
+    def _stripe(self, key: Hashable) -> int:
+        digest = sha256(repr(key).encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") % self.stripes
+
+    @asynccontextmanager
+    async def _file_lock(self, stripe: int) -> AsyncIterator[None]:
+        fd = os_open(join(self.directory, f"{stripe}.lock"), O_RDWR | O_CREAT, 0o644)
+        try:
+            # Poll instead of blocking a thread, holders are short
+            delay = 0.001
+            while True:
+                try:
+                    flock(fd, LOCK_EX | LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await sleep(delay)
+                    delay = min(delay * 2, MAX_LOCK_POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                flock(fd, LOCK_UN)
+        finally:
+            close(fd)
+
+    @asynccontextmanager
+    async def lock(self, key: Hashable) -> AsyncIterator[None]:
+        if self.directory is not None:
+            # One holder per stripe in this process, the file lock covers
+            # other processes
+            key = self._stripe(key)
+        lock, users = self.locks.get(key, (None, 0))
+        if lock is None:
+            lock = Lock()
+        self.locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                if self.directory is None:
+                    yield
+                else:
+                    async with self._file_lock(key):
+                        yield
+        finally:
+            lock, users = self.locks[key]
+            if users <= 1:
+                del self.locks[key]
+            else:
+                self.locks[key] = (lock, users - 1)
+
+
+file_locks = KeyLocks()
+
+
+def read_file_sync(path: str) -> bytes:
+    """
+    Content of file at path. Blocking, run in executor.
+    """
+    with open(path, "rb") as source_file:
+        return source_file.read()
+
+
+def write_file_sync(path: str, content: bytes) -> None:
+    """
+    Replace file at path with content. Content goes to a temp file beside
+    it, is fsynced, then renamed over path, readers see either the old or
+    the new file, never a partial one.
+    """
+    temp_path = f"{path}.{urandom(8).hex()}.tmp"
+    try:
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(content)
+            temp_file.flush()
+            fsync(temp_file.fileno())
+        replace(temp_path, path)
+    except:
+        try:
+            remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    # Persist the rename itself
+    directory_fd = os_open(dirname(path) or ".", O_RDONLY)
+    try:
+        fsync(directory_fd)
+    finally:
+        close(directory_fd)
+
+
+async def write_file(
+    path: str,
+    content: bytes,
+    io_executor: Optional[IOExecutor] = None,
+) -> None:
+    """
+    Async `write_file_sync`, writers of the same path are serialized so the
+    last call always wins. Runs on io_executor if given, else on default
+    executor.
+    """
+    async with file_locks.lock(path):
+        if io_executor is not None:
+            await io_executor.run(write_file_sync, path, content)
+            return
+        loop = get_event_loop()
+        await loop.run_in_executor(None, write_file_sync, path, content)
+
+
+async def write_json(
+    path: str,
+    data: Any,
+    indent: bool = False,
+    io_executor: Optional[IOExecutor] = None,
+) -> None:
+    """
+    Atomically write data as JSON, compact unless indent is set.
+    """
+    await write_file(
+        path,
+        dumps(data, option=OPT_INDENT_2 if indent else None),
+        io_executor=io_executor
+    )
@@ -0,0 +1,104 @@
+from abc import ABC, abstractmethod
+from asyncio import gather
+from bisect import bisect_left, bisect_right
+from contextlib import AbstractAsyncContextManager
+from typing import Literal, Optional
+
+from schemas.ticket import Ticket, TicketPage
+
+from .atomic import KeyLocks
+from .index import TicketIndexStats
+
+
+class TicketStorage(ABC):
+    """
+    Storage of ticket metadata. Uploaded files are not handled here, they
+    always stay on disk under the ticket directory.
+    """
+
+    def __init__(self, lock_directory: Optional[str] = None) -> None:
+        # Lock files in lock_directory make ticket locks hold across workers
+        self.locks = KeyLocks(directory=lock_directory)
+
+    def lock(self, user_id: str, ticket_id: str) -> AbstractAsyncContextManager[None]:
+        """
+        Lock of one ticket, hold it across read-modify-write of the ticket so
+        concurrent updates do not overwrite each other.
+        """
+        return self.locks.lock((user_id, ticket_id))
+
+    @abstractmethod
+    async def get(self, user_id: str, ticket_id: str) -> Optional[Ticket]:
+        ...
+
+    @abstractmethod
+    async def list_ids(self, user_id: str) -> list[str]:
+        ...
+
+    @abstractmethod
+    async def query(
+        self,
+        author_ids: Optional[list[str]] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> list[Ticket]:
+        """
+        Get tickets of authors (all authors if None) created in [start, end),
+        sorted by author ID and ticket ID.
+        """
+        ...
+
+    @abstractmethod
+    async def save(self, ticket: Ticket) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, user_id: str, ticket_id: str) -> None:
+        ...
+
+    async def page(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        order: Literal["asc", "desc"] = "desc",
+    ) -> TicketPage:
+        # Ticket ID starts with its create time, so sorting ID is sorting by time
+        ticket_ids = sorted(await self.list_ids(user_id))
+
+        # Cursor is the last ticket ID of previous page
+        if order == "asc":
+            start = 0 if cursor is None else bisect_right(ticket_ids, cursor)
+            page_ids = ticket_ids[start:start + limit]
+            has_next = start + limit < len(ticket_ids)
+        else:
+            end = len(ticket_ids) if cursor is None else bisect_left(ticket_ids, cursor)
+            page_ids = ticket_ids[max(end - limit, 0):end][::-1]
+            has_next = end > limit
+
+        # Read ticket configs concurrently
+        tickets = await gather(*(
+            self.get(user_id, ticket_id) for ticket_id in page_ids
+        ))
+        return TicketPage(
+            tickets=list(filter(lambda ticket: ticket is not None, tickets)),
+            next_cursor=page_ids[-1] if has_next else None,
+        )
+
+    @staticmethod
+    def in_range(
+        ticket: Ticket,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> bool:
+        if start is not None and ticket.create_utc_timestamp < start:
+            return False
+        if end is not None and ticket.create_utc_timestamp >= end:
+            return False
+        return True
+
+    def stats(self) -> Optional[TicketIndexStats]:
+        return None
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,141 @@
+from asyncio import get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs, remove, replace, urandom
+from os.path import isdir, isfile, join
+from sqlite3 import connect, Connection
+from typing import Any, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+# Precompressed copies of a blob by content encoding, stored next to it
+VARIANT_SUFFIXES = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    blob_id TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class BlobStore:
+    """
+    Content-addressed store of uploaded files.
+
+    A blob is saved as `<directory>/<id[:2]>/<id[2:4]>/<id>` where id is the
+    sha256 of its content. Reference counts live in a SQLite database, every
+    change of count and the matching file creation or removal run in one
+    `BEGIN IMMEDIATE` transaction, so they never race, even between
+    processes. Variants of a blob, see `variant_path`, are removed with it.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.temp_directory = join(directory, "temp")
+        if not isdir(self.temp_directory):
+            makedirs(self.temp_directory)
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="blob-sqlite"
+        )
+        self.connection: Connection = self.executor.submit(self._connect).result()
+
+    def _connect(self) -> Connection:
+        connection = connect(join(self.directory, "refs.sqlite"), isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.executescript(SCHEMA)
+        return connection
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    @staticmethod
+    def relative_path(blob_id: str) -> str:
+        return f"{blob_id[:2]}/{blob_id[2:4]}/{blob_id}"
+
+    def path(self, blob_id: str) -> str:
+        return join(self.directory, self.relative_path(blob_id))
+
+    def variant_path(self, blob_id: str, encoding: str) -> str:
+        return self.path(blob_id) + VARIANT_SUFFIXES[encoding]
+
+    def variants(self, blob_id: str) -> list[str]:
+        """
+        Encodings of variants stored for blob. Blocking, run in executor.
+        """
+        return [
+            encoding for encoding in VARIANT_SUFFIXES
+            if isfile(self.variant_path(blob_id, encoding))
+        ]
+
+    def temp_path(self) -> str:
+        return join(self.temp_directory, urandom(16).hex())
+
+    def _add(self, blob_id: str, size: int, temp_path: str) -> None:
+        blob_path = self.path(blob_id)
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.execute(
+                "INSERT INTO blobs (blob_id, size, refs) VALUES (?, ?, 1) "
+                "ON CONFLICT (blob_id) DO UPDATE SET refs = refs + 1",
+                (blob_id, size)
+            )
+            if isfile(blob_path):
+                remove(temp_path)
+            else:
+                makedirs(join(self.directory, blob_id[:2], blob_id[2:4]), exist_ok=True)
+                replace(temp_path, blob_path)
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _release(self, blob_ids: list[str]) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for blob_id in blob_ids:
+                row = self.connection.execute(
+                    "UPDATE blobs SET refs = refs - 1 WHERE blob_id = ? "
+                    "RETURNING refs",
+                    (blob_id,)
+                ).fetchone()
+                if row is None or row[0] > 0:
+                    continue
+                self.connection.execute(
+                    "DELETE FROM blobs WHERE blob_id = ?",
+                    (blob_id,)
+                )
+                for path in (
+                    self.path(blob_id),
+                    *(self.variant_path(blob_id, encoding) for encoding in VARIANT_SUFFIXES),
+                ):
+                    try:
+                        remove(path)
+                    except FileNotFoundError:
+                        pass
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    async def add(self, blob_id: str, size: int, temp_path: str) -> None:
+        """
+        Add a reference to blob, move file at temp_path into the store if the
+        blob is not stored yet. temp_path is consumed on success.
+        """
+        await self._run(self._add, blob_id, size, temp_path)
+
+    async def release(self, blob_ids: Iterable[str]) -> None:
+        """
+        Drop a reference of each blob, remove blobs nobody refers to.
+        """
+        await self._run(self._release, list(blob_ids))
+
+    def close(self) -> None:
+        self.executor.submit(self.connection.close).result()
+        self.executor.shutdown()
@@ -0,0 +1,164 @@
+from asyncio import CancelledError, create_task, sleep, Task
+from os import makedirs
+from os.path import dirname, join
+from shutil import rmtree
+from time import time
+from typing import Any, Awaitable, Callable, Optional
+
+from schemas.ticket import Ticket
+
+from .atomic import write_file_sync
+from .base import TicketStorage
+from .blob import BlobStore
+from .io import IOExecutor
+from .pack import PackStore, read_entry, term_of
+
+
+class Compactor:
+    """
+    Move files of tickets older than `age` seconds into packs, see
+    `PackStore`, so an old ticket stops costing a directory, a `data.json`
+    and a file per upload. Runs every `interval` seconds once started.
+
+    Packing a ticket appends its files to the pack of its term, marks the
+    ticket packed, then releases its blobs and removes its directory. Each
+    step is safe to repeat, a crash in between leaves the ticket readable
+    and it is packed again by the next run. `unpack` puts files back,
+    `on_blob_restored(blob_id, content_type, size)` is awaited for every blob
+    it adds back, e.g. to write compressed variants as upload does.
+    """
+
+    def __init__(
+        self,
+        ticket_storage: TicketStorage,
+        pack_store: PackStore,
+        blob_store: BlobStore,
+        ticket_directory: str,
+        io_executor: IOExecutor,
+        age: float = 180 * 86400,
+        interval: float = 3600,
+        on_blob_restored: Optional[Callable[[str, Optional[str], int], Awaitable[Any]]] = None,
+    ) -> None:
+        self.ticket_storage = ticket_storage
+        self.pack_store = pack_store
+        self.blob_store = blob_store
+        self.ticket_directory = ticket_directory
+        self.io = io_executor
+        self.age = age
+        self.interval = interval
+        self.on_blob_restored = on_blob_restored
+        self.task: Optional[Task] = None
+
+    def _ticket_path(self, ticket: Ticket) -> str:
+        return join(self.ticket_directory, ticket.author_id, ticket.ticket_id)
+
+    def _file_path(self, ticket: Ticket, filename: str) -> str:
+        blob_id = ticket.blobs.get(filename)
+        if blob_id is not None:
+            return self.blob_store.path(blob_id)
+        return join(self._ticket_path(ticket), "data", filename)
+
+    async def pack(self, user_id: str, ticket_id: str) -> bool:
+        """
+        Pack ticket, return False if it is gone or already packed.
+        """
+        async with self.ticket_storage.lock(user_id, ticket_id):
+            ticket = await self.ticket_storage.get(user_id, ticket_id)
+            if ticket is None or ticket.pack is not None:
+                return False
+
+            term = term_of(ticket.create_utc_timestamp)
+            await self.pack_store.add(user_id, ticket_id, term, [
+                (filename, self._file_path(ticket, filename))
+                for filename in ticket.files
+            ])
+            await self.ticket_storage.save(ticket.model_copy(update={"pack": term}))
+            # Packed tickets hold no blob references
+            await self.blob_store.release(ticket.blobs.values())
+            # Legacy files. Cached archives live under their own directory,
+            # keyed by ETag, which packing leaves unchanged
+            await self.io.run(rmtree, self._ticket_path(ticket), ignore_errors=True)
+        return True
+
+    def _extract(self, ticket: Ticket, filename: str, content: bytes) -> None:
+        path = join(self._ticket_path(ticket), "data", filename)
+        makedirs(dirname(path), exist_ok=True)
+        write_file_sync(path, content)
+
+    async def unpack(self, user_id: str, ticket_id: str) -> bool:
+        """
+        Put files of packed ticket back to blob store or its directory as
+        before packing, return False if it is gone or not packed.
+        """
+        async with self.ticket_storage.lock(user_id, ticket_id):
+            ticket = await self.ticket_storage.get(user_id, ticket_id)
+            if ticket is None or ticket.pack is None:
+                return False
+
+            entries = await self.pack_store.entries(user_id, ticket_id)
+            for filename in ticket.files:
+                entry = entries.get(filename)
+                if entry is None:
+                    continue
+                content = await self.io.run(read_entry, entry)
+                blob_id = ticket.blobs.get(filename)
+                if blob_id is None:
+                    await self.io.run(self._extract, ticket, filename, content)
+                    continue
+                temp_path = self.blob_store.temp_path()
+                await self.io.run(write_file_sync, temp_path, content)
+                await self.blob_store.add(blob_id, len(content), temp_path)
+                if self.on_blob_restored is not None:
+                    await self.on_blob_restored(
+                        blob_id,
+                        ticket.content_types.get(filename),
+                        len(content)
+                    )
+
+            # A crash before this leaks blob references, which is harmless
+            await self.ticket_storage.save(ticket.model_copy(update={"pack": None}))
+            await self.pack_store.remove(user_id, ticket_id)
+        return True
+
+    async def run_once(self) -> int:
+        """
+        Pack every ticket older than age and vacuum packs, return number of
+        tickets packed.
+        """
+        tickets = await self.ticket_storage.query(end=time() - self.age)
+        packed = 0
+        for ticket in tickets:
+            if ticket.pack is not None:
+                continue
+            try:
+                if await self.pack(ticket.author_id, ticket.ticket_id):
+                    packed += 1
+            except OSError:
+                # Missing or unreadable file, ticket stays on disk
+                continue
+        await self.pack_store.vacuum()
+        return packed
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except CancelledError:
+                raise
+            except Exception:
+                pass
+            await sleep(self.interval)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except CancelledError:
+            pass
+        self.task = None
@@ -0,0 +1,108 @@
+from gzip import compress as gzip_compress
+from typing import Callable, NamedTuple, Optional
+
+try:
+    from brotli import compress as brotli_compress
+except ImportError:
+    brotli_compress = None
+try:
+    from zstandard import ZstdCompressor
+except ImportError:
+    ZstdCompressor = None
+
+from .atomic import write_file_sync
+from .blob import BlobStore
+from .io import IOExecutor
+
+# Variant is dropped if it saves less than this ratio of original size
+MIN_SAVING_RATIO = 0.1
+
+
+class Codec(NamedTuple):
+    compress: Callable[[bytes, int], bytes]
+    # Level used per response, and level used once for stored variants
+    dynamic_level: int
+    static_level: int
+
+
+def _gzip(data: bytes, level: int) -> bytes:
+    # Fixed mtime, same input always gives same bytes
+    return gzip_compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data: bytes, level: int) -> bytes:
+    return brotli_compress(data, quality=level)
+
+
+def _zstd(data: bytes, level: int) -> bytes:
+    # Compressor is not thread safe, create one per call
+    return ZstdCompressor(level=level).compress(data)
+
+
+# Available encodings, in order of preference when client q values tie
+CODECS: dict[str, Codec] = {}
+if ZstdCompressor is not None:
+    CODECS["zstd"] = Codec(_zstd, 3, 12)
+if brotli_compress is not None:
+    CODECS["br"] = Codec(_brotli, 4, 9)
+CODECS["gzip"] = Codec(_gzip, 6, 9)
+
+
+def write_variants(
+    path: str,
+    variant_path: Callable[[str], str],
+    write: Callable[[str, bytes], None],
+) -> list[str]:
+    """
+    Compress file at path with every available encoding at static level,
+    write variants worth keeping by `write(variant_path(encoding), data)`.
+    Blocking, run in executor. Return encodings written.
+    """
+    with open(path, "rb") as source_file:
+        data = source_file.read()
+    written = []
+    for encoding, codec in CODECS.items():
+        compressed = codec.compress(data, codec.static_level)
+        if len(compressed) > len(data) * (1 - MIN_SAVING_RATIO):
+            continue
+        write(variant_path(encoding), compressed)
+        written.append(encoding)
+    return written
+
+
+class VariantWriter:
+    """
+    Store compressed variants of text blobs of at least `min_size` bytes
+    next to them, see `BlobStore.variant_path`, so views send them as is
+    instead of compressing on every response. Does nothing unless enabled.
+    """
+
+    def __init__(
+        self,
+        blob_store: BlobStore,
+        io_executor: IOExecutor,
+        enabled: bool = True,
+        min_size: int = 1024,
+    ) -> None:
+        self.blob_store = blob_store
+        self.io = io_executor
+        self.enabled = enabled
+        self.min_size = min_size
+
+    async def write(self, blob_id: str, content_type: Optional[str], size: int) -> list[str]:
+        """
+        Write variants of blob if it is text, return encodings written.
+        """
+        if not self.enabled or content_type is None or not content_type.startswith("text/") \
+                or size < self.min_size:
+            return []
+        try:
+            return await self.io.run(
+                write_variants,
+                self.blob_store.path(blob_id),
+                lambda encoding: self.blob_store.variant_path(blob_id, encoding),
+                write_file_sync,
+            )
+        except OSError:
+            # Blob is served uncompressed
+            return []
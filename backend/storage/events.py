@@ -0,0 +1,106 @@
+from orjson import dumps, loads
+
+from asyncio import get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs
+from os.path import dirname, isdir
+from sqlite3 import connect, Connection
+from typing import Any, Callable, Optional, TypeVar
+
+from schemas.ticket import TicketEvent
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    was_public INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+
+class EventLog:
+    """
+    Append-only log of ticket events in SQLite, shared by every worker.
+
+    Event IDs only grow, so a client resumes by passing the last ID it saw.
+    The newest `retention` events are kept, a client behind that has to
+    reload its list.
+    """
+
+    def __init__(self, path: str, retention: int = 10000) -> None:
+        self.path = path
+        self.retention = retention
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="event-sqlite"
+        )
+        self.connection: Connection = self.executor.submit(self._connect).result()
+
+    def _connect(self) -> Connection:
+        directory = dirname(self.path)
+        if directory and not isdir(directory):
+            makedirs(directory)
+        connection = connect(self.path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.executescript(SCHEMA)
+        return connection
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _append(self, event: TicketEvent) -> int:
+        event_id = self.connection.execute(
+            "INSERT INTO events (was_public, data) VALUES (?, ?)",
+            (event.was_public, dumps(event.model_dump(exclude={"event_id"})))
+        ).lastrowid
+        self.connection.execute(
+            "DELETE FROM events WHERE event_id <= ?",
+            (event_id - self.retention,)
+        )
+        return event_id
+
+    def _read_after(self, event_id: int, limit: int) -> list[TicketEvent]:
+        return [
+            TicketEvent(**loads(data), event_id=row_id, was_public=was_public)
+            for row_id, was_public, data in self.connection.execute(
+                "SELECT event_id, was_public, data FROM events "
+                "WHERE event_id > ? ORDER BY event_id LIMIT ?",
+                (event_id, limit)
+            )
+        ]
+
+    def _bounds(self) -> tuple[Optional[int], int]:
+        first_id, last_id = self.connection.execute(
+            "SELECT MIN(event_id), MAX(event_id) FROM events"
+        ).fetchone()
+        if last_id is None:
+            # Log is empty, but IDs are never reused, continue from sequence
+            row = self.connection.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'events'"
+            ).fetchone()
+            last_id = 0 if row is None else row[0]
+        return first_id, last_id
+
+    async def append(self, event: TicketEvent) -> int:
+        """
+        Append event and return its ID.
+        """
+        return await self._run(self._append, event)
+
+    async def read_after(self, event_id: int, limit: int = 100) -> list[TicketEvent]:
+        return await self._run(self._read_after, event_id, limit)
+
+    async def bounds(self) -> tuple[Optional[int], int]:
+        """
+        (ID of oldest kept event or None if log is empty, ID of newest event)
+        """
+        return await self._run(self._bounds)
+
+    def close(self) -> None:
+        self.executor.submit(self.connection.close).result()
+        self.executor.shutdown()
@@ -0,0 +1,145 @@
+from asyncio import gather
+from os import listdir, makedirs, remove
+from os.path import isdir, join
+from typing import Literal, Optional
+
+from schemas.ticket import Ticket, TicketPage
+
+from .atomic import write_json
+from .base import TicketStorage
+from .index import TicketIndex, TicketIndexStats
+from .io import IOExecutor
+
+
+class FileSystemTicketStorage(TicketStorage):
+    """
+    Keep ticket metadata in `<directory>/<user_id>/<ticket_id>/data.json`,
+    reads are served by a `TicketIndex`.
+
+    Packed tickets have no directory, their metadata is kept by
+    `packed_storage` instead.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        cache_size: int = 4096,
+        lock_directory: Optional[str] = None,
+        io_executor: Optional[IOExecutor] = None,
+        packed_storage: Optional[TicketStorage] = None,
+    ) -> None:
+        super().__init__(lock_directory=lock_directory)
+        self.directory = directory
+        self.io = io_executor or IOExecutor()
+        self.index = TicketIndex(
+            directory=directory,
+            max_size=cache_size,
+            io_executor=self.io
+        )
+        self.packed = packed_storage
+
+    def _list_authors(self) -> list[str]:
+        return list(filter(
+            lambda user_id: isdir(join(self.directory, user_id)),
+            listdir(self.directory)
+        ))
+
+    async def get(self, user_id: str, ticket_id: str) -> Optional[Ticket]:
+        ticket = await self.index.get(user_id, ticket_id)
+        if ticket is None and self.packed is not None:
+            ticket = await self.packed.get(user_id, ticket_id)
+        return ticket
+
+    async def list_ids(self, user_id: str) -> list[str]:
+        ticket_ids = await self.index.list_ids(user_id)
+        if self.packed is None:
+            return ticket_ids
+        return list(set(ticket_ids).union(await self.packed.list_ids(user_id)))
+
+    async def page(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        order: Literal["asc", "desc"] = "desc",
+    ) -> TicketPage:
+        # Both sources are sorted by ticket ID, merge a page of each
+        index_ids, has_next = await self.index.page_ids(user_id, limit, cursor, order)
+        packed_tickets: dict[str, Ticket] = {}
+        if self.packed is not None:
+            packed_page = await self.packed.page(user_id, limit, cursor, order)
+            packed_tickets = {ticket.ticket_id: ticket for ticket in packed_page.tickets}
+            has_next = has_next or packed_page.next_cursor is not None
+
+        page_ids = sorted(set(index_ids).union(packed_tickets), reverse=order == "desc")
+        has_next = has_next or len(page_ids) > limit
+        page_ids = page_ids[:limit]
+
+        async def get(ticket_id: str) -> Optional[Ticket]:
+            ticket = await self.index.get(user_id, ticket_id)
+            return packed_tickets.get(ticket_id) if ticket is None else ticket
+
+        tickets = await gather(*(get(ticket_id) for ticket_id in page_ids))
+        return TicketPage(
+            tickets=list(filter(lambda ticket: ticket is not None, tickets)),
+            next_cursor=page_ids[-1] if has_next else None,
+        )
+
+    async def query(
+        self,
+        author_ids: Optional[list[str]] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> list[Ticket]:
+        if author_ids is None:
+            author_ids = await self.io.run(self._list_authors)
+
+        tickets: list[Ticket] = []
+        for author_id in sorted(set(author_ids)):
+            ticket_ids = sorted(await self.list_ids(author_id))
+            author_tickets = await gather(*(
+                self.get(author_id, ticket_id) for ticket_id in ticket_ids
+            ))
+            tickets.extend(filter(
+                lambda ticket: ticket is not None and self.in_range(ticket, start, end),
+                author_tickets
+            ))
+        return tickets
+
+    async def _remove_data_file(self, user_id: str, ticket_id: str) -> None:
+        try:
+            await self.io.run(remove, join(self.directory, user_id, ticket_id, "data.json"))
+        except FileNotFoundError:
+            pass
+        await self.index.discard(user_id, ticket_id)
+
+    async def save(self, ticket: Ticket) -> None:
+        if ticket.pack is not None and self.packed is not None:
+            # Save before remove, a crash between leaves the ticket unpacked
+            await self.packed.save(ticket)
+            await self._remove_data_file(ticket.author_id, ticket.ticket_id)
+            return
+
+        ticket_directory = join(self.directory, ticket.author_id, ticket.ticket_id)
+        await self.io.run(makedirs, ticket_directory, exist_ok=True)
+        await write_json(
+            join(ticket_directory, "data.json"),
+            ticket.model_dump(),
+            io_executor=self.io
+        )
+        await self.index.put(ticket)
+        if self.packed is not None:
+            # Ticket may just be unpacked
+            await self.packed.delete(ticket.author_id, ticket.ticket_id)
+
+    async def delete(self, user_id: str, ticket_id: str) -> None:
+        await self._remove_data_file(user_id, ticket_id)
+        if self.packed is not None:
+            await self.packed.delete(user_id, ticket_id)
+
+    def stats(self) -> Optional[TicketIndexStats]:
+        return self.index.stats()
+
+    def close(self) -> None:
+        if self.packed is not None:
+            self.packed.close()
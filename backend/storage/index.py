@@ -0,0 +1,196 @@
+from orjson import loads
+from pydantic import BaseModel
+
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from os import listdir, stat
+from os.path import join
+from typing import Literal, Optional
+
+from schemas.ticket import Ticket
+
+from .io import IOExecutor
+
+# (st_mtime_ns, st_size) of a file, used to detect edits from outside
+FileVersion = tuple[int, int]
+
+
+class TicketIndexStats(BaseModel):
+    size: int
+    max_size: int
+    users: int
+    hits: int
+    misses: int
+    list_hits: int
+    list_misses: int
+
+
+class TicketIndex:
+    """
+    Process-wide cache of parsed ticket data.
+
+    Tickets are kept in a bounded LRU keyed by (user_id, ticket_id), sorted
+    ticket ID lists are kept per user, so a page is a bisect. Every lookup
+    compares the cached version with the current mtime and size of the file
+    or directory, so edits made outside this process are picked up on next
+    access. Writers in this process should call `put` and `discard` after
+    touching the disk.
+
+    Every stat and read runs on the I/O executor, never on the event loop.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_size: int = 4096,
+        io_executor: Optional[IOExecutor] = None,
+    ) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.io = io_executor or IOExecutor()
+
+        self.tickets: OrderedDict[
+            tuple[str, str],
+            tuple[FileVersion, Ticket]
+        ] = OrderedDict()
+        self.user_tickets: dict[str, tuple[FileVersion, list[str]]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.list_hits = 0
+        self.list_misses = 0
+
+    @staticmethod
+    def _stat_version(path: str) -> Optional[FileVersion]:
+        try:
+            file_stat = stat(path)
+        except OSError:
+            return None
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    async def _version(self, path: str) -> Optional[FileVersion]:
+        return await self.io.run(self._stat_version, path)
+
+    @staticmethod
+    def _read_ticket(path: str) -> Ticket:
+        with open(path, "rb") as data_file:
+            return Ticket(**loads(data_file.read()))
+
+    def _data_file_path(self, user_id: str, ticket_id: str) -> str:
+        return join(self.directory, user_id, ticket_id, "data.json")
+
+    def _store(
+        self,
+        key: tuple[str, str],
+        version: FileVersion,
+        ticket: Ticket
+    ) -> None:
+        self.tickets[key] = (version, ticket)
+        self.tickets.move_to_end(key)
+        while len(self.tickets) > self.max_size:
+            self.tickets.popitem(last=False)
+
+    async def get(self, user_id: str, ticket_id: str) -> Optional[Ticket]:
+        key = (user_id, ticket_id)
+        data_file_path = self._data_file_path(user_id, ticket_id)
+        version = await self._version(data_file_path)
+        if version is None:
+            self.tickets.pop(key, None)
+            return None
+
+        cache = self.tickets.get(key)
+        if cache is not None and cache[0] == version:
+            self.tickets.move_to_end(key)
+            self.hits += 1
+            return cache[1]
+
+        self.misses += 1
+        try:
+            ticket = await self.io.run(self._read_ticket, data_file_path)
+        except:
+            return None
+        self._store(key, version, ticket)
+        return ticket
+
+    async def put(self, ticket: Ticket) -> None:
+        user_id, ticket_id = ticket.author_id, ticket.ticket_id
+        version = await self._version(self._data_file_path(user_id, ticket_id))
+        if version is None:
+            await self.discard(user_id, ticket_id)
+            return
+        self._store((user_id, ticket_id), version, ticket)
+        if not self._has_id(user_id, ticket_id):
+            self._drop_ids(user_id)
+
+    async def discard(self, user_id: str, ticket_id: str) -> None:
+        self.tickets.pop((user_id, ticket_id), None)
+        if self._has_id(user_id, ticket_id):
+            self._drop_ids(user_id)
+
+    def _has_id(self, user_id: str, ticket_id: str) -> bool:
+        user_cache = self.user_tickets.get(user_id)
+        if user_cache is None:
+            return False
+        ticket_ids = user_cache[1]
+        position = bisect_left(ticket_ids, ticket_id)
+        return position < len(ticket_ids) and ticket_ids[position] == ticket_id
+
+    def _drop_ids(self, user_id: str) -> None:
+        # Listed again on next access. Patching the list and stamping it with
+        # a fresh stat would hide writes other workers made in between.
+        self.user_tickets.pop(user_id, None)
+
+    async def _sorted_ids(self, user_id: str) -> list[str]:
+        # Cached list itself, callers must not modify it
+        user_directory = join(self.directory, user_id)
+        version = await self._version(user_directory)
+        if version is None:
+            self.user_tickets.pop(user_id, None)
+            return []
+
+        user_cache = self.user_tickets.get(user_id)
+        if user_cache is not None and user_cache[0] == version:
+            self.list_hits += 1
+            return user_cache[1]
+
+        self.list_misses += 1
+        try:
+            ticket_ids = sorted(await self.io.run(listdir, user_directory))
+        except OSError:
+            return []
+        self.user_tickets[user_id] = (version, ticket_ids)
+        return ticket_ids
+
+    async def list_ids(self, user_id: str) -> list[str]:
+        return list(await self._sorted_ids(user_id))
+
+    async def page_ids(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        order: Literal["asc", "desc"] = "desc",
+    ) -> tuple[list[str], bool]:
+        """
+        Up to limit ticket IDs after cursor in order, and whether more follow.
+        Cursor is the last ticket ID of previous page, as in
+        `TicketStorage.page`. IDs are sorted only when the user directory
+        changed outside this process, otherwise a page costs a bisect.
+        """
+        ticket_ids = await self._sorted_ids(user_id)
+        if order == "asc":
+            start = 0 if cursor is None else bisect_right(ticket_ids, cursor)
+            return ticket_ids[start:start + limit], start + limit < len(ticket_ids)
+        end = len(ticket_ids) if cursor is None else bisect_left(ticket_ids, cursor)
+        return ticket_ids[max(end - limit, 0):end][::-1], end > limit
+
+    def stats(self) -> TicketIndexStats:
+        return TicketIndexStats(
+            size=len(self.tickets),
+            max_size=self.max_size,
+            users=len(self.user_tickets),
+            hits=self.hits,
+            misses=self.misses,
+            list_hits=self.list_hits,
+            list_misses=self.list_misses,
+        )
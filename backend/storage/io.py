@@ -0,0 +1,27 @@
+from asyncio import get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class IOExecutor:
+    """
+    Bounded thread pool for blocking filesystem calls. Keeping them off the
+    default executor means a slow disk can only tie up `max_workers`
+    threads, requests using the default executor keep going.
+    """
+
+    def __init__(self, max_workers: int = 4) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="ticket-io"
+        )
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = get_event_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def close(self) -> None:
+        self.executor.shutdown()
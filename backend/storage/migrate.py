@@ -0,0 +1,82 @@
+"""
+Import ticket metadata from `data.json` files, and of packed tickets, into
+SQLite ticket storage.
+
+Run from backend directory: `python -m storage.migrate`
+"""
+from orjson import loads
+
+from asyncio import run
+from os import listdir
+from os.path import isdir, isfile, join
+from typing import Optional
+
+from config import TICKET_SQLITE_PATH, TICKET_STORAGE
+from schemas.ticket import Ticket
+
+from .base import TicketStorage
+from .filesystem import FileSystemTicketStorage
+from .io import IOExecutor
+from .sqlite import SQLiteTicketStorage
+
+TICKET_DIRECTORY = "data/tickets"
+PACK_DIRECTORY = "data/packs"
+BATCH_SIZE = 500
+
+
+def open_ticket_storage(
+    lock_directory: Optional[str] = None,
+    io_executor: Optional[IOExecutor] = None,
+) -> TicketStorage:
+    """
+    Ticket storage of configured type as the server opens it, so packed
+    tickets are listed too.
+    """
+    if TICKET_STORAGE == "sqlite":
+        return SQLiteTicketStorage(TICKET_SQLITE_PATH, lock_directory=lock_directory)
+    return FileSystemTicketStorage(
+        TICKET_DIRECTORY,
+        lock_directory=lock_directory,
+        io_executor=io_executor,
+        packed_storage=SQLiteTicketStorage(join(PACK_DIRECTORY, "tickets.sqlite"))
+    )
+
+
+def read_all_tickets(directory: str) -> list[Ticket]:
+    """
+    Tickets of `data.json` files, packed tickets have none, see
+    `open_ticket_storage`.
+    """
+    tickets = []
+    for user_id in listdir(directory):
+        user_directory = join(directory, user_id)
+        if not isdir(user_directory):
+            continue
+        for ticket_id in listdir(user_directory):
+            data_file_path = join(user_directory, ticket_id, "data.json")
+            if not isfile(data_file_path):
+                continue
+            try:
+                with open(data_file_path, "rb") as data_file:
+                    tickets.append(Ticket(**loads(data_file.read())))
+            except:
+                print(f"Skip broken ticket: {data_file_path}")
+    return tickets
+
+
+async def main():
+    storage = SQLiteTicketStorage(TICKET_SQLITE_PATH)
+    tickets = read_all_tickets(TICKET_DIRECTORY)
+    packed_path = join(PACK_DIRECTORY, "tickets.sqlite")
+    if isfile(packed_path):
+        packed_storage = SQLiteTicketStorage(packed_path)
+        tickets.extend(await packed_storage.query())
+        packed_storage.close()
+    for i in range(0, len(tickets), BATCH_SIZE):
+        await storage.save_many(tickets[i:i + BATCH_SIZE])
+    storage.close()
+    print(f"Imported {len(tickets)} tickets into {TICKET_SQLITE_PATH}")
+
+
+if __name__ == "__main__":
+    run(main=main())
@@ -0,0 +1,430 @@
+from asyncio import get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from hashlib import sha256
+from os import fsync, makedirs, O_CREAT, O_RDWR, open as os_open, remove, replace, urandom
+from os.path import isdir, join
+from sqlite3 import connect, Connection
+from time import time
+from typing import Any, Callable, NamedTuple, Optional, TypeVar, Union
+
+from .atomic import KeyLocks
+from .io import IOExecutor
+
+T = TypeVar("T")
+
+CHUNK_SIZE = 64 * 1024
+# A pack is rewritten once removed entries take this share of it
+VACUUM_RATIO = 0.5
+# Seconds a replaced pack file is kept for readers which looked it up
+# before the replace
+STALE_GRACE = 600
+
+# One pack per author per term, `size` is the end of committed entries,
+# appends go after it. `generation` changes when a pack is rewritten, so
+# the rewritten file gets a new name and readers of the old one keep going.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packs (
+    author_id TEXT NOT NULL,
+    term TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    dead INTEGER NOT NULL,
+    PRIMARY KEY (author_id, term)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    author_id TEXT NOT NULL,
+    ticket_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    term TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (author_id, ticket_id, filename)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_term ON files (author_id, term);
+CREATE TABLE IF NOT EXISTS stale (
+    path TEXT PRIMARY KEY,
+    superseded REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class PackEntry(NamedTuple):
+    path: str
+    offset: int
+    size: int
+    # sha256 of content, same as blob ID
+    digest: str
+
+
+# Path of a file, or entry of a packed file
+Source = Union[str, PackEntry]
+
+
+def term_of(timestamp: float) -> str:
+    """
+    School term of a UTC timestamp, spring is February to July and fall is
+    August to January, so January 2025 is in "2024-fall".
+    """
+    date = datetime.fromtimestamp(timestamp, timezone.utc)
+    if date.month >= 8:
+        return f"{date.year}-fall"
+    if date.month == 1:
+        return f"{date.year - 1}-fall"
+    return f"{date.year}-spring"
+
+
+def read_entry(entry: PackEntry) -> bytes:
+    """
+    Content of a packed file. Blocking, run in executor.
+    """
+    with open(entry.path, "rb") as pack_file:
+        pack_file.seek(entry.offset)
+        return pack_file.read(entry.size)
+
+
+def read_source(source: Source, max_size: int) -> bytes:
+    """
+    Up to max_size bytes of a file or packed file. Blocking, run in executor.
+    """
+    if isinstance(source, PackEntry):
+        with open(source.path, "rb") as pack_file:
+            pack_file.seek(source.offset)
+            return pack_file.read(min(source.size, max_size))
+    with open(source, "rb") as source_file:
+        return source_file.read(max_size)
+
+
+def _append(
+    path: str,
+    offset: int,
+    sources: list[tuple[str, str]],
+) -> tuple[list[tuple[str, int, int, str]], int]:
+    # Bytes after offset are not committed, a crashed append left them
+    fd = os_open(path, O_RDWR | O_CREAT, 0o644)
+    with open(fd, "r+b") as pack_file:
+        pack_file.seek(offset)
+        files = []
+        for filename, source_path in sources:
+            start = pack_file.tell()
+            digest = sha256()
+            with open(source_path, "rb") as source_file:
+                while chunk := source_file.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    pack_file.write(chunk)
+            files.append((filename, start, pack_file.tell() - start, digest.hexdigest()))
+        end = pack_file.tell()
+        pack_file.truncate()
+        pack_file.flush()
+        fsync(pack_file.fileno())
+    return files, end
+
+
+def _copy_live(
+    old_path: str,
+    new_path: str,
+    entries: list[tuple[str, str, int, int]],
+) -> tuple[list[tuple[str, str, int, int]], int]:
+    temp_path = f"{new_path}.{urandom(8).hex()}.tmp"
+    moved = []
+    try:
+        with open(old_path, "rb") as old_file, open(temp_path, "wb") as new_file:
+            for ticket_id, filename, offset, size in entries:
+                old_file.seek(offset)
+                moved.append((ticket_id, filename, offset, new_file.tell()))
+                remain = size
+                while remain > 0:
+                    chunk = old_file.read(min(CHUNK_SIZE, remain))
+                    if not chunk:
+                        raise OSError(f"Pack is truncated: {old_path}")
+                    new_file.write(chunk)
+                    remain -= len(chunk)
+            end = new_file.tell()
+            new_file.flush()
+            fsync(new_file.fileno())
+        replace(temp_path, new_path)
+    except:
+        try:
+            remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return moved, end
+
+
+class PackStore:
+    """
+    Files of cold tickets, concatenated into one pack file per author per
+    term under `<directory>/<author_id>/`.
+
+    The offset table lives in SQLite: a file is one row of pack, offset and
+    size, so reading it is one lookup and one seek. Packs are append-only,
+    an entry is committed after its bytes are fsynced and readers only ever
+    see committed entries. Removing a ticket only drops its rows, `vacuum`
+    rewrites packs mostly made of removed bytes into a new file.
+
+    Appends and rewrites of a pack hold its lock, which holds across
+    processes with a lock directory.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        lock_directory: Optional[str] = None,
+        io_executor: Optional[IOExecutor] = None,
+    ) -> None:
+        self.directory = directory
+        if not isdir(directory):
+            makedirs(directory, exist_ok=True)
+        self.locks = KeyLocks(directory=lock_directory)
+        self.io = io_executor or IOExecutor()
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="pack-sqlite"
+        )
+        self.connection: Connection = self.executor.submit(self._connect).result()
+
+    def _connect(self) -> Connection:
+        connection = connect(join(self.directory, "packs.sqlite"), isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.executescript(SCHEMA)
+        return connection
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def path(self, author_id: str, term: str, generation: int) -> str:
+        return join(self.directory, author_id, f"{term}.{generation}.pack")
+
+    def _pack(self, author_id: str, term: str) -> Optional[tuple[int, int]]:
+        return self.connection.execute(
+            "SELECT generation, size FROM packs WHERE author_id = ? AND term = ?",
+            (author_id, term)
+        ).fetchone()
+
+    def _drop_files(self, author_id: str, ticket_id: str) -> bool:
+        # Rows of ticket are gone, their bytes count as dead until vacuum
+        rows = self.connection.execute(
+            "DELETE FROM files WHERE author_id = ? AND ticket_id = ? "
+            "RETURNING term, size",
+            (author_id, ticket_id)
+        ).fetchall()
+        for term, size in rows:
+            self.connection.execute(
+                "UPDATE packs SET dead = dead + ? WHERE author_id = ? AND term = ?",
+                (size, author_id, term)
+            )
+        return len(rows) > 0
+
+    def _commit_add(
+        self,
+        author_id: str,
+        ticket_id: str,
+        term: str,
+        generation: int,
+        size: int,
+        files: list[tuple[str, int, int, str]],
+    ) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._drop_files(author_id, ticket_id)
+            self.connection.execute(
+                "INSERT INTO packs (author_id, term, generation, size, dead) "
+                "VALUES (?, ?, ?, ?, 0) "
+                "ON CONFLICT (author_id, term) DO UPDATE SET size = excluded.size",
+                (author_id, term, generation, size)
+            )
+            self.connection.executemany(
+                "INSERT INTO files "
+                "(author_id, ticket_id, filename, term, offset, size, digest) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (author_id, ticket_id, filename, term, offset, file_size, digest)
+                    for filename, offset, file_size, digest in files
+                ]
+            )
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _remove(self, author_id: str, ticket_id: str) -> bool:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            removed = self._drop_files(author_id, ticket_id)
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    def _entries(self, author_id: str, ticket_id: str) -> dict[str, PackEntry]:
+        return {
+            filename: PackEntry(
+                path=self.path(author_id, term, generation),
+                offset=offset,
+                size=size,
+                digest=digest,
+            )
+            for filename, term, generation, offset, size, digest in self.connection.execute(
+                "SELECT filename, term, generation, offset, files.size, digest "
+                "FROM files JOIN packs USING (author_id, term) "
+                "WHERE author_id = ? AND ticket_id = ?",
+                (author_id, ticket_id)
+            )
+        }
+
+    def _tickets(self, author_id: Optional[str], term: Optional[str]) -> list[tuple[str, str]]:
+        conditions, params = [], []
+        if author_id is not None:
+            conditions.append("author_id = ?")
+            params.append(author_id)
+        if term is not None:
+            conditions.append("term = ?")
+            params.append(term)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.connection.execute(
+            f"SELECT DISTINCT author_id, ticket_id FROM files {where} "
+            "ORDER BY author_id, ticket_id",
+            params
+        ).fetchall()
+
+    def _sparse_packs(self) -> list[tuple[str, str]]:
+        return self.connection.execute(
+            "SELECT author_id, term FROM packs WHERE size > 0 AND dead >= size * ?",
+            (VACUUM_RATIO,)
+        ).fetchall()
+
+    def _live_files(self, author_id: str, term: str) -> list[tuple[str, str, int, int]]:
+        return self.connection.execute(
+            "SELECT ticket_id, filename, offset, size FROM files "
+            "WHERE author_id = ? AND term = ? ORDER BY offset",
+            (author_id, term)
+        ).fetchall()
+
+    def _commit_vacuum(
+        self,
+        author_id: str,
+        term: str,
+        generation: int,
+        size: int,
+        moved: list[tuple[str, str, int, int]],
+    ) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Entries removed while copying match no row, their bytes stay
+            # dead in the new file
+            for ticket_id, filename, old_offset, new_offset in moved:
+                self.connection.execute(
+                    "UPDATE files SET offset = ? WHERE author_id = ? AND "
+                    "ticket_id = ? AND filename = ? AND term = ? AND offset = ?",
+                    (new_offset, author_id, ticket_id, filename, term, old_offset)
+                )
+            live_size = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM files WHERE author_id = ? AND term = ?",
+                (author_id, term)
+            ).fetchone()[0]
+            self.connection.execute(
+                "UPDATE packs SET generation = ?, size = ?, dead = ? "
+                "WHERE author_id = ? AND term = ?",
+                (generation + 1, size, size - live_size, author_id, term)
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO stale (path, superseded) VALUES (?, ?)",
+                (self.path(author_id, term, generation), time())
+            )
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _take_stale(self, before: float) -> list[str]:
+        return [row[0] for row in self.connection.execute(
+            "DELETE FROM stale WHERE superseded < ? RETURNING path",
+            (before,)
+        ).fetchall()]
+
+    async def add(
+        self,
+        author_id: str,
+        ticket_id: str,
+        term: str,
+        sources: list[tuple[str, str]],
+    ) -> None:
+        """
+        Append files of ticket to its pack of term, sources are (filename,
+        path). Entries already packed for ticket are replaced.
+        """
+        async with self.locks.lock((author_id, term)):
+            pack = await self._run(self._pack, author_id, term)
+            generation, offset = (0, 0) if pack is None else pack
+            await self.io.run(makedirs, join(self.directory, author_id), exist_ok=True)
+            files, size = await self.io.run(
+                _append, self.path(author_id, term, generation), offset, sources
+            )
+            await self._run(
+                self._commit_add, author_id, ticket_id, term, generation, size, files
+            )
+
+    async def remove(self, author_id: str, ticket_id: str) -> bool:
+        """
+        Drop packed files of ticket, return False if it had none. Space is
+        given back by `vacuum`.
+        """
+        return await self._run(self._remove, author_id, ticket_id)
+
+    async def entries(self, author_id: str, ticket_id: str) -> dict[str, PackEntry]:
+        """
+        Filename to location of each packed file of ticket.
+        """
+        return await self._run(self._entries, author_id, ticket_id)
+
+    async def tickets(
+        self,
+        author_id: Optional[str] = None,
+        term: Optional[str] = None,
+    ) -> list[tuple[str, str]]:
+        """
+        (author_id, ticket_id) of packed tickets, filtered by author and term.
+        """
+        return await self._run(self._tickets, author_id, term)
+
+    async def vacuum(self) -> int:
+        """
+        Rewrite packs whose removed entries reach `VACUUM_RATIO` of their
+        size, and delete pack files replaced more than `STALE_GRACE` seconds
+        ago. Return number of packs rewritten.
+        """
+        packs = await self._run(self._sparse_packs)
+        for author_id, term in packs:
+            async with self.locks.lock((author_id, term)):
+                generation, _ = await self._run(self._pack, author_id, term)
+                entries = await self._run(self._live_files, author_id, term)
+                if entries:
+                    moved, size = await self.io.run(
+                        _copy_live,
+                        self.path(author_id, term, generation),
+                        self.path(author_id, term, generation + 1),
+                        entries
+                    )
+                else:
+                    # Nothing left, next append starts a new file
+                    moved, size = [], 0
+                await self._run(
+                    self._commit_vacuum, author_id, term, generation, size, moved
+                )
+
+        for path in await self._run(self._take_stale, time() - STALE_GRACE):
+            try:
+                await self.io.run(remove, path)
+            except FileNotFoundError:
+                pass
+        return len(packs)
+
+    def close(self) -> None:
+        self.executor.submit(self.connection.close).result()
+        self.executor.shutdown()
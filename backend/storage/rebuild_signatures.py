@@ -0,0 +1,63 @@
+"""
+Recompute MinHash signatures of every ticket text file and replace the
+similarity index, e.g. after shingling changes. Files are signed in a
+process pool, one process per CPU unless `--processes` is given. Files of
+packed tickets are read from their packs, so their signatures are kept.
+
+Run from backend directory: `python -m storage.rebuild_signatures`
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from concurrent.futures import ProcessPoolExecutor
+
+from config import SIMILARITY_SQLITE_PATH
+
+from .io import IOExecutor
+from .migrate import open_ticket_storage, PACK_DIRECTORY, TICKET_DIRECTORY
+from .pack import PackStore, Source
+from .search import ticket_documents
+from .similarity import file_signature, SimilarityIndex
+
+BLOB_DIRECTORY = "data/blobs"
+CHUNK_SIZE = 16
+
+
+async def main():
+    parser = ArgumentParser(description="Rebuild similarity index")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    io_executor = IOExecutor()
+    storage = open_ticket_storage(io_executor=io_executor)
+    tickets = await storage.query()
+    storage.close()
+    pack_store = PackStore(PACK_DIRECTORY, io_executor=io_executor)
+
+    files = []
+    sources: dict[str, Source] = {}
+    for ticket in tickets:
+        pack_entries = None if ticket.pack is None else \
+            await pack_store.entries(ticket.author_id, ticket.ticket_id)
+        documents = ticket_documents(ticket, BLOB_DIRECTORY, TICKET_DIRECTORY, pack_entries)
+        for filename, key, source in documents:
+            files.append((ticket.author_id, ticket.ticket_id, filename, key))
+            sources[key] = source
+    pack_store.close()
+    io_executor.close()
+
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        signatures = dict(zip(
+            sources.keys(),
+            pool.map(file_signature, sources.values(), chunksize=CHUNK_SIZE)
+        ))
+
+    similarity_index = SimilarityIndex(SIMILARITY_SQLITE_PATH)
+    await similarity_index.rebuild(files, signatures)
+    similarity_index.close()
+    signed = sum(value is not None for value in signatures.values())
+    print(f"Signed {signed} of {len(sources)} files of {len(tickets)} tickets "
+          f"into {SIMILARITY_SQLITE_PATH}")
+
+
+if __name__ == "__main__":
+    run(main=main())
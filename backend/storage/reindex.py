@@ -0,0 +1,43 @@
+"""
+Index text files of every ticket into search index, files already indexed
+are kept. Run once for tickets uploaded before search index existed. Files
+of packed tickets are read from their packs.
+
+Run from backend directory: `python -m storage.reindex`
+"""
+from asyncio import run
+
+from config import SEARCH_SQLITE_PATH
+
+from .io import IOExecutor
+from .migrate import open_ticket_storage, PACK_DIRECTORY, TICKET_DIRECTORY
+from .pack import PackStore
+from .search import SearchIndex, ticket_documents
+
+BLOB_DIRECTORY = "data/blobs"
+
+
+async def main():
+    io_executor = IOExecutor()
+    storage = open_ticket_storage(io_executor=io_executor)
+    tickets = await storage.query()
+    storage.close()
+    pack_store = PackStore(PACK_DIRECTORY, io_executor=io_executor)
+
+    search_index = SearchIndex(SEARCH_SQLITE_PATH)
+    for ticket in tickets:
+        pack_entries = None if ticket.pack is None else \
+            await pack_store.entries(ticket.author_id, ticket.ticket_id)
+        await search_index.add(
+            ticket.author_id,
+            ticket.ticket_id,
+            ticket_documents(ticket, BLOB_DIRECTORY, TICKET_DIRECTORY, pack_entries)
+        )
+    search_index.close()
+    pack_store.close()
+    io_executor.close()
+    print(f"Indexed {len(tickets)} tickets into {SEARCH_SQLITE_PATH}")
+
+
+if __name__ == "__main__":
+    run(main=main())
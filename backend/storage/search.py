@@ -0,0 +1,348 @@
+from pydantic import BaseModel
+
+from asyncio import get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs
+from os.path import dirname, isdir, join
+from re import compile as compile_regex, error as RegexError, escape, IGNORECASE, MULTILINE, Pattern
+from sqlite3 import connect, Connection
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+try:
+    from re import _parser as regex_parser
+except ImportError:
+    # Python < 3.11
+    import sre_parse as regex_parser
+
+from schemas.ticket import Ticket
+
+from .blob import BlobStore
+from .pack import PackEntry, read_source, Source
+
+T = TypeVar("T")
+
+# (filename, document key, source)
+Document = tuple[str, str, Source]
+
+# Trigram index can only look up literals of at least this length
+MIN_LITERAL_LENGTH = 3
+# Larger text files are not indexed
+MAX_INDEXED_FILE_SIZE = 4 * 1024 * 1024
+MAX_LINE_LENGTH = 500
+
+# A document is the text of one blob, shared by every ticket file which
+# refers to it, so a file submitted by a whole class is indexed once.
+# Rowid of documents_text is doc_id.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_text USING fts5(
+    content,
+    tokenize="trigram"
+);
+CREATE TABLE IF NOT EXISTS ticket_files (
+    author_id TEXT NOT NULL,
+    ticket_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (author_id, ticket_id, filename)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ticket_files_doc_id ON ticket_files (doc_id);
+"""
+
+
+class SearchHit(BaseModel):
+    author_id: str
+    ticket_id: str
+    filename: str
+    line: int
+    text: str
+
+
+class SearchResult(BaseModel):
+    hits: list[SearchHit] = []
+    # More hits exist than limit
+    truncated: bool = False
+
+
+def required_literals(pattern: str, flags: int = 0) -> list[str]:
+    """
+    Literal strings every match of regex must contain. Only runs of plain
+    characters outside alternation and optional parts are found, which is
+    enough to narrow down candidates by the trigram index.
+    """
+    literals = []
+
+    def walk(items: Iterable[tuple[Any, Any]]) -> None:
+        run: list[str] = []
+        for op, value in items:
+            if op is regex_parser.LITERAL:
+                run.append(chr(value))
+                continue
+            literals.append("".join(run))
+            run = []
+            if op is regex_parser.SUBPATTERN:
+                walk(value[-1])
+            elif op in (regex_parser.MAX_REPEAT, regex_parser.MIN_REPEAT) and value[0] >= 1:
+                walk(value[2])
+        literals.append("".join(run))
+
+    walk(regex_parser.parse(pattern, flags))
+    return [literal for literal in literals if len(literal) >= MIN_LITERAL_LENGTH]
+
+
+def matching_lines(matcher: Pattern, content: str) -> list[tuple[int, str]]:
+    """
+    (line number, line) of each line where a match starts. Content is
+    matched as a whole, so patterns spanning several lines match too.
+    """
+    lines = []
+    # `position` is where line `number` starts
+    number, position = 1, 0
+    for match in matcher.finditer(content):
+        start = match.start()
+        if start < position:
+            # Line is a hit already
+            continue
+        number += content.count("\n", position, start)
+        line_start = content.rfind("\n", 0, start) + 1
+        line_end = content.find("\n", start)
+        if line_end == -1:
+            line_end = len(content)
+        lines.append((number, content[line_start:line_end].rstrip("\r")))
+        number, position = number + 1, line_end + 1
+    return lines
+
+
+def ticket_documents(
+    ticket: Ticket,
+    blob_directory: str,
+    ticket_directory: str,
+    pack_entries: Optional[dict[str, PackEntry]] = None,
+) -> list[Document]:
+    """
+    Documents of text files of ticket. Files of a packed ticket are read
+    from `pack_entries`, see `PackStore.entries`, files without an entry
+    are left out.
+    """
+    documents = []
+    for filename in ticket.files:
+        content_type = ticket.content_types.get(filename)
+        if content_type is not None and not content_type.startswith("text/"):
+            continue
+        blob_id = ticket.blobs.get(filename)
+        # Tickets uploaded before blob store, key by path
+        path = join(ticket_directory, ticket.author_id, ticket.ticket_id, "data", filename)
+        key = f"path:{path}" if blob_id is None else blob_id
+        if ticket.pack is not None:
+            entry = (pack_entries or {}).get(filename)
+            if entry is not None:
+                documents.append((filename, key, entry))
+        elif blob_id is not None:
+            documents.append((
+                filename,
+                key,
+                join(blob_directory, BlobStore.relative_path(blob_id)),
+            ))
+        else:
+            documents.append((filename, key, path))
+    return documents
+
+
+class SearchIndex:
+    """
+    Substring and regex search over ticket text files, backed by a SQLite
+    FTS5 trigram index.
+
+    A query is narrowed to documents containing all of its literals by the
+    index, then only those are scanned for the exact match, so query time
+    depends on the number of candidates, not on corpus size. A hit is
+    reported at the line its match starts.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="search-sqlite"
+        )
+        self.connection: Connection = self.executor.submit(self._connect).result()
+
+    def _connect(self) -> Connection:
+        directory = dirname(self.path)
+        if directory and not isdir(directory):
+            makedirs(directory)
+        connection = connect(self.path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.executescript(SCHEMA)
+        return connection
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    @staticmethod
+    def _read_text(source: Source) -> Optional[str]:
+        try:
+            data = read_source(source, MAX_INDEXED_FILE_SIZE + 1)
+            if len(data) > MAX_INDEXED_FILE_SIZE:
+                return None
+            return data.decode("utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def _document_id(self, key: str, source: Source) -> Optional[int]:
+        row = self.connection.execute(
+            "SELECT doc_id FROM documents WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        content = self._read_text(source)
+        if content is None:
+            return None
+        doc_id = self.connection.execute(
+            "INSERT INTO documents (key) VALUES (?)",
+            (key,)
+        ).lastrowid
+        self.connection.execute(
+            "INSERT INTO documents_text (rowid, content) VALUES (?, ?)",
+            (doc_id, content)
+        )
+        return doc_id
+
+    def _add(self, author_id: str, ticket_id: str, documents: list[Document]) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for filename, key, source in documents:
+                doc_id = self._document_id(key, source)
+                if doc_id is None:
+                    continue
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO ticket_files "
+                    "(author_id, ticket_id, filename, doc_id) VALUES (?, ?, ?, ?)",
+                    (author_id, ticket_id, filename, doc_id)
+                )
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _remove(self, author_id: str, ticket_id: str) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            doc_ids = [row[0] for row in self.connection.execute(
+                "DELETE FROM ticket_files WHERE author_id = ? AND ticket_id = ? "
+                "RETURNING doc_id",
+                (author_id, ticket_id)
+            ).fetchall()]
+            # Drop documents no other ticket refers to
+            for doc_id in set(doc_ids):
+                referred = self.connection.execute(
+                    "SELECT 1 FROM ticket_files WHERE doc_id = ? LIMIT 1",
+                    (doc_id,)
+                ).fetchone()
+                if referred is not None:
+                    continue
+                self.connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                self.connection.execute("DELETE FROM documents_text WHERE rowid = ?", (doc_id,))
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _search(
+        self,
+        query: str,
+        regex: bool,
+        ignore_case: bool,
+        author_ids: Optional[list[str]],
+        limit: int,
+    ) -> SearchResult:
+        # ^ and $ match at every line as they did line by line
+        flags = MULTILINE | (IGNORECASE if ignore_case else 0)
+        if regex:
+            matcher = compile_regex(query, flags)
+            literals = required_literals(query, flags)
+        else:
+            matcher = compile_regex(escape(query), flags)
+            literals = [query] if len(query) >= MIN_LITERAL_LENGTH else []
+        if not literals:
+            raise ValueError(
+                f"Query needs a literal of at least {MIN_LITERAL_LENGTH} characters"
+            )
+
+        # Trigram index is case insensitive, matcher checks case
+        match_expression = " AND ".join(
+            "\"" + literal.replace("\"", "\"\"") + "\"" for literal in literals
+        )
+        author_filter = ""
+        author_params: list[str] = []
+        if author_ids is not None:
+            author_filter = f"AND author_id IN ({', '.join('?' * len(author_ids))})"
+            author_params = author_ids
+
+        result = SearchResult()
+        candidates = self.connection.execute(
+            "SELECT rowid, content FROM documents_text WHERE documents_text MATCH ?",
+            (match_expression,)
+        )
+        for doc_id, content in candidates:
+            lines = matching_lines(matcher, content)
+            if not lines:
+                continue
+            files = self.connection.execute(
+                "SELECT author_id, ticket_id, filename FROM ticket_files "
+                f"WHERE doc_id = ? {author_filter} "
+                "ORDER BY author_id, ticket_id, filename",
+                (doc_id, *author_params)
+            ).fetchall()
+            for author_id, ticket_id, filename in files:
+                for number, line in lines:
+                    if len(result.hits) >= limit:
+                        result.truncated = True
+                        return result
+                    result.hits.append(SearchHit(
+                        author_id=author_id,
+                        ticket_id=ticket_id,
+                        filename=filename,
+                        line=number,
+                        text=line[:MAX_LINE_LENGTH],
+                    ))
+        return result
+
+    async def add(self, author_id: str, ticket_id: str, documents: list[Document]) -> None:
+        """
+        Index files of ticket, see `ticket_documents`. Content
+        is read only for keys not indexed yet, files which are not UTF-8
+        text are skipped.
+        """
+        await self._run(self._add, author_id, ticket_id, documents)
+
+    async def remove(self, author_id: str, ticket_id: str) -> None:
+        await self._run(self._remove, author_id, ticket_id)
+
+    async def search(
+        self,
+        query: str,
+        regex: bool = False,
+        ignore_case: bool = False,
+        author_ids: Optional[list[str]] = None,
+        limit: int = 100,
+    ) -> SearchResult:
+        """
+        Find lines containing query, or matching it if regex is set. Raise
+        ValueError if query is invalid or has no literal the index can use.
+        """
+        try:
+            return await self._run(self._search, query, regex, ignore_case, author_ids, limit)
+        except RegexError as error:
+            raise ValueError(f"Invalid regex: {error}")
+
+    def close(self) -> None:
+        self.executor.submit(self.connection.close).result()
+        self.executor.shutdown()
@@ -0,0 +1,404 @@
+from pydantic import BaseModel
+
+from array import array
+from asyncio import get_event_loop
+from concurrent.futures import Executor, ThreadPoolExecutor
+from hashlib import blake2b, shake_128
+from os import makedirs
+from os.path import dirname, isdir
+from re import compile as compile_regex, DOTALL
+from sqlite3 import connect, Connection
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+from .pack import read_source, Source
+
+T = TypeVar("T")
+
+# Comments are dropped, literals and identifiers are replaced by one token
+# each, so renaming variables or editing strings does not hide a copy
+TOKEN_PATTERN = compile_regex(
+    rb"//[^\n]*|/\*.*?\*/"
+    rb"|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'"
+    rb"|[A-Za-z_]\w*|\d[\w.]*|[^\s\w]",
+    DOTALL
+)
+KEYWORDS = frozenset(b"""
+    auto bool break case catch char class const constexpr continue default
+    delete do double else enum extern false float for friend goto if inline
+    int long namespace new nullptr operator private protected public return
+    short signed sizeof static struct switch template this throw true try
+    typedef typename union unsigned using virtual void volatile while
+    include define cin cout endl std vector string map set pair
+""".split())
+SHINGLE_SIZE = 8
+NUM_PERMUTATIONS = 128
+# LSH bands of BAND_ROWS values, files sharing any band are candidates.
+# 32 bands of 4 rows find pairs above about 0.4 similarity.
+BAND_ROWS = 4
+BANDS = NUM_PERMUTATIONS // BAND_ROWS
+# Signature values are 32 bit
+VALUE_TYPE = "I"
+VALUE_SIZE = array(VALUE_TYPE).itemsize
+# Larger files are not signed
+MAX_SIGNED_FILE_SIZE = 4 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    key TEXT PRIMARY KEY,
+    signature BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket BLOB NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bands_key ON bands (key);
+CREATE TABLE IF NOT EXISTS ticket_files (
+    author_id TEXT NOT NULL,
+    ticket_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (author_id, ticket_id, filename)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ticket_files_key ON ticket_files (key);
+"""
+
+
+class SimilarFile(BaseModel):
+    filename: str
+    author_id: str
+    ticket_id: str
+    other_filename: str
+    similarity: float
+
+
+class SimilarTicket(BaseModel):
+    author_id: str
+    ticket_id: str
+    # Mean over files of queried ticket of their best match in this ticket
+    similarity: float
+    matched_files: int
+
+
+class SimilarityResult(BaseModel):
+    tickets: list[SimilarTicket] = []
+    files: list[SimilarFile] = []
+
+
+def tokenize(source: bytes) -> list[bytes]:
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(source):
+        token = match.group()
+        first = token[:1]
+        if first == b"/" and token[1:2] in (b"/", b"*"):
+            continue
+        if first == b"\"":
+            tokens.append(b"S")
+        elif first == b"'":
+            tokens.append(b"C")
+        elif first.isdigit():
+            tokens.append(b"N")
+        elif first.isalpha() or first == b"_":
+            tokens.append(token if token in KEYWORDS else b"I")
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def shingles(tokens: list[bytes]) -> set[bytes]:
+    return {
+        b" ".join(tokens[index:index + SHINGLE_SIZE])
+        for index in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+
+
+def signature(source: bytes) -> Optional[bytes]:
+    """
+    MinHash signature of source code, None if it is shorter than a shingle.
+
+    One SHAKE digest of a shingle gives its value under every hash function
+    at once, the column-wise minimum runs in C, which is several times
+    faster than evaluating NUM_PERMUTATIONS affine hashes per shingle.
+    """
+    rows = [
+        array(VALUE_TYPE, shake_128(shingle).digest(NUM_PERMUTATIONS * VALUE_SIZE))
+        for shingle in shingles(tokenize(source))
+    ]
+    if not rows:
+        return None
+    return array(VALUE_TYPE, map(min, zip(*rows))).tobytes()
+
+
+def file_signature(source: Source) -> Optional[bytes]:
+    """
+    Signature of file or packed file, None if it can't be read or is too
+    large. Blocking and CPU bound, module level so process pools can run it.
+    """
+    try:
+        content = read_source(source, MAX_SIGNED_FILE_SIZE + 1)
+    except OSError:
+        return None
+    if len(content) > MAX_SIGNED_FILE_SIZE:
+        return None
+    return signature(content)
+
+
+def band_buckets(signature: bytes) -> list[bytes]:
+    size = BAND_ROWS * VALUE_SIZE
+    return [
+        blake2b(signature[band * size:(band + 1) * size], digest_size=8).digest()
+        for band in range(BANDS)
+    ]
+
+
+def estimate_similarity(first: bytes, second: bytes) -> float:
+    """
+    Estimated Jaccard similarity of shingle sets.
+    """
+    first_values, second_values = array(VALUE_TYPE, first), array(VALUE_TYPE, second)
+    return sum(x == y for x, y in zip(first_values, second_values)) / NUM_PERMUTATIONS
+
+
+class SimilarityIndex:
+    """
+    MinHash signatures of ticket text files with an LSH band index, to find
+    tickets with copied code without comparing every pair of files.
+
+    Signatures are keyed like search documents, by blob, so identical files
+    are signed once. They are computed on `compute_executor`, by default a
+    thread of its own, SQLite statements run on another thread.
+    """
+
+    def __init__(self, path: str, compute_executor: Optional[Executor] = None) -> None:
+        self.path = path
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="similarity-sqlite"
+        )
+        self.compute_executor = compute_executor or ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="similarity"
+        )
+        self.connection: Connection = self.executor.submit(self._connect).result()
+
+    def _connect(self) -> Connection:
+        directory = dirname(self.path)
+        if directory and not isdir(directory):
+            makedirs(directory)
+        connection = connect(self.path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.executescript(SCHEMA)
+        return connection
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _known_keys(self, keys: list[str]) -> set[str]:
+        return {
+            key for key in keys
+            if self.connection.execute(
+                "SELECT 1 FROM signatures WHERE key = ?",
+                (key,)
+            ).fetchone() is not None
+        }
+
+    def _insert(
+        self,
+        files: Iterable[tuple[str, str, str, str]],
+        signatures: dict[str, Optional[bytes]],
+    ) -> None:
+        for key, value in signatures.items():
+            if value is None:
+                continue
+            inserted = self.connection.execute(
+                "INSERT OR IGNORE INTO signatures (key, signature) VALUES (?, ?)",
+                (key, value)
+            ).rowcount
+            if not inserted:
+                continue
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO bands (band, bucket, key) VALUES (?, ?, ?)",
+                ((band, bucket, key) for band, bucket in enumerate(band_buckets(value)))
+            )
+        for author_id, ticket_id, filename, key in files:
+            # Files without signature, too short or not text, are left out
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ticket_files (author_id, ticket_id, filename, key) "
+                "SELECT ?, ?, ?, key FROM signatures WHERE key = ?",
+                (author_id, ticket_id, filename, key)
+            )
+
+    def _add(
+        self,
+        files: list[tuple[str, str, str, str]],
+        signatures: dict[str, Optional[bytes]],
+    ) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._insert(files, signatures)
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _rebuild(
+        self,
+        files: list[tuple[str, str, str, str]],
+        signatures: dict[str, Optional[bytes]],
+    ) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("signatures", "bands", "ticket_files"):
+                self.connection.execute(f"DELETE FROM {table}")
+            self._insert(files, signatures)
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _remove(self, author_id: str, ticket_id: str) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [row[0] for row in self.connection.execute(
+                "DELETE FROM ticket_files WHERE author_id = ? AND ticket_id = ? "
+                "RETURNING key",
+                (author_id, ticket_id)
+            ).fetchall()]
+            # Drop signatures no other ticket refers to
+            for key in set(keys):
+                referred = self.connection.execute(
+                    "SELECT 1 FROM ticket_files WHERE key = ? LIMIT 1",
+                    (key,)
+                ).fetchone()
+                if referred is not None:
+                    continue
+                self.connection.execute("DELETE FROM signatures WHERE key = ?", (key,))
+                self.connection.execute("DELETE FROM bands WHERE key = ?", (key,))
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _signature(self, key: str) -> Optional[bytes]:
+        row = self.connection.execute(
+            "SELECT signature FROM signatures WHERE key = ?",
+            (key,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _similar(
+        self,
+        author_id: str,
+        ticket_id: str,
+        limit: int,
+        include_same_author: bool,
+    ) -> SimilarityResult:
+        query_files = self.connection.execute(
+            "SELECT filename, key FROM ticket_files WHERE author_id = ? AND ticket_id = ?",
+            (author_id, ticket_id)
+        ).fetchall()
+
+        files: list[SimilarFile] = []
+        # (author_id, ticket_id) -> filename -> best similarity
+        best: dict[tuple[str, str], dict[str, float]] = {}
+        for filename, key in query_files:
+            query_signature = self._signature(key)
+            if query_signature is None:
+                continue
+            candidates = set()
+            for band, bucket in enumerate(band_buckets(query_signature)):
+                candidates.update(row[0] for row in self.connection.execute(
+                    "SELECT key FROM bands WHERE band = ? AND bucket = ?",
+                    (band, bucket)
+                ))
+
+            for candidate in candidates:
+                candidate_signature = self._signature(candidate)
+                if candidate_signature is None:
+                    continue
+                similarity = estimate_similarity(query_signature, candidate_signature)
+                for other_author_id, other_ticket_id, other_filename in self.connection.execute(
+                    "SELECT author_id, ticket_id, filename FROM ticket_files WHERE key = ?",
+                    (candidate,)
+                ):
+                    if other_author_id == author_id and \
+                            (other_ticket_id == ticket_id or not include_same_author):
+                        continue
+                    files.append(SimilarFile(
+                        filename=filename,
+                        author_id=other_author_id,
+                        ticket_id=other_ticket_id,
+                        other_filename=other_filename,
+                        similarity=similarity,
+                    ))
+                    ticket_best = best.setdefault((other_author_id, other_ticket_id), {})
+                    ticket_best[filename] = max(ticket_best.get(filename, 0), similarity)
+
+        signed_files = max(len(query_files), 1)
+        tickets = [
+            SimilarTicket(
+                author_id=other_author_id,
+                ticket_id=other_ticket_id,
+                similarity=sum(file_best.values()) / signed_files,
+                matched_files=len(file_best),
+            )
+            for (other_author_id, other_ticket_id), file_best in best.items()
+        ]
+        tickets.sort(key=lambda ticket: ticket.similarity, reverse=True)
+        files.sort(key=lambda file: file.similarity, reverse=True)
+        return SimilarityResult(tickets=tickets[:limit], files=files[:limit])
+
+    async def add(self, author_id: str, ticket_id: str, documents: list[tuple[str, str, Source]]) -> None:
+        """
+        Sign files of ticket, see `ticket_documents`. Files are
+        read only for keys not signed yet.
+        """
+        known = await self._run(self._known_keys, [key for _, key, _ in documents])
+        loop = get_event_loop()
+        signatures: dict[str, Optional[bytes]] = {}
+        for _, key, source in documents:
+            if key not in known and key not in signatures:
+                signatures[key] = await loop.run_in_executor(
+                    self.compute_executor, file_signature, source
+                )
+        await self._run(
+            self._add,
+            [(author_id, ticket_id, filename, key) for filename, key, _ in documents],
+            signatures
+        )
+
+    async def rebuild(
+        self,
+        files: list[tuple[str, str, str, str]],
+        signatures: dict[str, Optional[bytes]],
+    ) -> None:
+        """
+        Replace whole index. Files are (author_id, ticket_id, filename, key),
+        signatures are computed by caller, see `file_signature`.
+        """
+        await self._run(self._rebuild, files, signatures)
+
+    async def remove(self, author_id: str, ticket_id: str) -> None:
+        await self._run(self._remove, author_id, ticket_id)
+
+    async def similar(
+        self,
+        author_id: str,
+        ticket_id: str,
+        limit: int = 10,
+        include_same_author: bool = False,
+    ) -> SimilarityResult:
+        """
+        Top tickets and files most similar to files of given ticket, found
+        by LSH buckets so only candidates are compared.
+        """
+        return await self._run(self._similar, author_id, ticket_id, limit, include_same_author)
+
+    def close(self) -> None:
+        self.executor.submit(self.connection.close).result()
+        self.executor.shutdown()
+        self.compute_executor.shutdown()
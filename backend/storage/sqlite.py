@@ -0,0 +1,190 @@
+from orjson import dumps, loads
+
+from asyncio import get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs
+from os.path import dirname, isdir
+from sqlite3 import connect, Connection
+from typing import Any, Callable, Literal, Optional, TypeVar
+
+from schemas.ticket import Ticket, TicketPage
+
+from .base import TicketStorage
+
+T = TypeVar("T")
+
+# author_id is the leading column of primary key, so it needs no extra index
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    author_id TEXT NOT NULL,
+    ticket_id TEXT NOT NULL,
+    create_utc_timestamp REAL NOT NULL,
+    public INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (author_id, ticket_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tickets_create_utc_timestamp
+    ON tickets (create_utc_timestamp);
+CREATE INDEX IF NOT EXISTS tickets_public
+    ON tickets (public, create_utc_timestamp);
+"""
+
+
+class SQLiteTicketStorage(TicketStorage):
+    """
+    Keep ticket metadata in a SQLite database in WAL mode.
+
+    All statements run on one dedicated thread which owns the connection, so
+    the event loop never waits on disk.
+    """
+
+    def __init__(self, path: str, lock_directory: Optional[str] = None) -> None:
+        super().__init__(lock_directory=lock_directory)
+        self.path = path
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="ticket-sqlite"
+        )
+        self.connection: Connection = self.executor.submit(self._connect).result()
+
+    def _connect(self) -> Connection:
+        directory = dirname(self.path)
+        if directory and not isdir(directory):
+            makedirs(directory)
+        connection = connect(self.path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        connection.executescript(SCHEMA)
+        return connection
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _get(self, user_id: str, ticket_id: str) -> Optional[bytes]:
+        row = self.connection.execute(
+            "SELECT data FROM tickets WHERE author_id = ? AND ticket_id = ?",
+            (user_id, ticket_id)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _list_ids(self, user_id: str) -> list[str]:
+        return [row[0] for row in self.connection.execute(
+            "SELECT ticket_id FROM tickets WHERE author_id = ?",
+            (user_id,)
+        )]
+
+    def _page(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str],
+        order: Literal["asc", "desc"],
+    ) -> list[bytes]:
+        compare, direction = (">", "ASC") if order == "asc" else ("<", "DESC")
+        condition = f"AND ticket_id {compare} ?" if cursor is not None else ""
+        params = (user_id, cursor) if cursor is not None else (user_id,)
+        # Fetch one more row to know if there is a next page
+        return [row[0] for row in self.connection.execute(
+            f"SELECT data FROM tickets WHERE author_id = ? {condition} "
+            f"ORDER BY ticket_id {direction} LIMIT ?",
+            (*params, limit + 1)
+        )]
+
+    def _query(
+        self,
+        author_ids: Optional[list[str]],
+        start: Optional[float],
+        end: Optional[float],
+    ) -> list[bytes]:
+        conditions, params = [], []
+        if author_ids is not None:
+            conditions.append(
+                f"author_id IN ({', '.join('?' * len(author_ids))})"
+            )
+            params.extend(author_ids)
+        if start is not None:
+            conditions.append("create_utc_timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("create_utc_timestamp < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return [row[0] for row in self.connection.execute(
+            f"SELECT data FROM tickets {where} ORDER BY author_id, ticket_id",
+            params
+        )]
+
+    def _save(self, ticket: Ticket) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO tickets "
+            "(author_id, ticket_id, create_utc_timestamp, public, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                ticket.author_id,
+                ticket.ticket_id,
+                ticket.create_utc_timestamp,
+                ticket.public,
+                dumps(ticket.model_dump()),
+            )
+        )
+
+    def _save_many(self, tickets: list[Ticket]) -> None:
+        self.connection.execute("BEGIN")
+        try:
+            for ticket in tickets:
+                self._save(ticket)
+            self.connection.execute("COMMIT")
+        except:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _delete(self, user_id: str, ticket_id: str) -> None:
+        self.connection.execute(
+            "DELETE FROM tickets WHERE author_id = ? AND ticket_id = ?",
+            (user_id, ticket_id)
+        )
+
+    async def get(self, user_id: str, ticket_id: str) -> Optional[Ticket]:
+        data = await self._run(self._get, user_id, ticket_id)
+        return None if data is None else Ticket(**loads(data))
+
+    async def list_ids(self, user_id: str) -> list[str]:
+        return await self._run(self._list_ids, user_id)
+
+    async def page(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        order: Literal["asc", "desc"] = "desc",
+    ) -> TicketPage:
+        rows = await self._run(self._page, user_id, limit, cursor, order)
+        tickets = [Ticket(**loads(data)) for data in rows[:limit]]
+        return TicketPage(
+            tickets=tickets,
+            next_cursor=tickets[-1].ticket_id if len(rows) > limit else None,
+        )
+
+    async def query(
+        self,
+        author_ids: Optional[list[str]] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> list[Ticket]:
+        rows = await self._run(self._query, author_ids, start, end)
+        return [Ticket(**loads(data)) for data in rows]
+
+    async def save(self, ticket: Ticket) -> None:
+        await self._run(self._save, ticket)
+
+    async def save_many(self, tickets: list[Ticket]) -> None:
+        await self._run(self._save_many, tickets)
+
+    async def delete(self, user_id: str, ticket_id: str) -> None:
+        await self._run(self._delete, user_id, ticket_id)
+
+    def close(self) -> None:
+        self.executor.submit(self.connection.close).result()
+        self.executor.shutdown()
@@ -0,0 +1,95 @@
+from orjson import loads
+
+from asyncio import Task, create_task, gather
+from os import listdir, makedirs, rename, urandom
+from os.path import isdir, join
+from shutil import rmtree
+from typing import Iterable, Optional
+
+from .atomic import write_json
+from .blob import BlobStore
+from .io import IOExecutor
+
+BLOBS_FILE = "blobs.json"
+CLAIM_SUFFIX = ".reclaiming"
+
+
+class Trash:
+    """
+    Deferred deletion of tickets.
+
+    `bury` moves the ticket directory into a tombstone under `directory`
+    together with the blob IDs it referred to, which is one rename and one
+    small write, then reclaims it in background: blobs are released and the
+    tombstone removed. Tombstones left by a crash are reclaimed by
+    `reclaim_all` on next start.
+
+    A tombstone is claimed by renaming it before reclaim, so only one worker
+    releases its blobs. A crash during reclaim leaves a claimed tombstone
+    which is never retried, leaking blobs is safer than releasing them twice.
+    """
+
+    def __init__(self, directory: str, blob_store: BlobStore, io_executor: IOExecutor) -> None:
+        self.directory = directory
+        self.blob_store = blob_store
+        self.io = io_executor
+        self.tasks: set[Task] = set()
+        if not isdir(directory):
+            makedirs(directory, exist_ok=True)
+
+    async def bury(
+        self,
+        user_id: str,
+        ticket_id: str,
+        ticket_directory: Optional[str],
+        blob_ids: Iterable[str],
+    ) -> None:
+        name = f"{user_id}-{ticket_id}-{urandom(4).hex()}"
+        tombstone = join(self.directory, name)
+        await self.io.run(makedirs, tombstone)
+        await write_json(join(tombstone, BLOBS_FILE), list(blob_ids), io_executor=self.io)
+        if ticket_directory is not None and await self.io.run(isdir, ticket_directory):
+            await self.io.run(rename, ticket_directory, join(tombstone, "ticket"))
+        self._schedule(name)
+
+    def _schedule(self, name: str) -> None:
+        task = create_task(self._reclaim(name))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _claim(self, name: str) -> Optional[str]:
+        claimed = join(self.directory, f"{name}{CLAIM_SUFFIX}")
+        try:
+            rename(join(self.directory, name), claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _read_blob_ids(self, tombstone: str) -> list[str]:
+        try:
+            with open(join(tombstone, BLOBS_FILE), "rb") as blobs_file:
+                return loads(blobs_file.read())
+        except FileNotFoundError:
+            # Crashed before blob list is written, leave its blobs
+            # referenced rather than guess
+            return []
+
+    async def _reclaim(self, name: str) -> None:
+        tombstone = await self.io.run(self._claim, name)
+        if tombstone is None:
+            return
+        blob_ids = await self.io.run(self._read_blob_ids, tombstone)
+        await self.blob_store.release(blob_ids)
+        await self.io.run(rmtree, tombstone, ignore_errors=True)
+
+    async def reclaim_all(self) -> None:
+        names = await self.io.run(listdir, self.directory)
+        for name in names:
+            if not name.endswith(CLAIM_SUFFIX):
+                self._schedule(name)
+
+    async def close(self) -> None:
+        """
+        Wait for reclaims in progress.
+        """
+        await gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,73 @@
+"""
+Put files of packed tickets back to blob store and ticket directories, as
+they were before packing. Safe to run while the server runs, turn
+`pack_enabled` off first or old tickets are packed again.
+
+Run from backend directory: `python -m storage.unpack [--author ID] [--term TERM]`
+"""
+from argparse import ArgumentParser
+from asyncio import run
+
+from config import COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE
+
+from .blob import BlobStore
+from .compaction import Compactor
+from .compression import VariantWriter
+from .io import IOExecutor
+from .migrate import open_ticket_storage, PACK_DIRECTORY, TICKET_DIRECTORY
+from .pack import PackStore
+
+BLOB_DIRECTORY = "data/blobs"
+TICKET_LOCK_DIRECTORY = "data/locks/tickets"
+PACK_LOCK_DIRECTORY = "data/locks/packs"
+
+
+async def main():
+    parser = ArgumentParser(description="Unpack packed tickets")
+    parser.add_argument("--author", default=None)
+    parser.add_argument("--term", default=None, help="e.g. 2024-fall")
+    args = parser.parse_args()
+
+    io_executor = IOExecutor()
+    storage = open_ticket_storage(
+        lock_directory=TICKET_LOCK_DIRECTORY,
+        io_executor=io_executor
+    )
+    blob_store = BlobStore(BLOB_DIRECTORY)
+    pack_store = PackStore(
+        PACK_DIRECTORY,
+        lock_directory=PACK_LOCK_DIRECTORY,
+        io_executor=io_executor
+    )
+    compactor = Compactor(
+        ticket_storage=storage,
+        pack_store=pack_store,
+        blob_store=blob_store,
+        ticket_directory=TICKET_DIRECTORY,
+        io_executor=io_executor,
+        # Text blobs get compressed variants back, as on upload
+        on_blob_restored=VariantWriter(
+            blob_store=blob_store,
+            io_executor=io_executor,
+            enabled=COMPRESSION_ENABLED,
+            min_size=COMPRESSION_MIN_SIZE
+        ).write
+    )
+
+    tickets = await pack_store.tickets(author_id=args.author, term=args.term)
+    unpacked = 0
+    for author_id, ticket_id in tickets:
+        if await compactor.unpack(author_id, ticket_id):
+            unpacked += 1
+    # Give back space of unpacked entries
+    await pack_store.vacuum()
+
+    pack_store.close()
+    blob_store.close()
+    storage.close()
+    io_executor.close()
+    print(f"Unpacked {unpacked} of {len(tickets)} packed tickets")
+
+
+if __name__ == "__main__":
+    run(main=main())
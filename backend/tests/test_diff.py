@@ -0,0 +1,27 @@
+from api.diff import _file_diff, NO_NEWLINE_MARKER
+
+
+def test_diff_marks_missing_newline_on_old_side():
+    diff = _file_diff("a.c", b"0", b"1\n", "modified").diff
+    assert diff.splitlines(keepends=True)[2:] == [
+        "@@ -1 +1 @@\n",
+        "-0\n",
+        NO_NEWLINE_MARKER,
+        "+1\n",
+    ]
+
+
+def test_diff_marks_missing_newline_on_new_side():
+    diff = _file_diff("a.c", b"x\n0\n", b"x\n1", "modified").diff
+    assert diff.splitlines(keepends=True)[2:] == [
+        "@@ -1,2 +1,2 @@\n",
+        " x\n",
+        "-0\n",
+        "+1\n",
+        NO_NEWLINE_MARKER,
+    ]
+
+
+def test_diff_splits_lines_on_newline_only():
+    diff = _file_diff("a.c", b"a\rb\n", b"a\rc\n", "modified").diff
+    assert diff.split("\n")[2:] == ["@@ -1 +1 @@", "-a\rb", "+a\rc", ""]
@@ -0,0 +1,103 @@
+from asyncio import run
+from os import remove
+from typing import Optional
+
+from fastapi import HTTPException
+from pytest import raises
+from starlette.requests import Request
+
+from api.upload import MAX_FIELDS, normalize_filename, StreamingUpload
+
+BOUNDARY = "boundary"
+
+
+def multipart_body(parts: list[tuple[str, Optional[str], bytes]]) -> bytes:
+    body = b""
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode()
+        body += content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def receive_upload(tmp_path, parts: list[tuple[str, Optional[str], bytes]]) -> StreamingUpload:
+    body = multipart_body(parts)
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    request = Request({
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())],
+    }, receive)
+    temp_paths = iter(str(tmp_path / f"{index}.tmp") for index in range(1000))
+    upload = StreamingUpload(
+        request=request,
+        temp_path_factory=lambda: next(temp_paths),
+        max_size=1024 * 1024,
+    )
+    run(upload.receive())
+    for file in upload.files:
+        remove(file.temp_path)
+    return upload
+
+
+def test_normalize_filename_rejects_empty():
+    assert normalize_filename("") is None
+
+
+def test_normalize_filename_rejects_directory():
+    assert normalize_filename(".") is None
+    assert normalize_filename("dir/") is None
+    assert normalize_filename("dir/..") is None
+
+
+def test_normalize_filename_rejects_outside():
+    assert normalize_filename("../a.cpp") is None
+    assert normalize_filename("a/../../b.cpp") is None
+    assert normalize_filename("/etc/passwd") is None
+
+
+def test_normalize_filename_resolves_dots():
+    assert normalize_filename("a/../b.cpp") == "b.cpp"
+    assert normalize_filename("./src//main.cpp") == "src/main.cpp"
+
+
+def test_upload_skips_empty_filename(tmp_path):
+    upload = receive_upload(tmp_path, [("files", "", b""), ("files", "a.cpp", b"int a;")])
+    assert [file.filename for file in upload.files] == ["a.cpp"]
+
+
+def test_upload_skips_directory_filenames(tmp_path):
+    upload = receive_upload(tmp_path, [
+        ("files", ".", b"x"),
+        ("files", "dir/", b"x"),
+        ("files", "dir\\", b"x"),
+        ("files", "a.cpp", b"int a;"),
+    ])
+    assert [file.filename for file in upload.files] == ["a.cpp"]
+
+
+def test_upload_stores_normalized_filename(tmp_path):
+    upload = receive_upload(tmp_path, [
+        ("files", "a/../b.cpp", b"int b;"),
+        # Same file after normalizing, first one is kept
+        ("files", "./b.cpp", b"int c;"),
+    ])
+    assert [file.filename for file in upload.files] == ["b.cpp"]
+
+
+def test_upload_rejects_too_many_fields(tmp_path):
+    parts = [(f"junk{index}", None, b"x" * 1000) for index in range(MAX_FIELDS + 1)]
+    with raises(HTTPException) as error:
+        receive_upload(tmp_path, [*parts, ("files", "a.cpp", b"int a;")])
+    assert error.value.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_upload_keeps_expected_fields(tmp_path):
+    upload = receive_upload(tmp_path, [("public", None, b"true"), ("files", "a.cpp", b"int a;")])
+    assert upload.fields == {"public": "true"}
@@ -1,7 +1,7 @@
 import axios from "axios";
 // import { set, get, del, createStore } from "idb-keyval";
 
-import TicketData, { TicketUpdate } from "schemas/ticket";
+import TicketData, { TicketEvent, TicketPage, TicketUpdate } from "schemas/ticket";
 
 // const ticketConfigDB = createStore("ticketConfig", "keyval");
 
@@ -13,6 +13,20 @@ async function getTicketList(userId?: string | undefined): Promise<Array<string>
     return response.data;
 }
 
+// Page of full ticket data, pass next_cursor of previous page as cursor
+async function getTicketPage(
+    userId?: string | undefined,
+    cursor?: string | undefined,
+    order: "asc" | "desc" = "desc",
+): Promise<TicketPage> {
+    const response = await axios.get(
+        `/ticket/${userId || "@me"}`,
+        { params: { expand: true, cursor: cursor, order: order } }
+    );
+
+    return response.data;
+}
+
 async function uploadTicket(files: Array<File>, isPublic?: boolean | undefined): Promise<string> {
     const formData = new FormData();
     for (let i = 0; i < files.length; i++) {
@@ -76,6 +90,46 @@ async function getTicketFileContent(
     return response.data;
 }
 
+// Receive ticket events by WebSocket, reconnect and resume after last
+// event until returned function is called
+function subscribeTicketEvents(
+    onEvent: (event: TicketEvent) => void,
+    userId?: string | undefined,
+): () => void {
+    let socket: WebSocket | undefined;
+    let lastEventId: number | undefined;
+    let closed = false;
+
+    const connect = () => {
+        const url = new URL(
+            `${process.env.REACT_APP_API_END_POINT || ""}/ticket/events/ws`,
+            window.location.href
+        );
+        url.protocol = url.protocol === "https:" ? "wss:" : "ws:";
+
+        socket = new WebSocket(url);
+        socket.onopen = () => socket?.send(JSON.stringify({
+            token: localStorage.getItem("access_token"),
+            user_id: userId,
+            last_event_id: lastEventId,
+        }));
+        socket.onmessage = (message) => {
+            const event: TicketEvent = JSON.parse(message.data);
+            if (event.event_id !== undefined) lastEventId = event.event_id;
+            onEvent(event);
+        };
+        socket.onclose = () => {
+            if (!closed) setTimeout(connect, 3000);
+        };
+    };
+    connect();
+
+    return () => {
+        closed = true;
+        socket?.close();
+    };
+}
+
 async function downloadTicketZip(
     ticketId: string,
     userId?: string | undefined,
@@ -98,10 +152,12 @@ async function downloadTicketZip(
 
 export {
     getTicketList,
+    getTicketPage,
     uploadTicket,
     modifyTicket,
     deleteTicket,
     getTicketInfo,
     getTicketFileContent,
+    subscribeTicketEvents,
     downloadTicketZip,
 };
@@ -6,6 +6,20 @@ export default interface TicketData {
     public: boolean,
 };
 
+export interface TicketPage {
+    tickets: Array<TicketData>,
+    next_cursor: string | null,
+};
+
 export interface TicketUpdate {
     public?: boolean
 };
+
+export interface TicketEvent {
+    event_id?: number,
+    type: "created" | "modified" | "deleted" | "reset",
+    author_id?: string,
+    ticket_id?: string,
+    ticket?: TicketData | null,
+    public?: boolean,
+};
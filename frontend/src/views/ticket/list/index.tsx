@@ -13,9 +13,10 @@ import {
 } from "react-router-dom";
 
 import FastAPIError from "schemas/error";
+import TicketData from "schemas/ticket";
 import UserData from "schemas/user";
 
-import { getTicketList } from "api/ticket";
+import { getTicketPage, subscribeTicketEvents } from "api/ticket";
 import { getUserInfo } from "api/user";
 
 import dataContext from "context/data";
@@ -33,7 +34,9 @@ export default function ListPgae(): ReactElement {
     const { userId } = useParams();
     const pathUserId = parseInt(userId || "") ? userId : undefined;
 
-    const [ticketList, setTicketList] = useState<Array<string> | undefined>();
+    const [ticketList, setTicketList] = useState<Array<TicketData> | undefined>();
+    const [nextCursor, setNextCursor] = useState<string | undefined>();
+    const [loadingMore, setLoadingMore] = useState<boolean>(false);
     const [reverse, setReverse] = useState<boolean>(false);
     const [refreshButton, setRefreshButton] = useState<boolean>(false);
     const [displayUser, setDisplayUser] = useState<UserData | undefined>(undefined);
@@ -52,11 +55,36 @@ export default function ListPgae(): ReactElement {
 
     const setNavigate = useNavigate();
 
+    const order = reverse ? "asc" : "desc";
+
     const refreshList = useCallback((ticketId?: string) => {
         if (ticketId === undefined) setTicketList(undefined);
-        else setTicketList(v => v?.filter(t => t !== ticketId));
+        else setTicketList(v => v?.filter(t => t.ticket_id !== ticketId));
     }, [setTicketList]);
 
+    const listError = useCallback((error: AxiosError) => {
+        if (error.response && addMessageBox) {
+            const data: FastAPIError = error.response.data as FastAPIError;
+            addMessageBox({
+                level: "ERROR",
+                context: `Get ticket list failed, detail: ${data.detail}`
+            });
+        }
+    }, [addMessageBox]);
+
+    // Tickets come a page at a time with their data, not one request each
+    const loadMore = useCallback(() => {
+        if (nextCursor === undefined || loadingMore) return;
+        setLoadingMore(true);
+        getTicketPage(pathUserId, nextCursor, order).then(page => {
+            setTicketList(v => v && [
+                ...v,
+                ...page.tickets.filter(t => !v.some(o => o.ticket_id === t.ticket_id))
+            ]);
+            setNextCursor(page.next_cursor ?? undefined);
+        }).catch(listError).finally(() => setLoadingMore(false));
+    }, [nextCursor, loadingMore, pathUserId, order, listError]);
+
     const openEdit = useCallback((ticketId: string, isPublic: boolean) => {
         setEditTicket({ ticketId: ticketId, isPublic: isPublic });
         setLastEdit(ticketId);
@@ -83,19 +111,36 @@ export default function ListPgae(): ReactElement {
                 setDisplayUser(undefined);
             }
 
-            getTicketList(pathUserId).then(
-                v => setTicketList(v)
-            ).catch((error: AxiosError) => {
-                if (error.response && addMessageBox) {
-                    const data: FastAPIError = error.response.data as FastAPIError;
-                    addMessageBox({
-                        level: "ERROR",
-                        context: `Get ticket list failed, detail: ${data.detail}`
-                    });
-                }
-            });
+            getTicketPage(pathUserId, undefined, order).then(page => {
+                setTicketList(page.tickets);
+                setNextCursor(page.next_cursor ?? undefined);
+            }).catch(listError);
         };
-    }, [ticketList, addMessageBox, pathUserId, userData, setNavigate]);
+    }, [ticketList, listError, pathUserId, userData, setNavigate, order]);
+
+    // Keep list up to date by ticket events instead of reloading
+    useEffect(() => {
+        if (userData === undefined) return;
+        const authorId = pathUserId || userData?.id;
+        return subscribeTicketEvents((event) => {
+            if (event.type === "reset") {
+                setTicketList(undefined);
+                return;
+            }
+            const ticketId = event.ticket_id;
+            if (ticketId === undefined) return;
+            const ticket = event.ticket;
+            if (event.type === "created" && ticket) {
+                setTicketList(v => v === undefined || v.some(t => t.ticket_id === ticketId) ? v : [...v, ticket]);
+            }
+            else if (event.type === "modified" && ticket) {
+                setTicketList(v => v?.map(t => t.ticket_id === ticketId ? ticket : t));
+            }
+            else if (event.type === "deleted") {
+                setTicketList(v => v?.filter(t => t.ticket_id !== ticketId));
+            }
+        }, authorId);
+    }, [pathUserId, userData]);
 
     useEffect(() => {
         if (refreshButton) setTimeout(
@@ -114,7 +159,7 @@ export default function ListPgae(): ReactElement {
         }
         let newTicketList = Array.from(ticketList);
         newTicketList.sort((a, b) => {
-            return (ticket2num(b) - ticket2num(a)) * (reverse ? -1 : 1);
+            return (ticket2num(b.ticket_id) - ticket2num(a.ticket_id)) * (reverse ? -1 : 1);
         })
         return newTicketList;
     }, [ticketList, reverse]);
@@ -125,7 +170,11 @@ export default function ListPgae(): ReactElement {
             <EditBox isPublic={editTicket.isPublic} ticketId={editTicket.ticketId} close={closeEdit}/>
             <div className="content">
                 <div className="toolBar">
-                    <button className="sort" onClick={() => setReverse(v => !v)}>
+                    <button className="sort" onClick={() => {
+                        // Other end of list is on other pages, start over
+                        setReverse(v => !v);
+                        setTicketList(undefined);
+                    }}>
                         <span>Time</span>
                         <span className="ms-o" data-sort={reverse}>sort</span>
                     </button>
@@ -141,17 +190,24 @@ export default function ListPgae(): ReactElement {
                 {
                     sortedList === undefined ? <SmallLoading /> : (
                         sortedList.length === 0 ? <NotFound /> : sortedList.map(
-                            (v, i) => <InfoBox
-                                key={i}
-                                ticketId={v}
+                            v => <InfoBox
+                                key={v.ticket_id}
+                                ticket={v}
                                 userId={pathUserId}
                                 refreshList={refreshList}
                                 edit={openEdit}
-                                state={lastEdit === v}
+                                state={lastEdit === v.ticket_id}
                             />
                         )
                     )
                 }
+                {
+                    sortedList !== undefined && nextCursor !== undefined ? (
+                        <button className="more" disabled={loadingMore} onClick={loadMore}>
+                            {loadingMore ? "Loading..." : "Load more"}
+                        </button>
+                    ) : null
+                }
             </div>
         </div>
     );
@@ -2,7 +2,6 @@ import {
     ReactElement,
     useCallback,
     useContext,
-    useEffect,
     useMemo,
     useState,
 } from "react";
@@ -12,20 +11,18 @@ import {
 
 import TicketData from "schemas/ticket";
 
-import { deleteTicket, getTicketInfo } from "api/ticket";
+import { deleteTicket } from "api/ticket";
 
 import dataContext from "context/data";
 import functionContext from "context/function";
 
-import SmallLoading from "component/smallLoading";
-
 import UTCTimestamp2String from "utils/cvtTime";
 
 import "./index.scss";
 
 
 type propsType = Readonly<{
-    ticketId: string,
+    ticket: TicketData,
     userId?: string
     refreshList: (ticketId?: string) => void,
     edit: (ticketId: string, isPublic: boolean) => void,
@@ -34,7 +31,7 @@ type propsType = Readonly<{
 
 export default function InfoBox(props: propsType): ReactElement {
     const {
-        ticketId,
+        ticket,
         userId,
         refreshList,
         edit,
@@ -48,7 +45,8 @@ export default function InfoBox(props: propsType): ReactElement {
     } = useContext(functionContext);
 
     const [open, setOpen] = useState<boolean>(state ?? false);
-    const [ticketConfig, setTicketConfig] = useState<TicketData | undefined>();
+
+    const ticketId = ticket.ticket_id;
 
     const pathUserId = userId === undefined ? userData?.id : userId;
 
@@ -69,13 +67,6 @@ export default function InfoBox(props: propsType): ReactElement {
         return userId === undefined || userId === userData?.id;
     }, [userId, userData?.id]);
 
-    const updateConfig = useCallback(() => {
-        getTicketInfo(
-            ticketId,
-            userId
-        ).then(setTicketConfig)
-    }, [ticketId, userId]);
-
     const deleteTicketButton = useCallback(() => {
         if (!isSelf) return;
         if (setLoading) setLoading(true);
@@ -98,15 +89,6 @@ export default function InfoBox(props: propsType): ReactElement {
         })
     }, [isSelf, ticketId, addMessageBox, setLoading, refreshList]);
 
-    useEffect(() => {
-        setTicketConfig(undefined);
-    }, [ticketId, userId]);
-
-    useEffect(() => {
-        if (!open || ticketConfig !== undefined) return;
-        updateConfig()
-    }, [open, ticketConfig, updateConfig]);
-
     return (
         <div className="infoBox" data-open={open} data-self={isSelf}>
             <div className="preview">
@@ -114,22 +96,20 @@ export default function InfoBox(props: propsType): ReactElement {
                 <button className="ms-o" onClick={() => setOpen(v => !v)}>expand_more</button>
             </div>
             <div className="content">
-                {
-                    ticketConfig === undefined ? <SmallLoading /> : <div className="data">
-                        <div className="column">
-                            <div className="key">Create at</div>
-                            <div className="value">{UTCTimestamp2String(ticketConfig.create_utc_timestamp)}</div>
-                        </div>
-                        <div className="column">
-                            <div className="key">Access Control</div>
-                            <div className="value">{ticketConfig.public ? "Public" : "Private"}</div>
-                        </div>
-                        <div className="buttonBar">
-                            <button className="edit ani-btn" disabled={!isSelf} onClick={() => edit(ticketId, ticketConfig.public)}>Edit</button>
-                            <button className="delete ani-btn" disabled={!isSelf} onClick={deleteTicketButton}>Delete</button>
-                        </div>
+                <div className="data">
+                    <div className="column">
+                        <div className="key">Create at</div>
+                        <div className="value">{UTCTimestamp2String(ticket.create_utc_timestamp)}</div>
+                    </div>
+                    <div className="column">
+                        <div className="key">Access Control</div>
+                        <div className="value">{ticket.public ? "Public" : "Private"}</div>
+                    </div>
+                    <div className="buttonBar">
+                        <button className="edit ani-btn" disabled={!isSelf} onClick={() => edit(ticketId, ticket.public)}>Edit</button>
+                        <button className="delete ani-btn" disabled={!isSelf} onClick={deleteTicketButton}>Delete</button>
                     </div>
-                }
+                </div>
             </div>
         </div>
     );